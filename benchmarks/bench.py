@@ -0,0 +1,450 @@
+"""
+Benchmark suite for the adaptive loop hot paths.
+
+Run from project root:
+    python benchmarks/bench.py run --out benchmarks/baseline.json
+    python benchmarks/bench.py compare benchmarks/baseline.json --threshold 0.25
+    python benchmarks/bench.py imports --budget-ms 50
+
+`run` times every registered benchmark and writes per-call seconds as JSON.
+`compare` runs the suite again (or loads --current) and exits with status 1
+if any benchmark got slower than the baseline by more than the threshold.
+`imports` measures `python -X importtime` for the rule-based core and fails if
+it exceeds the budget or pulls in a heavy dependency.
+`export` measures throughput and peak traced memory of exporting many sessions,
+streamed into a zip bundle versus built in memory first:
+    python benchmarks/bench.py export --sessions 300 --attempts 200
+"""
+
+import argparse
+import fnmatch
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import zipfile
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, SRC)
+
+import joblib
+import numpy
+from sklearn.tree import DecisionTreeClassifier
+
+import adaptive_engine
+import export
+import train_model
+from adaptive_engine import LEVELS, next_level, next_level_rule
+from ml_engine import MLEngine
+from puzzle_generator import PuzzleBank, generate_puzzle, generate_puzzles
+from scheduler import ItemBank, PuzzleScheduler
+from tracker import Tracker
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Register a benchmark. The decorated function does the setup and returns
+    the zero-argument callable to time.
+    """
+    def deco(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return deco
+
+
+def _filled_tracker(n, seed=0):
+    rnd = random.Random(seed)
+    t = Tracker()
+    t.start_session("bench")
+    for _ in range(n):
+        p = generate_puzzle(rnd.choice(LEVELS))
+        t.record_attempt(p, "0", rnd.random() < 0.7, rnd.uniform(1, 30))
+    return t
+
+
+_engine = None
+
+
+def _ml_engine():
+    # small tree trained once per run, saved to a temp dir so it loads like a real model
+    global _engine
+    if _engine is None:
+        X, y = train_model.generate_dataset(num_sessions=500, seed=0)
+        path = os.path.join(tempfile.mkdtemp(prefix="bench_model_"), "adaptive_tree.pkl")
+        joblib.dump(DecisionTreeClassifier(max_depth=6, random_state=0).fit(X.to_numpy(), y), path)
+        _engine = MLEngine(model_path=path, meta_path=path + ".meta")
+    return _engine
+
+
+# ---- micro benchmarks ----
+
+for _level in LEVELS:
+    benchmark(f"puzzle.generate_puzzle[{_level}]")(
+        lambda level=_level: (lambda: generate_puzzle(level)))
+
+
+@benchmark("puzzle.generate_puzzles[hard,1000]")
+def _():
+    rng = numpy.random.default_rng(0)
+    return lambda: generate_puzzles('hard', 1000, rng)
+
+
+@benchmark("puzzle.bank_pop[hard]")
+def _():
+    bank = PuzzleBank(rng=0)
+    return lambda: bank.pop('hard')
+
+
+# pop + record on banks of ~10k / 100k / 500k distinct puzzles, after `history`
+# answers; per-call time should stay flat as both grow
+def _scheduler_step(bank_range, history):
+    bank = ItemBank({'bench': {'ops': ['+', '-', '*', '/'], 'range': (1, bank_range)}})
+    sched = PuzzleScheduler(rng=0, bank=bank)
+    rnd = random.Random(0)
+
+    def step():
+        p = sched.pop('bench')
+        sched.record(p, rnd.random() < 0.7, rnd.uniform(1, 30))
+    for _ in range(history):
+        step()
+    return step
+
+
+for _label, _range in (('10k', 50), ('100k', 158), ('500k', 354)):
+    for _history in (100, 20000):
+        benchmark(f"scheduler.pop_record[{_label},history={_history}]")(
+            lambda r=_range, h=_history: _scheduler_step(r, h))
+
+
+@benchmark("tracker.record_attempt")
+def _():
+    t = Tracker()
+    t.start_session("bench")
+    p = generate_puzzle('easy')
+    return lambda: t.record_attempt(p, "1", True, 4.2)
+
+
+@benchmark("tracker.accuracy")
+def _():
+    t = _filled_tracker(100)
+    return t.accuracy
+
+
+@benchmark("tracker.last_n")
+def _():
+    t = _filled_tracker(100)
+    return lambda: t.last_n(3)
+
+
+@benchmark("tracker.summary_view[10000]")
+def _():
+    t = _filled_tracker(10000)
+    return t.summary_view
+
+
+@benchmark("adaptive.next_level_rule")
+def _():
+    t = _filled_tracker(100)
+    return lambda: next_level_rule(t, 'medium', window_size=3)
+
+
+@benchmark("ml.features_from_tracker")
+def _():
+    t = _filled_tracker(100)
+    engine = _ml_engine()
+    return lambda: engine.features_from_tracker(t, 'medium', window_size=3)
+
+
+@benchmark("ml.predict_action")
+def _():
+    t = _filled_tracker(100)
+    engine = _ml_engine()
+    return lambda: engine.predict_action(t, 'medium', window_size=3)
+
+
+@benchmark("train.generate_dataset[2000]")
+def _():
+    return lambda: train_model.generate_dataset(num_sessions=2000, seed=0)
+
+
+@benchmark("tracker.to_dataframe[1000]")
+def _():
+    t = _filled_tracker(1000)
+    return t.to_dataframe
+
+
+def _export_naive(tracker):
+    # what the app did before streaming exports: DataFrame -> CSV, plus the summary with every attempt
+    return tracker.to_dataframe().to_csv(index=False).encode('utf-8'), json.dumps(tracker.get_summary(), indent=2)
+
+
+@benchmark("export.naive[1000]")
+def _():
+    t = _filled_tracker(1000)
+    return lambda: _export_naive(t)
+
+
+@benchmark("export.csv_bytes[1000]")
+def _():
+    t = _filled_tracker(1000)
+    return lambda: export.csv_bytes(t)
+
+
+@benchmark("export.jsonl_gz[1000]")
+def _():
+    t = _filled_tracker(1000)
+    return lambda: export.write_jsonl_gz(t, io.BytesIO())
+
+
+# ---- macro benchmarks: a whole session through the adaptive loop ----
+
+def _session(length, use_ml):
+    rnd = random.Random(length)
+    t = Tracker()
+    t.start_session("bench")
+    level = 'easy'
+    for _ in range(length):
+        p = generate_puzzle(level)
+        t.record_attempt(p, "0", rnd.random() < 0.7, rnd.uniform(1, 30))
+        level, _ = next_level(t, level, window_size=3, use_ml=use_ml)
+
+
+def _ml_session(length):
+    adaptive_engine._ml_engine = _ml_engine()
+    return lambda: _session(length, True)
+
+
+for _length in (10, 100, 10000):
+    benchmark(f"session.rule[{_length}]")(
+        lambda length=_length: (lambda: _session(length, False)))
+# per-call sklearn predict makes a 10k ML session take seconds; 10k is covered by rule
+for _length in (10, 100):
+    benchmark(f"session.ml[{_length}]")(
+        lambda length=_length: _ml_session(length))
+
+
+# ---- import time ----
+
+CORE_MODULES = ['puzzle_generator', 'tracker', 'adaptive_engine']
+HEAVY_MODULES = ['numpy', 'pandas', 'sklearn', 'joblib', 'scipy']
+
+
+def measure_import_time(modules=CORE_MODULES, runs=5):
+    """
+    Import `modules` in a fresh interpreter with -X importtime.
+    Returns {'ms': best cumulative import time, 'heavy': heavy modules that got imported}.
+    """
+    code = f"import {', '.join(modules)}"
+    best, heavy = None, set()
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                              cwd=SRC, capture_output=True, text=True, check=True)
+        total = 0
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if not cumulative.strip().isdigit():
+                continue  # header line
+            top = name.strip().split('.')[0]
+            if top in HEAVY_MODULES:
+                heavy.add(top)
+            if not name.startswith("  "):  # top-level imports only, nested ones are in their cumulative
+                total += int(cumulative)
+        best = total if best is None else min(best, total)
+    return {'ms': best / 1000.0, 'heavy': sorted(heavy)}
+
+
+# ---- export throughput and memory ----
+
+def _synthetic_sessions(n_sessions, n_attempts):
+    # (name, Tracker) built on demand, so the source itself holds one session at a time
+    for i in range(n_sessions):
+        rnd = random.Random(i)
+        t = Tracker()
+        t.start_session(f"learner{i}")
+        for j in range(n_attempts):
+            a, b = rnd.randint(1, 150), rnd.randint(1, 150)
+            t.restore_attempt({'timestamp': 1.7e9 + j, 'question_id': f"hard_{rnd.getrandbits(32)}",
+                               'question': f"{a} + {b} = ?", 'level': rnd.choice(LEVELS),
+                               'correct': rnd.random() < 0.7, 'given_answer': str(a + b),
+                               'correct_answer': a + b, 'response_time': rnd.uniform(1, 30)})
+        yield f"session_{i:05d}", t
+
+
+def _bundle_in_memory(sessions, path):
+    # every session serialized up front, then zipped
+    files = [(name, _export_naive(t)) for name, t in sessions]
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, (csv_data, summary) in files:
+            zf.writestr(f"{name}.csv", csv_data)
+            zf.writestr(f"{name}_summary.json", summary)
+
+
+def measure_export(n_sessions=300, n_attempts=200, formats=('csv',)):
+    """
+    {mode: {'seconds', 'rows_per_s', 'peak_mb'}} for a zip of n_sessions sessions,
+    streamed with export.write_bundle versus built in memory. Peak memory is traced
+    in a second run so tracing does not skew the timings.
+    """
+    modes = {
+        'streamed': lambda path: export.write_bundle(_synthetic_sessions(n_sessions, n_attempts), path, formats),
+        'in_memory': lambda path: _bundle_in_memory(_synthetic_sessions(n_sessions, n_attempts), path),
+    }
+    out = {}
+    with tempfile.TemporaryDirectory(prefix="bench_export_") as tmp:
+        for mode, fn in modes.items():
+            path = os.path.join(tmp, f"{mode}.zip")
+            start = time.perf_counter()
+            fn(path)
+            seconds = time.perf_counter() - start
+            tracemalloc.start()
+            fn(path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            out[mode] = {'seconds': seconds, 'rows_per_s': n_sessions * n_attempts / seconds,
+                         'peak_mb': peak / 1e6, 'zip_mb': os.path.getsize(path) / 1e6}
+    return out
+
+
+# ---- runner ----
+
+def time_callable(fn, repeat=5, min_time=0.2):
+    """Return per-call seconds {'min', 'median', 'number'} for fn."""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    runs = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {'min': min(runs), 'median': statistics.median(runs), 'number': number}
+
+
+def run_benchmarks(pattern="*", repeat=5, verbose=True):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        results[name] = time_callable(setup(), repeat=repeat)
+        if verbose:
+            print(f"{name:40s} {results[name]['median'] * 1e6:12.2f} us/call")
+    return {
+        'created_at': time.time(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': results
+    }
+
+
+def compare_results(baseline, current, threshold=0.25, overrides=None):
+    """
+    Compare median per-call times. Returns a list of
+    (name, baseline_s, current_s, ratio, regressed) for benchmarks present in both.
+    A benchmark regresses when current > baseline * (1 + threshold); overrides
+    maps benchmark names to their own threshold.
+    """
+    overrides = overrides or {}
+    rows = []
+    for name, base in baseline['results'].items():
+        cur = current['results'].get(name)
+        if cur is None:
+            continue
+        ratio = cur['median'] / base['median'] if base['median'] > 0 else float('inf')
+        limit = 1.0 + overrides.get(name, threshold)
+        rows.append((name, base['median'], cur['median'], ratio, ratio > limit))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p_run = sub.add_parser('run', help="run the suite and write results as JSON")
+    p_run.add_argument('--out', default=None, help="output JSON path (default: print)")
+    p_run.add_argument('--filter', default='*', help="glob on benchmark names")
+    p_run.add_argument('--repeat', type=int, default=5)
+
+    p_cmp = sub.add_parser('compare', help="fail if a benchmark regressed past the threshold")
+    p_cmp.add_argument('baseline')
+    p_cmp.add_argument('--current', default=None, help="results JSON to compare (default: run now)")
+    p_cmp.add_argument('--filter', default='*')
+    p_cmp.add_argument('--repeat', type=int, default=5)
+    p_cmp.add_argument('--threshold', type=float, default=0.25,
+                       help="allowed slowdown as a fraction (0.25 = 25%%)")
+    p_cmp.add_argument('--threshold-for', action='append', default=[], metavar='NAME=FRACTION',
+                       help="per-benchmark threshold override, repeatable")
+
+    p_imp = sub.add_parser('imports', help="check the import-time budget of the rule-based core")
+    p_imp.add_argument('--budget-ms', type=float, default=50.0)
+    p_imp.add_argument('--runs', type=int, default=5)
+
+    p_exp = sub.add_parser('export', help="throughput and peak memory of multi-session exports")
+    p_exp.add_argument('--sessions', type=int, default=300)
+    p_exp.add_argument('--attempts', type=int, default=200)
+    p_exp.add_argument('--formats', nargs='+', default=['csv'], choices=export.FORMATS)
+
+    sub.add_parser('list', help="list benchmark names")
+    args = parser.parse_args(argv)
+
+    if args.cmd == 'imports':
+        res = measure_import_time(runs=args.runs)
+        print(f"import {', '.join(CORE_MODULES)}: {res['ms']:.1f} ms (budget {args.budget_ms:.1f} ms)")
+        if res['heavy']:
+            print("heavy modules imported:", ", ".join(res['heavy']))
+        return 0 if res['ms'] <= args.budget_ms and not res['heavy'] else 1
+
+    if args.cmd == 'export':
+        res = measure_export(args.sessions, args.attempts, args.formats)
+        for mode, r in res.items():
+            print(f"{mode:10s} {r['seconds']:7.2f} s  {r['rows_per_s']:10.0f} rows/s  "
+                  f"peak {r['peak_mb']:7.1f} MB  zip {r['zip_mb']:6.1f} MB")
+        return 0
+
+    if args.cmd == 'list':
+        for name in BENCHMARKS:
+            print(name)
+        return 0
+
+    if args.cmd == 'run':
+        report = run_benchmarks(args.filter, args.repeat)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(report, f, indent=2)
+            print("Saved results to", args.out)
+        else:
+            print(json.dumps(report, indent=2))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run_benchmarks(args.filter, args.repeat, verbose=False)
+    overrides = {}
+    for item in args.threshold_for:
+        name, _, value = item.rpartition('=')
+        overrides[name] = float(value)
+
+    rows = compare_results(baseline, current, args.threshold, overrides)
+    failed = 0
+    for name, base, cur, ratio, regressed in rows:
+        flag = "REGRESSED" if regressed else "ok"
+        failed += regressed
+        print(f"{name:40s} {base * 1e6:12.2f} -> {cur * 1e6:12.2f} us  x{ratio:5.2f}  {flag}")
+    print(f"{failed} of {len(rows)} benchmarks regressed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
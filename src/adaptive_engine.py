@@ -1,22 +1,31 @@
 """
 Adaptive engine with both rule-based and ML-backed decision.
-This module tries to import MLEngine robustly (ml_engine or src.ml_engine).
+MLEngine is imported lazily the first time ML mode is used (ml_engine or
+src.ml_engine), so the rule path only needs the standard library.
 If ML engine cannot be imported or model file missing, it falls back to rules.
+Every decision is counted in METRICS under decisions_total{path=ml|rule|fallback},
+with the reason for each fallback.
 """
 
+import importlib
+
 try:
-    from ml_engine import MLEngine
-except Exception:
-    try:
-        from src.ml_engine import MLEngine
-    except Exception:
-        MLEngine = None
+    from metrics import METRICS, timed
+except ImportError:
+    from src.metrics import METRICS, timed
+
+# resolved by _import_ml_engine(); False once an import attempt has failed
+MLEngine = None
 
 LEVELS = ['easy', 'medium', 'hard']
 
 FAST_THRESH = {'easy': 8.0, 'medium': 12.0, 'hard': 20.0}
 SLOW_THRESH = {'easy': 15.0, 'medium': 20.0, 'hard': 30.0}
 
+_RULE_DECISION = METRICS.key('decisions_total', path='rule', reason='rule_mode')
+_ML_DECISION = METRICS.key('decisions_total', path='ml', reason='model')
+_ML_UNAVAILABLE = METRICS.key('decisions_total', path='fallback', reason='ml_unavailable')
+
 
 def increase(level):
     idx = LEVELS.index(level)
@@ -28,6 +37,36 @@ def decrease(level):
     return LEVELS[max(idx - 1, 0)]
 
 
+# (fast, slow, table) built from the thresholds it was compiled for
+_rule_cache = None
+
+
+def _rule_table():
+    """
+    Rule decisions compiled per (level, count, num_correct): the accuracy tests
+    are resolved once, leaving two avg_time comparisons per call. Rebuilt
+    whenever FAST_THRESH / SLOW_THRESH change.
+    """
+    global _rule_cache
+    cache = _rule_cache
+    if cache is None or cache[0] != FAST_THRESH or cache[1] != SLOW_THRESH:
+        cache = _rule_cache = (dict(FAST_THRESH), dict(SLOW_THRESH), {})
+    return cache[2]
+
+
+def _rule_entry(table, current_level, count, num_correct):
+    key = (current_level, count, num_correct)
+    entry = table.get(key)
+    if entry is None:
+        acc = num_correct / count
+        high, low = acc >= 0.8, acc <= 0.5
+        # action for each (avg_time <= fast, avg_time >= slow) outcome, indexed 2*fast_ok + too_slow
+        actions = tuple(1 if high and fast_ok else (-1 if low or too_slow else 0)
+                        for fast_ok in (False, True) for too_slow in (False, True))
+        entry = table[key] = (FAST_THRESH[current_level], SLOW_THRESH[current_level], acc, actions)
+    return entry
+
+
 def next_level_rule(tracker, current_level, window_size=3):
     """
     Rule-based adaptive decision:
@@ -36,12 +75,66 @@ def next_level_rule(tracker, current_level, window_size=3):
     - Otherwise stay
     Returns: (next_level, reason_str)
     """
-    window = tracker.last_n(window_size)
-    if not window:
+    count, num_correct, rt_sum, _ = tracker.window_stats(window_size)
+    if not count:
         return current_level, "no data yet (rule)"
 
-    acc = sum(1 for a in window if a['correct']) / len(window)
-    avg_time = sum(a['response_time'] for a in window) / len(window)
+    return _rule_result(current_level, _rule_entry(_rule_table(), current_level, count, num_correct),
+                        rt_sum / count)
+
+
+def _rule_result(current_level, entry, avg_time):
+    fast, slow, acc, actions = entry
+    action = actions[2 * (avg_time <= fast) + (avg_time >= slow)]
+    if action == 1:
+        return increase(current_level), f"Promote (rule): acc={acc:.2f}, time={avg_time:.1f}s"
+    if action == -1:
+        return decrease(current_level), f"Demote (rule): acc={acc:.2f}, time={avg_time:.1f}s"
+    return current_level, f"Stay (rule): acc={acc:.2f}, time={avg_time:.1f}s"
+
+
+def prepare_rule_decision(tracker, current_level, window_size=3):
+    """
+    Rule inputs for the answer the learner has not given yet: the window's
+    count, the response times of its other attempts and the rule table entry,
+    for a correct and for an incorrect answer. decide_prepared() finishes the
+    decision from the answer alone, without going back to the tracker.
+    """
+    if window_size > 1:
+        count, num_correct, rt_sum, _ = tracker.window_stats(window_size - 1)
+    else:
+        count, num_correct, rt_sum = 0, 0, 0
+    table = _rule_table()
+    return {
+        'attempts': len(tracker.attempts), 'level': current_level, 'window_size': window_size,
+        'table': table, 'count': count + 1, 'rt_sum': rt_sum,
+        True: _rule_entry(table, current_level, count + 1, num_correct + 1),
+        False: _rule_entry(table, current_level, count + 1, num_correct),
+    }
+
+
+def decide_prepared(prepared, tracker, current_level, window_size, correct, response_time):
+    """
+    next_level_rule for the attempt just recorded, from prepare_rule_decision's
+    inputs; None if they are stale (another attempt, level, window or thresholds).
+    """
+    if (prepared['attempts'] + 1 != len(tracker.attempts) or prepared['level'] != current_level
+            or prepared['window_size'] != window_size or prepared['table'] is not _rule_table()):
+        return None
+    METRICS.add(_RULE_DECISION)
+    # summed in window order, like Tracker.window_stats
+    return _rule_result(current_level, prepared[bool(correct)],
+                        (prepared['rt_sum'] + float(response_time)) / prepared['count'])
+
+
+def next_level_rule_reference(tracker, current_level, window_size=3):
+    """The rule as plain comparisons; next_level_rule is checked against it."""
+    count, num_correct, rt_sum, _ = tracker.window_stats(window_size)
+    if not count:
+        return current_level, "no data yet (rule)"
+
+    acc = num_correct / count
+    avg_time = rt_sum / count
 
     if acc >= 0.8 and avg_time <= FAST_THRESH[current_level]:
         return increase(current_level), f"Promote (rule): acc={acc:.2f}, time={avg_time:.1f}s"
@@ -50,10 +143,69 @@ def next_level_rule(tracker, current_level, window_size=3):
     return current_level, f"Stay (rule): acc={acc:.2f}, time={avg_time:.1f}s"
 
 
-# Global ML engine instance (lazy-loaded)
+# Global ML engine instance (lazy-loaded); its model comes from the shared
+# model registry, so a retrained model file is picked up on the next call.
 _ml_engine = None
 
 
+def _import_ml_engine():
+    """Import and return the MLEngine class, or None if ml_engine is unavailable."""
+    global MLEngine
+    if MLEngine is None:
+        # prefer the module path this package itself was imported under
+        names = ('src.ml_engine', 'ml_engine') if __name__.startswith('src.') else ('ml_engine', 'src.ml_engine')
+        MLEngine = False
+        for name in names:
+            try:
+                MLEngine = importlib.import_module(name).MLEngine
+                break
+            except Exception:
+                continue
+    return MLEngine or None
+
+
+def _get_ml_engine():
+    """Return the shared MLEngine if it has a model loaded, else None."""
+    global _ml_engine
+    if _ml_engine is None:
+        engine_cls = _import_ml_engine()
+        if engine_cls is None:
+            return None
+        try:
+            _ml_engine = engine_cls()
+        except Exception:
+            _ml_engine = None
+    if _ml_engine and getattr(_ml_engine, "model", None) is not None:
+        return _ml_engine
+    return None
+
+
+def warm_ml_engine(window_sizes=(3,)):
+    """
+    Load the shared ML engine and its model, and compile its decision tables
+    for window_sizes, ahead of the first ML decision. Returns True if a model is ready.
+    """
+    engine = _get_ml_engine()
+    if engine is None:
+        return False
+    warm = getattr(engine, 'warm', None)
+    return warm(window_sizes) if warm is not None else True
+
+
+def candidate_levels(current_level):
+    """Levels next_level can return from current_level: demote, stay, promote."""
+    return [decrease(current_level), current_level, increase(current_level)]
+
+
+def _apply_ml_action(pred, current_level, info):
+    if pred == 1:
+        return increase(current_level), f"Promote (ML) — importance={info.get('importance')}"
+    if pred == -1:
+        return decrease(current_level), f"Demote (ML) — importance={info.get('importance')}"
+    return current_level, f"Stay (ML) — importance={info.get('importance')}"
+
+
+@timed('engine.next_level', profile=True)
 def next_level(tracker, current_level, window_size=3, use_ml=False):
     """
     Unified API to get next difficulty level.
@@ -61,26 +213,44 @@ def next_level(tracker, current_level, window_size=3, use_ml=False):
     Fall back to rule-based decision if model unavailable or on error.
     Returns: (next_level, reason)
     """
-    global _ml_engine
+    if not use_ml:
+        METRICS.add(_RULE_DECISION)
+        return next_level_rule(tracker, current_level, window_size)
+    engine = _get_ml_engine()
+    if engine is None:
+        METRICS.add(_ML_UNAVAILABLE)
+        return next_level_rule(tracker, current_level, window_size)
+    try:
+        pred, info = engine.predict_action(tracker, current_level, window_size=window_size)
+    except Exception as e:
+        METRICS.record_error('ml.predict', e)
+        METRICS.incr('decisions_total', path='fallback', reason=type(e).__name__)
+        return next_level_rule(tracker, current_level, window_size)
+    METRICS.add(_ML_DECISION)
+    return _apply_ml_action(pred, current_level, info)
 
-    if use_ml and MLEngine is not None:
-        if _ml_engine is None:
-            try:
-                _ml_engine = MLEngine()
-            except Exception as e:
-                _ml_engine = None
 
-        if _ml_engine and getattr(_ml_engine, "model", None) is not None:
-            try:
-                pred, info = _ml_engine.predict_action(tracker, current_level, window_size=window_size)
-                if pred == 1:
-                    return increase(current_level), f"Promote (ML) — importance={info.get('importance')}"
-                if pred == -1:
-                    return decrease(current_level), f"Demote (ML) — importance={info.get('importance')}"
-                return current_level, f"Stay (ML) — importance={info.get('importance')}"
-            except Exception as e:
-                return next_level_rule(tracker, current_level, window_size)
-        else:
-            return next_level_rule(tracker, current_level, window_size)
-    else:
-        return next_level_rule(tracker, current_level, window_size)
+@timed('engine.next_level_batch')
+def next_level_batch(trackers, current_levels, window_size=3, use_ml=False):
+    """
+    Batched next_level for many learners.
+    With ML, builds one feature matrix and makes a single predict call;
+    every learner falls back to next_level_rule if the model is unavailable
+    or inference fails.
+    Returns: list of (next_level, reason), one per tracker
+    """
+    trackers = list(trackers)
+    current_levels = list(current_levels)
+    engine = _get_ml_engine() if use_ml else None
+    path, reason = ('rule', 'rule_mode') if not use_ml else ('fallback', 'ml_unavailable')
+    if engine is not None and trackers:
+        try:
+            preds, info = engine.predict_actions_batch(trackers, current_levels, window_size=window_size)
+            METRICS.add(_ML_DECISION, len(trackers))
+            return [_apply_ml_action(p, lvl, info) for p, lvl in zip(preds, current_levels)]
+        except Exception as e:
+            METRICS.record_error('ml.predict_batch', e)
+            reason = type(e).__name__
+    if trackers:
+        METRICS.incr('decisions_total', len(trackers), path=path, reason=reason)
+    return [next_level_rule(t, lvl, window_size) for t, lvl in zip(trackers, current_levels)]
@@ -0,0 +1,286 @@
+"""
+Columnar analytics store over saved sessions.
+
+`ingest` compacts data/session_*.csv files and session_summary*.json exports
+(Tracker.get_summary) into partitions of memory-mapped NumPy columns, one
+partition per ingestion run. A manifest records every source file by size and
+mtime, so re-running ingest only reads new or changed files; sessions already
+in the store (same first attempt and length) are not ingested twice.
+AnalyticsStore answers the daily aggregates from the mapped columns.
+
+Run from project root:
+    python src/analytics.py ingest --source data --store data/analytics
+    python src/analytics.py report --store data/analytics
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    from puzzle_generator import LEVEL_CONFIG, OPS
+except ImportError:
+    from src.puzzle_generator import LEVEL_CONFIG, OPS
+
+LEVELS = list(LEVEL_CONFIG)
+OP_CODES = list(OPS)
+MANIFEST = "manifest.json"
+COLUMNS = {
+    'session': np.int32,
+    'level': np.int8,
+    'op': np.int8,
+    'correct': np.bool_,
+    'response_time': np.float64,
+    'timestamp': np.float64,
+    # level change to the next attempt of the same session: -1/0/+1
+    'transition': np.int8,
+    'has_next': np.bool_,
+}
+
+
+def _parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes')
+    return bool(value)
+
+
+def _op_code(question):
+    parts = str(question).split()
+    if len(parts) >= 2 and parts[1] in OP_CODES:
+        return OP_CODES.index(parts[1])
+    return -1
+
+
+def _read_csv_attempts(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def _read_summary_attempts(path):
+    with open(path, encoding='utf-8') as f:
+        summary = json.load(f)
+    if not isinstance(summary, dict):
+        return []
+    return summary.get('attempts') or []
+
+
+def _fingerprint(attempts):
+    first = attempts[0]
+    return f"{first.get('question_id')}|{float(first.get('timestamp') or 0):.6f}|{len(attempts)}"
+
+
+def _session_columns(attempts, session_idx):
+    n = len(attempts)
+    level = np.array([LEVELS.index(a['level']) if a.get('level') in LEVELS else -1 for a in attempts],
+                     dtype=np.int8)
+    transition = np.zeros(n, dtype=np.int8)
+    has_next = np.zeros(n, dtype=np.bool_)
+    if n > 1:
+        transition[:-1] = np.sign(level[1:].astype(np.int16) - level[:-1])
+        has_next[:-1] = (level[1:] >= 0) & (level[:-1] >= 0)
+    return {
+        'session': np.full(n, session_idx, dtype=np.int32),
+        'level': level,
+        'op': np.array([_op_code(a.get('question', '')) for a in attempts], dtype=np.int8),
+        'correct': np.array([_parse_bool(a.get('correct')) for a in attempts], dtype=np.bool_),
+        'response_time': np.array([float(a.get('response_time') or 0.0) for a in attempts]),
+        'timestamp': np.array([float(a.get('timestamp') or 0.0) for a in attempts]),
+        'transition': transition,
+        'has_next': has_next,
+    }
+
+
+def _load_manifest(store_dir):
+    path = os.path.join(store_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'version': 1, 'sources': {}, 'fingerprints': [], 'partitions': [], 'num_sessions': 0}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_manifest(store_dir, manifest):
+    path = os.path.join(store_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+def find_sources(source_dir):
+    """Session CSVs and summary JSONs under source_dir, in a stable order."""
+    paths = glob.glob(os.path.join(source_dir, "session_*.csv"))
+    paths += glob.glob(os.path.join(source_dir, "session_summary*.json"))
+    return sorted(p for p in paths if os.path.isfile(p))
+
+
+def ingest(source_dir='data', store_dir=os.path.join('data', 'analytics')):
+    """
+    Ingest new or changed session files into a new partition.
+    Returns {'files': n_new_files, 'sessions': n_new_sessions, 'rows': n_new_rows, 'partition': name or None}.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = _load_manifest(store_dir)
+    fingerprints = set(manifest['fingerprints'])
+    session_idx = manifest['num_sessions']
+
+    new_sources = {}
+    parts = []
+    for path in find_sources(source_dir):
+        st = os.stat(path)
+        key = os.path.relpath(path, source_dir)
+        entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        known = manifest['sources'].get(key)
+        if known and known['size'] == entry['size'] and known['mtime_ns'] == entry['mtime_ns']:
+            continue
+        new_sources[key] = entry
+        try:
+            attempts = _read_csv_attempts(path) if path.endswith('.csv') else _read_summary_attempts(path)
+            if not attempts:
+                continue
+            fp = _fingerprint(attempts)
+            if fp in fingerprints:
+                continue
+            columns = _session_columns(attempts, session_idx)
+        except Exception as e:
+            # a malformed file (bad CSV, unparsable values, odd JSON) is recorded and skipped
+            entry['error'] = repr(e)
+            continue
+        fingerprints.add(fp)
+        parts.append(columns)
+        session_idx += 1
+
+    partition = None
+    rows = 0
+    if parts:
+        partition = f"part-{len(manifest['partitions']):06d}"
+        part_dir = os.path.join(store_dir, partition)
+        os.makedirs(part_dir, exist_ok=True)
+        for name, dtype in COLUMNS.items():
+            np.save(os.path.join(part_dir, f"{name}.npy"),
+                    np.concatenate([p[name] for p in parts]).astype(dtype, copy=False))
+        rows = sum(len(p['session']) for p in parts)
+        manifest['partitions'].append({'name': partition, 'rows': rows, 'sessions': len(parts),
+                                       'created_at': time.time()})
+
+    manifest['sources'].update(new_sources)
+    manifest['fingerprints'] = sorted(fingerprints)
+    manifest['num_sessions'] = session_idx
+    _write_manifest(store_dir, manifest)
+    return {'files': len(new_sources), 'sessions': len(parts), 'rows': rows, 'partition': partition}
+
+
+class AnalyticsStore:
+    def __init__(self, store_dir=os.path.join('data', 'analytics')):
+        self.store_dir = store_dir
+        self._columns = None
+        self._manifest_mtime = None
+
+    def _load(self):
+        path = os.path.join(self.store_dir, MANIFEST)
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        if self._columns is not None and mtime == self._manifest_mtime:
+            return self._columns
+        manifest = _load_manifest(self.store_dir)
+        columns = {}
+        for name, dtype in COLUMNS.items():
+            arrays = [np.load(os.path.join(self.store_dir, p['name'], f"{name}.npy"), mmap_mode='r')
+                      for p in manifest['partitions']]
+            # a single partition stays memory-mapped; several are stitched once and cached
+            if len(arrays) == 1:
+                columns[name] = arrays[0]
+            elif arrays:
+                columns[name] = np.concatenate(arrays)
+            else:
+                columns[name] = np.empty(0, dtype=dtype)
+        self._columns = columns
+        self._manifest_mtime = mtime
+        self._num_sessions = manifest['num_sessions']
+        return columns
+
+    @property
+    def num_sessions(self):
+        self._load()
+        return self._num_sessions
+
+    @property
+    def num_rows(self):
+        return len(self._load()['session'])
+
+    def columns(self):
+        """{column: array} of every attempt, grouped by session in attempt order."""
+        return dict(self._load())
+
+    def accuracy_by_level(self):
+        """{level: {'attempts': n, 'accuracy': fraction correct}}"""
+        c = self._load()
+        valid = c['level'] >= 0
+        level = c['level'][valid]
+        n = np.bincount(level, minlength=len(LEVELS))
+        k = np.bincount(level, weights=c['correct'][valid], minlength=len(LEVELS))
+        return {lvl: {'attempts': int(n[i]), 'accuracy': float(k[i] / n[i]) if n[i] else 0.0}
+                for i, lvl in enumerate(LEVELS)}
+
+    def rt_percentiles(self, by='op', q=(50, 90, 99)):
+        """Response-time percentiles grouped by 'op' or 'level': {key: {'p50': s, ...}}"""
+        c = self._load()
+        names = OP_CODES if by == 'op' else LEVELS
+        codes = c[by]
+        rt = c['response_time']
+        out = {}
+        for i, name in enumerate(names):
+            values = rt[codes == i]
+            if not len(values):
+                continue
+            out[name] = {f"p{p:g}": float(v) for p, v in zip(q, np.percentile(values, q))}
+            out[name]['n'] = int(len(values))
+        return out
+
+    def transition_rates(self):
+        """Share of attempts followed by a promote/stay/demote, per level."""
+        c = self._load()
+        mask = c['has_next']
+        level = c['level'][mask].astype(np.int64)
+        move = c['transition'][mask].astype(np.int64) + 1  # 0 demote, 1 stay, 2 promote
+        counts = np.bincount(level * 3 + move, minlength=3 * len(LEVELS)).reshape(len(LEVELS), 3)
+        out = {}
+        for i, lvl in enumerate(LEVELS):
+            total = int(counts[i].sum())
+            out[lvl] = {'n': total}
+            for j, name in enumerate(('demote', 'stay', 'promote')):
+                out[lvl][name] = float(counts[i, j] / total) if total else 0.0
+        return out
+
+    def report(self):
+        return {
+            'sessions': self.num_sessions,
+            'rows': self.num_rows,
+            'accuracy_by_level': self.accuracy_by_level(),
+            'rt_percentiles_by_op': self.rt_percentiles('op'),
+            'rt_percentiles_by_level': self.rt_percentiles('level'),
+            'transition_rates': self.transition_rates(),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_ing = sub.add_parser('ingest', help="compact new session files into the store")
+    p_ing.add_argument('--source', default='data')
+    p_ing.add_argument('--store', default=os.path.join('data', 'analytics'))
+    p_rep = sub.add_parser('report', help="print the daily aggregates as JSON")
+    p_rep.add_argument('--store', default=os.path.join('data', 'analytics'))
+    args = parser.parse_args(argv)
+
+    if args.cmd == 'ingest':
+        print(json.dumps(ingest(args.source, args.store)))
+    else:
+        print(json.dumps(AnalyticsStore(args.store).report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,19 +6,14 @@ Run from project root:
 """
 
 import streamlit as st
+import os
+import statistics
 import time
 import json
-import pandas as pd
 
-from puzzle_generator import generate_puzzle
-from tracker import Tracker
-
-from adaptive_engine import next_level
-
-try:
-    from ml_engine import MLEngine
-except Exception:
-    MLEngine = None
+from adaptive_engine import warm_ml_engine
+from service import get_service
+from metrics import METRICS
 
 from utils import timestamp_str
 
@@ -36,15 +31,26 @@ rounds = st.sidebar.number_input("Planned rounds", min_value=3, max_value=100, v
 window_size = st.sidebar.slider("Adaptive window (N)", min_value=1, max_value=6, value=3)
 enable_ml = st.sidebar.checkbox("Enable ML engine", value=False)
 consent_save = st.sidebar.checkbox("Consent to save anonymized session data", value=False)
+use_prefetch = st.sidebar.checkbox("Prefetch next puzzle", value=True)
+focus_weak = st.sidebar.checkbox("Focus on weak operations", value=False)
+show_debug = st.sidebar.checkbox("Show debug metrics", value=False)
 
 start_btn = st.sidebar.button("Start session")
 end_btn = st.sidebar.button("End session and export")
 
 if enable_ml:
     st.sidebar.markdown("### ML model info")
+    # imported here so rule-only sessions never load NumPy/joblib/sklearn
+    try:
+        from ml_engine import MLEngine
+    except Exception:
+        MLEngine = None
     if MLEngine is not None:
         try:
+            # cheap: the model itself is cached in the process-wide registry
             me = MLEngine()
+            # load the shared engine and compile its decision table now, not inside the first answer
+            warm_ml_engine((window_size,))
             if me.model is None:
                 st.sidebar.write("No model found. Run `python src/train_model.py` to create models/adaptive_tree.pkl")
             else:
@@ -55,18 +61,38 @@ if enable_ml:
                         st.sidebar.write(f"{n}: {v:.3f}")
                 else:
                     st.sidebar.write(f"Loaded model: {type(me.model).__name__}")
+                trained_window = me.trained_window_size(me.model)
+                if trained_window and trained_window != window_size:
+                    st.sidebar.caption(f"The model was trained on a window of {trained_window}; "
+                                       f"ML decisions use that window, not N={window_size}.")
+                model_stats = me.load_stats().get(me.model_path)
+                if model_stats:
+                    st.sidebar.caption(f"Model loads this process: {model_stats['load_count']} "
+                                       f"(last {model_stats['last_load_seconds']*1000:.1f} ms)")
         except Exception as e:
             st.sidebar.write("Error loading model:", e)
     else:
         st.sidebar.write("ML engine not available (ml_engine import failed)")
 
 if start_btn:
-    st.session_state.tracker = Tracker()
-    st.session_state.tracker.start_session(name)
+    # sessions live in the process-wide learner service; the app only keeps the session id
+    service = get_service()
+    if st.session_state.get('session_id') is not None:
+        try:
+            service.end_session(st.session_state.session_id)
+        except KeyError:
+            pass
+    # with consent, attempts are streamed to data/logs as they happen so an abandoned session is not lost
+    started = service.start_session(name, level=initial_level, window_size=window_size,
+                                     use_ml=enable_ml, save_log=consent_save, focus_weak=focus_weak)
+    st.session_state.session_id = started['session_id']
+    # submit -> next question render latency (s), split by prefetch on/off
+    st.session_state.submit_latency = {'prefetch': [], 'direct': []}
+    st.session_state.submit_ts = None
     st.session_state.current_level = initial_level
     st.session_state.rounds_left = int(rounds)
+    # attempts live only in the session's Tracker (shown through service.summary)
     st.session_state.initialized = True
-    st.session_state.history = []
     st.session_state.awaiting_answer = False
     st.session_state.user_name = name
     st.experimental_rerun()
@@ -80,47 +106,50 @@ col1, col2 = st.columns([2, 1])
 
 with col1:
     st.header("Problem")
+    service = get_service()
+    session_id = st.session_state.session_id
+    # idempotent: the same puzzle comes back until it is answered
+    try:
+        puzzle = service.next_puzzle(session_id)
+    except KeyError:
+        # evicted while idle; without consent to save data it was not written to disk
+        st.session_state.initialized = False
+        st.warning("This session expired while idle and was not saved. Start a new session.")
+        st.stop()
     if not st.session_state.get('awaiting_answer', False):
-        puzzle = generate_puzzle(level=st.session_state.current_level)
-        st.session_state.last_puzzle = puzzle
         st.session_state.awaiting_answer = True
         st.session_state.answer_start = time.time()
 
-    puzzle = st.session_state.last_puzzle
     st.markdown(f"**Level:** `{puzzle['level'].upper()}`")
     st.markdown(f"### {puzzle['question']}")
     user_answer = st.text_input("Your answer", key="answer_input")
     submit = st.button("Submit Answer")
 
+    if st.session_state.submit_ts is not None and not submit:
+        samples = st.session_state.submit_latency['prefetch' if use_prefetch else 'direct']
+        samples.append(time.perf_counter() - st.session_state.submit_ts)
+        del samples[:-100]
+        st.session_state.submit_ts = None
+
+    if use_prefetch and not submit:
+        # the question is already on screen; prepare the next one while the learner thinks
+        service.prefetch(session_id)
+
     if submit:
+        st.session_state.submit_ts = time.perf_counter()
         rt = time.time() - st.session_state.answer_start
         given = user_answer.strip()
-        correct = False
-        try:
-            correct = abs(float(given) - float(puzzle['answer'])) < 1e-6
-        except Exception:
-            correct = (given == str(puzzle['answer']))
-
-        st.session_state.tracker.record_attempt(puzzle, given, correct, rt)
-        st.session_state.history.append({
-            'question': puzzle['question'],
-            'level': puzzle['level'],
-            'given': given,
-            'correct': correct,
-            'rt': rt
-        })
-
-        next_lvl, reason = next_level(st.session_state.tracker,
-                                      st.session_state.current_level,
-                                      window_size=window_size,
-                                      use_ml=enable_ml)
-        prev_lvl = st.session_state.current_level
+        result = service.submit_answer(session_id, given, response_time=rt,
+                                       window_size=window_size, use_ml=enable_ml)
+
+        next_lvl, reason = result['level'], result['reason']
+        prev_lvl = result['previous_level']
         st.session_state.current_level = next_lvl
 
-        if correct:
+        if result['correct']:
             st.success(f"Correct! ✅ (response time: {rt:.1f}s)")
         else:
-            st.error(f"Incorrect. Correct answer: **{puzzle['answer']}** (response time: {rt:.1f}s)")
+            st.error(f"Incorrect. Correct answer: **{result['correct_answer']}** (response time: {rt:.1f}s)")
 
         st.info(f"Adaptive decision: **{next_lvl.upper()}** — {reason} (from {prev_lvl.upper()})")
 
@@ -131,45 +160,96 @@ with col1:
 
 with col2:
     st.header("Session summary")
-    tracker = st.session_state.tracker
-    st.metric("Attempts", len(tracker.attempts))
-    st.metric("Accuracy", f"{tracker.accuracy()*100:.1f}%")
-    st.metric("Avg response (s)", f"{tracker.avg_response_time():.1f}")
+    # incremental view: no per-rerun DataFrame or rescans of the attempts
+    view = get_service().summary(st.session_state.session_id)
+    st.metric("Attempts", view['attempts'])
+    st.metric("Accuracy", f"{view['accuracy']*100:.1f}%")
+    st.metric("Avg response (s)", f"{view['avg_response_time']:.1f}")
 
     st.markdown("**Last attempts**")
-    if tracker.attempts:
-        df = pd.DataFrame(tracker.attempts)
-        st.dataframe(df.tail(8)[['timestamp', 'question', 'level', 'correct', 'response_time']])
+    if view['recent']:
+        st.dataframe([{k: row[k] for k in ('timestamp', 'question', 'level', 'correct', 'response_time')}
+                      for row in view['recent']])
     else:
         st.write("No attempts recorded yet.")
 
     st.markdown("---")
     st.write("Current level:", st.session_state.current_level.upper())
     st.write("Rounds left:", st.session_state.rounds_left)
-    hist = [a['level'] for a in tracker.attempts]
-    if hist:
-        counts = pd.Series(hist).value_counts().reindex(['easy', 'medium', 'hard']).fillna(0)
-        st.bar_chart(counts)
+    if view['attempts']:
+        counts = {lvl: view['level_counts'].get(lvl, 0) for lvl in ['easy', 'medium', 'hard']}
+        st.bar_chart({'attempts': counts})
+    if view.get('mastery'):
+        st.markdown("**Mastery by operation**")
+        st.dataframe([{'level': lvl, 'op': op, 'attempts': m['attempts'],
+                       'accuracy': round(m['accuracy'], 2), 'avg_rt': round(m['response_time'], 1),
+                       'weight': round(m['weight'], 2)}
+                      for lvl, ops in view['mastery'].items() for op, m in ops.items()])
+
+lat = st.session_state.submit_latency
+if lat['prefetch'] or lat['direct']:
+    st.sidebar.markdown("### Submit → next question")
+    for mode in ('prefetch', 'direct'):
+        if lat[mode]:
+            st.sidebar.caption(f"{mode}: median {statistics.median(lat[mode])*1000:.1f} ms "
+                               f"over {len(lat[mode])} answers")
+
+if show_debug:
+    with st.sidebar.expander("Debug metrics", expanded=True):
+        snap = METRICS.snapshot()
+        st.dataframe([{'stage': name, 'calls': h['count'],
+                       'mean_ms': (h['mean'] or 0) * 1000,
+                       'p50_ms': (h['p50'] or 0) * 1000,
+                       'p95_ms': (h['p95'] or 0) * 1000}
+                      for name, h in snap['stages'].items()])
+        for c in snap['counters'].get('decisions_total', []):
+            st.caption(f"{c['labels']['path']} ({c['labels']['reason']}): {c['value']} decisions")
+        for where, err in snap['last_errors'].items():
+            st.caption(f"last error {where}: {err['message']}")
+        mem = get_service().memory_stats()
+        budget = f" of {mem['max_bytes'] / 2**20:.0f} MB" if mem.get('max_bytes') else ""
+        st.caption(f"Sessions in memory: {mem['in_memory']} (~{mem['bytes'] / 2**20:.1f} MB{budget}), "
+                   f"spilled: {mem['spilled']}, evictions: {mem['evictions']} ({mem['drops']} dropped, "
+                   f"{mem['idle_evictions']} idle), restores: {mem['restores']}")
+        if mem['rss_bytes']:
+            st.caption(f"Process RSS: {mem['rss_bytes'] / 2**20:.0f} MB")
+        profile = st.checkbox("cProfile sampling (1 in 20 decisions)", value=METRICS.profiling)
+        if profile and not METRICS.profiling:
+            METRICS.start_profiling(every=20)
+        elif not profile and METRICS.profiling:
+            METRICS.stop_profiling()
+        report = METRICS.profile_report(limit=15)
+        if report:
+            st.code(report)
+        st.download_button("Metrics JSON", data=json.dumps(snap, indent=2, default=str),
+                           file_name="metrics.json")
+        st.download_button("Metrics (Prometheus)", data=METRICS.prometheus(), file_name="metrics.prom")
 
 # End session behavior
 if end_btn or (st.session_state.rounds_left <= 0):
-    summary = tracker.get_summary()
-    summary['ended_at'] = time.time()
-    df = tracker.to_dataframe()
-    csv = df.to_csv(index=False).encode('utf-8')
+    # imported here so the export helpers stay off the app's cold start
+    from export import csv_bytes
+    # closes the session's log and drops it from the service
+    tracker = get_service().end_session(st.session_state.session_id)
+    st.session_state.session_id = None
+    # the attempts are serialized once, as CSV, for the download and the consent save;
+    # the summary JSON carries only the totals
+    csv_name = f"session_{tracker.user}_{timestamp_str()}.csv"
+    csv = csv_bytes(tracker)
+    summary = tracker.get_summary(include_attempts=False)
+    summary.update(ended_at=time.time(), attempts_file=csv_name)
 
-    st.download_button("Download attempts CSV", data=csv,
-                       file_name=f"session_{tracker.user}_{timestamp_str()}.csv")
+    st.download_button("Download attempts CSV", data=csv, file_name=csv_name)
     st.download_button("Download summary JSON",
                        data=json.dumps(summary, indent=2),
                        file_name=f"session_summary_{tracker.user}.json")
 
     if consent_save:
         try:
-            import os
             os.makedirs("data", exist_ok=True)
-            csvpath = f"data/session_{tracker.user}_{timestamp_str()}.csv"
-            df.to_csv(csvpath, index=False)
+            csvpath = os.path.join("data", csv_name)
+            with open(csvpath, 'wb') as f:
+                f.write(csv)
             st.write("Saved anonymized session data to", csvpath)
         except Exception as e:
             st.write("Error saving session data:", e)
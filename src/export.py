@@ -0,0 +1,252 @@
+"""
+Streaming session export.
+Rows come from Tracker.iter_rows() one at a time and are written straight to
+CSV, gzip-compressed JSON lines or Parquet, so an export never builds a
+DataFrame or a whole-file string. write_bundle() packs many sessions into
+one zip incrementally: each session is read, streamed into its zip entry
+and released before the next one is loaded.
+
+Parquet needs pyarrow, which is optional; CSV and JSON lines only use the
+standard library.
+
+Run from project root:
+    python src/export.py --source data --out exports/sessions.zip --formats csv jsonl
+    python src/export.py --logs data/logs --out exports/logs.zip
+"""
+
+import argparse
+import csv
+import glob
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+
+try:
+    from session_log import read_session_log
+    from tracker import COLUMNS, Tracker
+    from utils import save_summary_json
+except ImportError:
+    from src.session_log import read_session_log
+    from src.tracker import COLUMNS, Tracker
+    from src.utils import save_summary_json
+
+FORMATS = ('csv', 'jsonl', 'jsonl.gz', 'parquet')
+# rows per Parquet row group
+PARQUET_BATCH = 4096
+# gzip's default of 9 costs about twice the time for a few percent smaller files
+GZIP_LEVEL = 6
+
+
+def write_csv(tracker, f):
+    """Write the attempts as CSV (same columns and values as to_dataframe().to_csv) to a text file."""
+    writer = csv.writer(f, lineterminator='\n')
+    writer.writerow(COLUMNS)
+    writer.writerows(tracker.iter_rows())
+
+
+def csv_bytes(tracker):
+    """The attempts CSV as UTF-8 bytes, serialized once for download and saving."""
+    buf = io.BytesIO()
+    f = io.TextIOWrapper(buf, encoding='utf-8', newline='')
+    write_csv(tracker, f)
+    f.detach()
+    return buf.getvalue()
+
+
+# built once: json.dumps with options makes a new encoder per call
+_ENCODER = json.JSONEncoder(default=str)
+
+
+def write_jsonl(tracker, f, batch_size=1024):
+    """One JSON object per attempt to a text file, written in batches of lines."""
+    encode = _ENCODER.encode
+    lines = []
+    for row in tracker.iter_rows():
+        lines.append(encode(dict(zip(COLUMNS, row))))
+        if len(lines) >= batch_size:
+            f.write('\n'.join(lines) + '\n')
+            lines = []
+    if lines:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_jsonl_gz(tracker, fileobj):
+    """Gzip-compressed JSON lines to a binary file object (left open)."""
+    with gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=GZIP_LEVEL) as gz, \
+            io.TextIOWrapper(gz, encoding='utf-8', newline='') as f:
+        write_jsonl(tracker, f)
+
+
+def write_parquet(tracker, f, batch_size=PARQUET_BATCH):
+    """Attempts as Parquet, one row group per batch_size rows. Needs pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow)") from e
+    schema = pa.schema([('timestamp', pa.float64()), ('question_id', pa.string()),
+                        ('question', pa.string()), ('level', pa.string()), ('correct', pa.bool_()),
+                        ('given_answer', pa.string()), ('correct_answer', pa.string()),
+                        ('response_time', pa.float64())])
+
+    def table(rows):
+        return pa.Table.from_pylist([dict(zip(COLUMNS, r)) for r in rows], schema)
+
+    with pq.ParquetWriter(f, schema) as writer:
+        batch = []
+        written = False
+        for row in tracker.iter_rows():
+            # answers mix ints, floats and text; Parquet columns need one type
+            batch.append(row[:5] + (str(row[5]), str(row[6]), row[7]))
+            if len(batch) >= batch_size:
+                writer.write_table(table(batch))
+                batch, written = [], True
+        if batch or not written:
+            writer.write_table(table(batch))
+
+
+def write_session(tracker, path, fmt=None):
+    """Write one session's attempts to path; fmt defaults to the path's extension."""
+    fmt = fmt or _format_of(path)
+    if fmt == 'csv':
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            write_csv(tracker, f)
+    elif fmt == 'jsonl':
+        with open(path, 'w', encoding='utf-8') as f:
+            write_jsonl(tracker, f)
+    elif fmt == 'jsonl.gz':
+        with open(path, 'wb') as f:
+            write_jsonl_gz(tracker, f)
+    elif fmt == 'parquet':
+        write_parquet(tracker, path)
+    else:
+        raise ValueError(f"unknown export format: {fmt}")
+    return path
+
+
+def _format_of(path):
+    for fmt in sorted(FORMATS, key=len, reverse=True):
+        if path.endswith('.' + fmt):
+            return fmt
+    raise ValueError(f"cannot tell export format from {path}")
+
+
+def export_session(tracker, out_dir, name, formats=('csv',)):
+    """
+    Write name.<fmt> for every format plus name_summary.json (the summary
+    without the attempts, which are in the data files). Returns the paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = [write_session(tracker, os.path.join(out_dir, f"{name}.{fmt}"), fmt) for fmt in formats]
+    summary = tracker.get_summary(include_attempts=False)
+    summary['files'] = [os.path.basename(p) for p in paths]
+    summary_path = os.path.join(out_dir, f"{name}_summary.json")
+    save_summary_json(summary, summary_path)
+    return paths + [summary_path]
+
+
+def write_bundle(sessions, path, formats=('csv',)):
+    """
+    Zip many sessions into path. sessions is an iterable of (name, tracker),
+    ideally a generator so only one session is in memory at a time; each is
+    written to name.<fmt> entries and summarized in index.jsonl.
+    Returns {'sessions', 'rows', 'bytes'}.
+    """
+    tmp = f"{path}.tmp{os.getpid()}"
+    n_sessions = rows = 0
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    try:
+        with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            index = []
+            for name, tracker in sessions:
+                files = []
+                for fmt in formats:
+                    entry = f"{name}.{fmt}"
+                    _write_entry(zf, entry, tracker, fmt)
+                    files.append(entry)
+                summary = tracker.get_summary(include_attempts=False)
+                summary.update(name=name, files=files)
+                index.append(summary)
+                n_sessions += 1
+                rows += summary['num_attempts']
+            with zf.open("index.jsonl", 'w') as raw:
+                raw.write(''.join(json.dumps(s, default=str) + '\n' for s in index).encode('utf-8'))
+        os.replace(tmp, path)
+    finally:
+        # no-op after a successful replace; drops the partial zip if a session raised
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return {'sessions': n_sessions, 'rows': rows, 'bytes': os.path.getsize(path)}
+
+
+def _write_entry(zf, entry, tracker, fmt):
+    if fmt == 'parquet':
+        # the Parquet writer wants a seekable file; stage it on disk
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            zf.write(write_session(tracker, os.path.join(tmp_dir, entry), fmt), entry)
+        return
+    with zf.open(entry, 'w') as raw:
+        if fmt == 'jsonl.gz':
+            # compressed inside the (already deflated) zip, for consumers that want .jsonl.gz files
+            write_jsonl_gz(tracker, raw)
+            return
+        with io.TextIOWrapper(raw, encoding='utf-8', newline='') as f:
+            if fmt == 'csv':
+                write_csv(tracker, f)
+            elif fmt == 'jsonl':
+                write_jsonl(tracker, f)
+            else:
+                raise ValueError(f"unknown export format: {fmt}")
+
+
+def _parse_bool(value):
+    return str(value).strip().lower() in ('true', '1', 'yes')
+
+
+def read_csv_session(path):
+    """Tracker rebuilt from a saved session CSV (app export or write_csv)."""
+    tracker = Tracker()
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            tracker.restore_attempt(dict(row, timestamp=float(row['timestamp'] or 0.0),
+                                         correct=_parse_bool(row['correct']),
+                                         response_time=float(row['response_time'] or 0.0)))
+    return tracker
+
+
+def sessions_from_csv(source_dir='data', pattern="session_*.csv"):
+    """(name, Tracker) for every saved session CSV, loaded one at a time."""
+    for path in sorted(glob.glob(os.path.join(source_dir, pattern))):
+        yield os.path.splitext(os.path.basename(path))[0], read_csv_session(path)
+
+
+def sessions_from_logs(log_root=os.path.join("data", "logs")):
+    """(session id, Tracker) for every session log directory, loaded one at a time."""
+    for directory in sorted(glob.glob(os.path.join(log_root, "*"))):
+        if os.path.isdir(directory):
+            yield os.path.basename(directory), read_session_log(directory)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--source', default='data', help="directory of saved session_*.csv files")
+    source.add_argument('--logs', help="root of session log directories (data/logs)")
+    parser.add_argument('--out', default=os.path.join("exports", f"sessions_{time.strftime('%Y%m%d_%H%M%S')}.zip"))
+    parser.add_argument('--formats', nargs='+', default=['csv'], choices=FORMATS)
+    args = parser.parse_args(argv)
+
+    sessions = sessions_from_logs(args.logs) if args.logs else sessions_from_csv(args.source)
+    start = time.perf_counter()
+    result = write_bundle(sessions, args.out, args.formats)
+    elapsed = time.perf_counter() - start
+    print(f"{result['sessions']} sessions, {result['rows']} rows -> {args.out} "
+          f"({result['bytes'] / 1e6:.1f} MB) in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Headless load harness for the puzzle -> answer -> adapt loop.
+Drives simulated learners (skill profiles from train_model) through
+generate_puzzle -> Tracker.record_attempt -> next_level with no UI, and
+reports decisions/sec, per-step latency percentiles and peak RSS.
+
+Run from project root, e.g.:
+    python src/loadtest.py --learners 5000 --steps 20 --mode ml --executor process
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+try:
+    import adaptive_engine
+    from adaptive_engine import LEVELS, next_level
+    from puzzle_generator import generate_puzzle
+    from tracker import Tracker
+except ImportError:
+    from src import adaptive_engine
+    from src.adaptive_engine import LEVELS, next_level
+    from src.puzzle_generator import generate_puzzle
+    from src.tracker import Tracker
+
+
+def _init_worker(model_path):
+    engine_cls = adaptive_engine._import_ml_engine() if model_path else None
+    if engine_cls is not None:
+        adaptive_engine._ml_engine = engine_cls(model_path=model_path)
+
+
+def run_learner(learner_id, steps, use_ml, window_size, rng):
+    """
+    Run one simulated learner for `steps` answers.
+    Returns the wall-clock latency (seconds) of every loop step.
+    """
+    # train_model imports NumPy; kept out of module scope so importing loadtest stays cheap
+    try:
+        from train_model import SKILL_PROFILES, SKILLS
+    except ImportError:
+        from src.train_model import SKILL_PROFILES, SKILLS
+    p_correct, avg_rt = SKILL_PROFILES[rng.choice(SKILLS)]
+    level = rng.choice(LEVELS)
+    tracker = Tracker()
+    tracker.start_session(f"learner_{learner_id}")
+    latencies = []
+    for _ in range(steps):
+        correct = rng.random() < p_correct
+        rt = max(0.5, rng.gauss(avg_rt, avg_rt * 0.3))
+        start = time.perf_counter()
+        puzzle = generate_puzzle(level=level)
+        given = str(puzzle['answer']) if correct else ""
+        tracker.record_attempt(puzzle, given, correct, rt)
+        level, _ = next_level(tracker, level, window_size=window_size, use_ml=use_ml)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _run_chunk(args):
+    first_id, count, steps, use_ml, window_size, seed = args
+    rng = random.Random(seed)
+    latencies = []
+    for learner_id in range(first_id, first_id + count):
+        latencies.extend(run_learner(learner_id, steps, use_ml, window_size, rng))
+    return latencies
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(q / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+def _peak_rss_mb(executor):
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if executor == 'process':
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_load(learners=1000, steps=20, mode='rule', executor='single', workers=None,
+             window_size=3, chunk_size=100, seed=0, model_path=None):
+    """
+    Drive `learners` simulated learners through the adaptive loop.
+    mode: 'rule' or 'ml'; executor: 'single', 'thread' or 'process'.
+    Returns a report dict.
+    """
+    use_ml = mode == 'ml'
+    workers = workers or os.cpu_count() or 1
+    tasks = [(first, min(chunk_size, learners - first), steps, use_ml, window_size, seed + i)
+             for i, first in enumerate(range(0, learners, chunk_size))]
+
+    start = time.perf_counter()
+    if executor == 'single':
+        _init_worker(model_path)
+        results = [_run_chunk(t) for t in tasks]
+    elif executor == 'thread':
+        _init_worker(model_path)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+    elif executor == 'process':
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path,)) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+    else:
+        raise ValueError(f"unknown executor: {executor}")
+    wall = time.perf_counter() - start
+    if use_ml:
+        _init_worker(model_path)
+        ml_available = adaptive_engine._get_ml_engine() is not None
+    else:
+        ml_available = None
+
+    latencies = sorted(l for chunk in results for l in chunk)
+    return {
+        'mode': mode,
+        'executor': executor,
+        'workers': 1 if executor == 'single' else workers,
+        'learners': learners,
+        'steps': steps,
+        'window_size': window_size,
+        'ml_available': ml_available,
+        'decisions': len(latencies),
+        'wall_seconds': wall,
+        'decisions_per_sec': len(latencies) / wall if wall > 0 else 0.0,
+        'latency_ms': {
+            'p50': _percentile(latencies, 50) * 1000,
+            'p95': _percentile(latencies, 95) * 1000,
+            'p99': _percentile(latencies, 99) * 1000,
+            'max': (latencies[-1] * 1000) if latencies else 0.0
+        },
+        'peak_rss_mb': _peak_rss_mb(executor)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--learners', type=int, default=1000)
+    parser.add_argument('--steps', type=int, default=20, help="answers per learner")
+    parser.add_argument('--mode', choices=['rule', 'ml'], default='rule')
+    parser.add_argument('--executor', choices=['single', 'thread', 'process'], default='single')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--window-size', type=int, default=3)
+    parser.add_argument('--chunk-size', type=int, default=100, help="learners per task")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', default=None, help="model path (default models/adaptive_tree.pkl)")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run_load(learners=args.learners, steps=args.steps, mode=args.mode,
+                      executor=args.executor, workers=args.workers,
+                      window_size=args.window_size, chunk_size=args.chunk_size,
+                      seed=args.seed, model_path=args.model)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return report
+    lat = report['latency_ms']
+    print(f"{report['learners']} learners x {report['steps']} steps, mode={report['mode']}, "
+          f"executor={report['executor']} ({report['workers']} workers)")
+    if report['ml_available'] is False:
+        print("Warning: no ML model available, decisions used the rule fallback")
+    print(f"Decisions: {report['decisions']} in {report['wall_seconds']:.2f}s "
+          f"-> {report['decisions_per_sec']:.0f} decisions/sec")
+    print(f"Step latency ms: p50={lat['p50']:.3f} p95={lat['p95']:.3f} p99={lat['p99']:.3f} max={lat['max']:.3f}")
+    if report['peak_rss_mb'] is not None:
+        print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+    return report
+
+
+if __name__ == "__main__":
+    main()
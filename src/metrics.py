@@ -0,0 +1,303 @@
+"""
+Low-overhead, in-process metrics for the adaptive loop (standard library only).
+- per-stage latency histograms (fixed log-spaced buckets, Prometheus style)
+- labelled counters, e.g. which path served each decision (ml / rule /
+  fallback) and why the ML path failed
+- model load timings from the model registry
+METRICS.snapshot() returns a JSON-serializable dict and METRICS.prometheus()
+the Prometheus text format. METRICS.start_profiling(every=N) additionally runs
+one in N calls of the profiled stages under cProfile and accumulates the
+results for METRICS.profile_report().
+
+Set ADAPTIVE_METRICS=0 to turn collection off.
+"""
+
+import bisect
+import functools
+import io
+import os
+import threading
+import time
+
+# upper bounds in seconds: 1 µs .. ~10 s, three buckets per decade
+BUCKETS = tuple(round(m * 10.0 ** e, 9) for e in range(-6, 1) for m in (1, 2.5, 5)) + (10.0,)
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.total += other.total
+        self.count += other.count
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None if empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS + (float('inf'),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'], self.counts)),
+        }
+
+
+class Metrics:
+    """
+    Each thread records into its own shard without locking; shards are merged
+    when a snapshot is taken, and those of finished threads are folded into a
+    base shard so short-lived threads (one per Streamlit rerun) do not pile up.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []  # (thread, histograms, counters)
+        self._base = ({}, {})
+        self._errors = {}
+        self._profile_every = 0
+        self._profile_calls = 0
+        self._profile_lock = threading.Lock()
+        self._profile_stats = None
+        self.profile_samples = 0
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = ({}, {})
+            with self._lock:
+                self._fold_finished()
+                self._shards.append((threading.current_thread(), shard[0], shard[1]))
+            return shard
+
+    def _fold_finished(self):
+        # caller holds self._lock
+        alive = []
+        for thread, hists, counters in self._shards:
+            if thread.is_alive():
+                alive.append((thread, hists, counters))
+            else:
+                _merge_into(self._base, hists, counters)
+        self._shards = alive
+
+    def _merged(self):
+        with self._lock:
+            self._fold_finished()
+            merged = ({}, {})
+            _merge_into(merged, *self._base)
+            for _, hists, counters in self._shards:
+                _merge_into(merged, hists, counters)
+            return merged
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        hists = self._shard()[0]
+        hist = hists.get(stage)
+        if hist is None:
+            hist = hists[stage] = Histogram()
+        hist.observe(seconds)
+
+    @staticmethod
+    def key(name, **labels):
+        """Counter key for add(); build it once for counters on hot paths."""
+        return name, tuple(sorted(labels.items()))
+
+    def add(self, key, amount=1):
+        if not self.enabled:
+            return
+        counters = self._shard()[1]
+        counters[key] = counters.get(key, 0) + amount
+
+    def incr(self, name, amount=1, **labels):
+        self.add(self.key(name, **labels), amount)
+
+    def record_error(self, where, exc):
+        """Count an exception that was handled (e.g. by falling back) and keep its last message."""
+        if not self.enabled:
+            return
+        reason = type(exc).__name__
+        self.incr('errors_total', where=where, reason=reason)
+        with self._lock:
+            self._errors[f"{where}:{reason}"] = {'message': str(exc), 'at': time.time()}
+
+    def reset(self):
+        with self._lock:
+            for _, hists, counters in self._shards:
+                hists.clear()
+                counters.clear()
+            self._base = ({}, {})
+            self._errors.clear()
+        self._profile_stats = None
+        self.profile_samples = 0
+
+    # ---- cProfile sampling ----
+
+    def start_profiling(self, every=100):
+        """Profile one in `every` calls of the profiled stages."""
+        self._profile_calls = 0
+        self._profile_every = max(1, int(every))
+
+    def stop_profiling(self):
+        self._profile_every = 0
+
+    @property
+    def profiling(self):
+        return self._profile_every > 0
+
+    def _maybe_profile(self, fn, args, kwargs):
+        self._profile_calls += 1
+        # only one profiler can be active per process; skip the sample if one is running
+        if self._profile_calls % self._profile_every or not self._profile_lock.acquire(blocking=False):
+            return False, None
+        try:
+            # imported on first use: together they cost more at startup than the rest of the rule path
+            import cProfile
+            import pstats
+            profiler = cProfile.Profile()
+            try:
+                result = profiler.runcall(fn, *args, **kwargs)
+            finally:
+                stats = pstats.Stats(profiler)
+                if self._profile_stats is None:
+                    self._profile_stats = stats
+                else:
+                    self._profile_stats.add(stats)
+                self.profile_samples += 1
+            return True, result
+        finally:
+            self._profile_lock.release()
+
+    def profile_report(self, limit=25, sort='cumulative'):
+        """pstats text of the sampled calls so far ('' if nothing was sampled)."""
+        if self._profile_stats is None:
+            return ''
+        out = io.StringIO()
+        with self._profile_lock:
+            self._profile_stats.stream = out
+            self._profile_stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    # ---- export ----
+
+    def snapshot(self, include_models=True):
+        hists, raw_counters = self._merged()
+        stages = {name: h.as_dict() for name, h in sorted(hists.items())}
+        counters = {}
+        for (name, labels), value in sorted(raw_counters.items()):
+            counters.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        with self._lock:
+            errors = dict(self._errors)
+        snap = {'enabled': self.enabled, 'time': time.time(), 'stages': stages,
+                'counters': counters, 'last_errors': errors,
+                'profiling': {'every': self._profile_every, 'samples': self.profile_samples}}
+        if include_models:
+            snap['model_loads'] = _model_load_stats()
+        return snap
+
+    def prometheus(self, prefix='adaptive'):
+        lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+        hists, counters = self._merged()
+        stages = sorted(hists.items())
+        counters = sorted(counters.items())
+        for stage, h in stages:
+            cumulative = 0
+            for bound, n in zip([repr(b) for b in BUCKETS] + ['+Inf'], h.counts):
+                cumulative += n
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {h.total!r}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {h.count}')
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                declared.add(name)
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+        models = _model_load_stats()
+        if models:
+            lines.append(f"# TYPE {prefix}_model_load_seconds_total counter")
+            for path, s in sorted(models.items()):
+                lines.append(f'{prefix}_model_load_seconds_total{{path="{path}"}} {s["total_load_seconds"]!r}')
+            lines.append(f"# TYPE {prefix}_model_loads_total counter")
+            for path, s in sorted(models.items()):
+                lines.append(f'{prefix}_model_loads_total{{path="{path}"}} {s["load_count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _merge_into(target, hists, counters):
+    for stage, h in list(hists.items()):
+        into = target[0].get(stage)
+        if into is None:
+            into = target[0][stage] = Histogram()
+        into.merge(h)
+    for key, value in list(counters.items()):
+        target[1][key] = target[1].get(key, 0) + value
+
+
+def _model_load_stats():
+    try:
+        try:
+            from model_registry import get_registry
+        except ImportError:
+            from src.model_registry import get_registry
+        return get_registry().stats()
+    except Exception:
+        return {}
+
+
+METRICS = Metrics(enabled=os.environ.get('ADAPTIVE_METRICS', '1') != '0')
+
+
+def get_metrics():
+    """The process-wide Metrics instance."""
+    return METRICS
+
+
+def timed(stage, profile=False):
+    """
+    Decorator recording the wrapped call's latency under `stage`.
+    With profile=True the call is also eligible for cProfile sampling.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                if profile and METRICS._profile_every:
+                    sampled, result = METRICS._maybe_profile(fn, args, kwargs)
+                    if sampled:
+                        return result
+                return fn(*args, **kwargs)
+            finally:
+                METRICS.observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
@@ -1,84 +1,457 @@
 """
 Simple ML engine wrapper.
-Loads a trained sklearn model saved with joblib at models/adaptive_tree.pkl
+Loads the trained model through the process-wide model registry, so every
+engine shares one copy and picks up a retrained model without a restart.
+The default is models/adaptive_tree.flat when train_model.py exported one:
+a versioned flat array format evaluated by FlatTreeModel with NumPy only and
+memory-mapped, so loading takes about a millisecond, needs no sklearn and
+worker processes share the file's pages. Otherwise the pickled sklearn model
+(models/adaptive_tree.pkl) is loaded with joblib.
 Provides features extraction from Tracker and a predict_action() method.
+A model whose metadata records the window_size it was trained with (the flat
+header, or adaptive_meta.pkl next to a pickled model) is always fed features
+over that window, whatever window the caller asks for.
+
+Tree models (a decision tree or a forest of them) are compiled into a
+DecisionTable per window size by warm() (adaptive_engine.warm_ml_engine, run
+by the prefetcher off the request path), or else on first use: window_acc and
+streak take window_size + 1 values, level_code 3, and avg_rt only matters up
+to the trees' own split thresholds, so the model's answer for every input is
+one table entry. The table is checked against model.predict before use;
+models it cannot represent exactly keep going through predict.
 """
 
+import bisect
+import json
 import os
+import time
 import numpy as np
-import joblib
+
+try:
+    from metrics import METRICS, timed
+    from model_registry import get_registry
+except ImportError:
+    from src.metrics import METRICS, timed
+    from src.model_registry import get_registry
 
 # default model paths (relative to project root)
 _DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "adaptive_tree.pkl")
 _DEFAULT_META_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "adaptive_meta.pkl")
+_DEFAULT_FLAT_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "adaptive_tree.flat")
+
+_LEVEL_MAP = {'easy': 0, 'medium': 1, 'hard': 2}
+_AVG_RT = 1  # column of avg_rt in the feature vector
+
+
+# ---- flat tree artifact ----
+# layout: MAGIC, uint32 format version, uint32 header length, JSON header,
+# zero padding to a 64-byte boundary, then the node records and the leaf
+# class probabilities at the offsets given in the header.
+
+FLAT_MAGIC = b"ADTREE\0\0"
+FLAT_VERSION = 1
+NODE_DTYPE = np.dtype([('feature', '<i4'), ('left', '<i4'), ('right', '<i4'),
+                       ('pad', '<i4'), ('threshold', '<f8')])
+
+
+def _align(n, to=64):
+    return (n + to - 1) // to * to
+
+
+def export_flat_model(model, path, meta=None):
+    """
+    Write a fitted sklearn decision tree or forest of trees to the flat format.
+    Leaves point to themselves and internal nodes use absolute indices, so all
+    trees live in one node array. meta (JSON-serializable) is kept in the header.
+    """
+    trees = _tree_estimators(model)
+    classes = [c.item() if hasattr(c, 'item') else c for c in model.classes_]
+    nodes, probas, roots, max_depth = [], [], [], 0
+    base = 0
+    for tree in trees:
+        t = tree.tree_
+        n = t.node_count
+        rec = np.zeros(n, dtype=NODE_DTYPE)
+        leaf = t.children_left < 0
+        idx = np.arange(base, base + n, dtype=np.int32)
+        rec['feature'] = np.where(leaf, -1, t.feature)
+        rec['left'] = np.where(leaf, idx, t.children_left + base)
+        rec['right'] = np.where(leaf, idx, t.children_right + base)
+        rec['threshold'] = np.where(leaf, 0.0, t.threshold)
+        # normalized like DecisionTreeClassifier.predict_proba
+        value = np.asarray(t.value[:, 0, :len(classes)], dtype=np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        nodes.append(rec)
+        probas.append(value / normalizer)
+        roots.append(base)
+        max_depth = max(max_depth, int(t.max_depth))
+        base += n
+    nodes = np.concatenate(nodes)
+    probas = np.ascontiguousarray(np.concatenate(probas))
+
+    importances = getattr(model, 'feature_importances_', None)
+    header = {
+        'format': 'adaptive-tree',
+        'version': FLAT_VERSION,
+        'model': type(model).__name__,
+        'n_features': int(model.n_features_in_),
+        'classes': classes,
+        'roots': roots,
+        'max_depth': max_depth,
+        'n_nodes': len(nodes),
+        'importances': importances.tolist() if importances is not None else None,
+        'meta': meta or {},
+    }
+    # the offsets depend on the header length, so size the header with placeholders first
+    header['nodes_offset'] = header['proba_offset'] = 0
+    head_len = len(json.dumps(header).encode('utf-8')) + 64
+    nodes_offset = _align(len(FLAT_MAGIC) + 8 + head_len)
+    header['nodes_offset'] = nodes_offset
+    header['proba_offset'] = _align(nodes_offset + nodes.nbytes)
+    head = json.dumps(header).encode('utf-8').ljust(head_len)
+
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        f.write(FLAT_MAGIC)
+        f.write(np.array([FLAT_VERSION, len(head)], dtype='<u4').tobytes())
+        f.write(head)
+        f.write(b'\0' * (nodes_offset - f.tell()))
+        f.write(nodes.tobytes())
+        f.write(b'\0' * (header['proba_offset'] - f.tell()))
+        f.write(probas.tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+class FlatTreeModel:
+    """
+    NumPy evaluator for the flat format, with the sklearn predict semantics:
+    inputs are cast to float32 and go left when value <= threshold; a forest
+    averages leaf probabilities tree by tree and takes the first argmax.
+    """
+
+    def __init__(self, header, nodes, proba):
+        self.header = header
+        self.nodes = nodes
+        self.proba = proba
+        self.classes_ = np.array(header['classes'])
+        self.n_features_in_ = header['n_features']
+        self.roots = np.array(header['roots'], dtype=np.int64)
+        self.max_depth = header['max_depth']
+        self._feature = np.maximum(nodes['feature'], 0)
+        self._left = nodes['left']
+        self._right = nodes['right']
+        self._threshold = nodes['threshold']
+        importances = header.get('importances')
+        self.feature_importances_ = np.array(importances) if importances is not None else None
+
+    @property
+    def meta(self):
+        return self.header.get('meta') or {}
+
+    def split_thresholds(self, feature):
+        """Thresholds of every split on `feature`, across all trees."""
+        mask = self.nodes['feature'] == feature
+        return np.asarray(self._threshold[mask])
+
+    def apply(self, X):
+        """Leaf index reached in each tree: shape (n_samples, n_trees)."""
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        idx = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            go_left = X[rows, self._feature[idx]] <= self._threshold[idx]
+            idx = np.where(go_left, self._left[idx], self._right[idx])
+        return idx
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        proba = np.zeros((len(leaves), len(self.classes_)))
+        for t in range(leaves.shape[1]):
+            proba += self.proba[leaves[:, t]]
+        if leaves.shape[1] > 1:
+            proba /= leaves.shape[1]
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def load_flat_model(path):
+    """Map a flat model file read-only; raises ValueError for other formats or versions."""
+    with open(path, 'rb') as f:
+        if f.read(len(FLAT_MAGIC)) != FLAT_MAGIC:
+            raise ValueError(f"{path} is not a flat tree model")
+        version, head_len = np.frombuffer(f.read(8), dtype='<u4')
+        if version != FLAT_VERSION:
+            raise ValueError(f"unsupported flat model version {version} (expected {FLAT_VERSION})")
+        header = json.loads(f.read(int(head_len)))
+    n_nodes = header['n_nodes']
+    nodes = np.memmap(path, dtype=NODE_DTYPE, mode='r', offset=header['nodes_offset'], shape=(n_nodes,))
+    proba = np.memmap(path, dtype=np.float64, mode='r', offset=header['proba_offset'],
+                      shape=(n_nodes, len(header['classes'])))
+    return FlatTreeModel(header, nodes, proba)
+
+
+def _load_model_file(path):
+    if path.endswith('.flat'):
+        return load_flat_model(path)
+    import joblib
+    return joblib.load(path)
+
+
+def _split_thresholds(model, feature):
+    if isinstance(model, FlatTreeModel):
+        return model.split_thresholds(feature).tolist()
+    thresholds = []
+    for tree in _tree_estimators(model):
+        t = tree.tree_
+        thresholds.extend(t.threshold[t.feature == feature].tolist())
+    return thresholds
+
+
+def _tree_estimators(model):
+    if hasattr(model, 'tree_'):
+        return [model]
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None:
+        raise ValueError(f"{type(model).__name__} is not a tree model")
+    trees = list(np.ravel(np.asarray(estimators, dtype=object)))
+    if not trees or not all(hasattr(t, 'tree_') for t in trees):
+        raise ValueError(f"{type(model).__name__} is not made of decision trees")
+    return trees
+
+
+def _float32(value):
+    # sklearn trees compare float32 inputs against float64 thresholds
+    return float(np.float32(value))
+
+
+class DecisionTable:
+    """
+    Exact lookup table of a tree model's action for one window size, indexed by
+    (num_correct, streak, level_code, avg_rt interval between split thresholds).
+    """
+
+    def __init__(self, window_size, thresholds, actions):
+        self.window_size = window_size
+        self.thresholds = thresholds
+        self.actions = actions
+        self._stride = len(thresholds) + 1
+
+    @classmethod
+    def compile(cls, model, window_size):
+        if window_size < 1:
+            raise ValueError("window_size must be at least 1")
+        thresholds = sorted(set(_split_thresholds(model, _AVG_RT)))
+
+        # one float32 avg_rt inside each interval (t[b-1], t[b]]; the last one above every threshold
+        # (compared as float64: a Python float next to np.float32 would be rounded to float32)
+        reps = []
+        for t in thresholds:
+            rep = np.float32(t)
+            if float(rep) > t:
+                rep = np.nextafter(rep, np.float32(-np.inf))
+            reps.append(float(rep))
+        top = np.float32(thresholds[-1]) if thresholds else np.float32(0.0)
+        while thresholds and float(top) <= thresholds[-1]:
+            top = np.nextafter(top, np.float32(np.inf))
+        reps.append(float(top))
+
+        n = window_size + 1
+        k, s, lvl, b = np.meshgrid(np.arange(n), np.arange(n), np.arange(len(_LEVEL_MAP)),
+                                   np.arange(len(reps)), indexing='ij')
+        X = np.column_stack([k.ravel() / window_size, np.asarray(reps)[b.ravel()],
+                             s.ravel(), lvl.ravel()]).astype(float)
+        actions = [int(a) for a in model.predict(X)]
+        return cls(window_size, thresholds, actions)
+
+    def lookup(self, num_correct, avg_rt, streak, level_code):
+        b = bisect.bisect_left(self.thresholds, _float32(avg_rt))
+        n = self.window_size + 1
+        return self.actions[((num_correct * n + streak) * len(_LEVEL_MAP) + level_code) * self._stride + b]
+
+    def verify(self, model, samples=2000, seed=0):
+        """True if lookup() agrees with model.predict on random and boundary inputs."""
+        rng = np.random.default_rng(seed)
+        n = self.window_size + 1
+        edges = [v for t in self.thresholds for v in (t, np.nextafter(t, -np.inf), np.nextafter(t, np.inf))]
+        avg_rt = np.concatenate([rng.uniform(0.0, 60.0, samples), rng.lognormal(2.0, 1.0, samples // 4),
+                                 [0.5, 999.0], edges])
+        m = len(avg_rt)
+        k = rng.integers(0, n, m)
+        s = rng.integers(0, n, m)
+        lvl = rng.integers(0, len(_LEVEL_MAP), m)
+        X = np.column_stack([k / self.window_size, avg_rt, s, lvl]).astype(float)
+        expected = model.predict(X)
+        return all(self.lookup(int(k[i]), float(avg_rt[i]), int(s[i]), int(lvl[i])) == int(expected[i])
+                   for i in range(m))
 
 
 class MLEngine:
-    def __init__(self, model_path=None, meta_path=None):
-        self.model_path = model_path or os.path.abspath(_DEFAULT_MODEL_PATH)
+    def __init__(self, model_path=None, meta_path=None, registry=None, use_table=True):
+        if model_path is None:
+            flat = os.path.abspath(_DEFAULT_FLAT_PATH)
+            model_path = flat if os.path.exists(flat) else os.path.abspath(_DEFAULT_MODEL_PATH)
+        self.model_path = model_path
         self.meta_path = meta_path or os.path.abspath(_DEFAULT_META_PATH)
-        self.model = None
-        self.meta = None
-        self._load()
+        self.registry = registry or get_registry()
+        self.use_table = use_table
+        self._table_model = None
+        self._tables = {}
+        self._table_importance = None
+        self._window_model = None
+        self._trained_window = None
 
-    def _load(self):
+    def _load(self, path):
         try:
-            if os.path.exists(self.model_path):
-                self.model = joblib.load(self.model_path)
-            else:
-                self.model = None
-        except Exception as e:
-            self.model = None
-
-        try:
-            if os.path.exists(self.meta_path):
-                self.meta = joblib.load(self.meta_path)
-            else:
-                self.meta = None
+            return self.registry.get(path, _load_model_file)
         except Exception:
-            self.meta = None
+            return None
+
+    @property
+    def model(self):
+        """Current model from the registry (None if missing or unloadable)."""
+        return self._load(self.model_path)
+
+    @property
+    def meta(self):
+        return self._load(self.meta_path)
+
+    def load_stats(self):
+        """Registry load counters/latency for this engine's model and meta files."""
+        stats = self.registry.stats()
+        return {path: stats.get(os.path.abspath(path))
+                for path in (self.model_path, self.meta_path)}
 
+    def trained_window_size(self, model):
+        """window_size from the model's metadata, or None if it does not record one."""
+        if model is not self._window_model:
+            meta = model.meta if isinstance(model, FlatTreeModel) else self.meta
+            window_size = meta.get('window_size') if isinstance(meta, dict) else None
+            self._trained_window = int(window_size) if window_size else None
+            self._window_model = model
+        return self._trained_window
+
+    def warm(self, window_sizes=(3,)):
+        """
+        Load the model and compile and verify its decision tables ahead of the
+        first decision: for the trained window if the metadata records one,
+        else for each of window_sizes. Returns True if a model is loaded.
+        """
+        model = self.model
+        if model is None:
+            return False
+        if self.use_table:
+            trained = self.trained_window_size(model)
+            for window_size in ([trained] if trained else window_sizes):
+                self.decision_table(model, window_size)
+        return True
+
+    def decision_table(self, model, window_size):
+        """
+        Verified DecisionTable for model at window_size, compiled on first use;
+        None if the model cannot be tabulated or failed verification.
+        """
+        if model is not self._table_model:
+            # a reloaded model gets fresh tables
+            self._tables = {}
+            self._table_importance = self._importance(model)
+            self._table_model = model
+        tables = self._tables
+        if window_size not in tables:
+            table = None
+            try:
+                table = DecisionTable.compile(model, window_size)
+                if not table.verify(model):
+                    METRICS.incr('table_fallback_total', reason='verification_failed')
+                    table = None
+            except Exception as e:
+                METRICS.incr('table_fallback_total', reason=type(e).__name__)
+                table = None
+            tables[window_size] = table
+        return tables[window_size]
+
+    @timed('ml.features')
     def features_from_tracker(self, tracker, current_level, window_size=3):
         """
         Produce the model feature vector for the current tracker state:
         [window_accuracy, avg_response_time, streak_correct, level_code]
         Pads with conservative defaults if not enough history.
         """
-        window = tracker.last_n(window_size)
-        if len(window) < window_size:
-            pad_count = window_size - len(window)
-            pad = [{'correct': False, 'response_time': 999.0}] * pad_count
-            window = pad + window
-
-        n = len(window)
-        window_acc = sum(1 for w in window if w['correct']) / n if n > 0 else 0.0
-        avg_rt = sum(w['response_time'] for w in window) / n if n > 0 else 999.0
-        streak = 0
-        for w in reversed(window):
-            if w['correct']:
-                streak += 1
-            else:
-                break
-        level_map = {'easy': 0, 'medium': 1, 'hard': 2}
-        level_code = level_map.get(current_level, 0)
+        window_acc, avg_rt, streak = tracker.window_features(window_size, pad_rt=999.0)
+        level_code = _LEVEL_MAP.get(current_level, 0)
         return np.array([window_acc, avg_rt, streak, level_code]).reshape(1, -1)
 
-    def predict_action(self, tracker, current_level, window_size=3):
+    @timed('ml.features_batch')
+    def features_matrix(self, trackers, current_levels, window_size=3):
         """
-        Predict an action using the loaded model.
-        Returns: (pred, info) where pred in {-1,0,1} and info may contain 'importance'
+        Stack features_from_tracker rows for many learners into one
+        (n_learners, 4) matrix, in the order given.
         """
-        if self.model is None:
-            return 0, {"info": "no model loaded"}
+        rows = [tracker.window_features(window_size, pad_rt=999.0) + [_LEVEL_MAP.get(level, 0)]
+                for tracker, level in zip(trackers, current_levels)]
+        return np.array(rows, dtype=float).reshape(-1, 4)
 
-        feat = self.features_from_tracker(tracker, current_level, window_size)
-        pred = int(self.model.predict(feat)[0])
-        importance = None
+    @staticmethod
+    def _importance(model):
         try:
-            importance = getattr(self.model, "feature_importances_", None)
+            importance = getattr(model, "feature_importances_", None)
             if importance is not None:
                 importance = importance.tolist()
         except Exception:
             importance = None
+        return importance
+
+    def predict_action(self, tracker, current_level, window_size=3):
+        """
+        Predict an action using the loaded model. window_size is only used if
+        the model's metadata does not record the window it was trained with.
+        Returns: (pred, info) where pred in {-1,0,1} and info may contain 'importance'
+        """
+        model = self.model
+        if model is None:
+            return 0, {"info": "no model loaded"}
+        window_size = self.trained_window_size(model) or window_size
+
+        table = self.decision_table(model, window_size) if self.use_table else None
+        if table is not None:
+            window_acc, avg_rt, streak = tracker.window_features(window_size, pad_rt=999.0)
+            pred = table.lookup(round(window_acc * window_size), avg_rt, streak,
+                                _LEVEL_MAP.get(current_level, 0))
+            return pred, {"importance": self._table_importance}
+
+        feat = self.features_from_tracker(tracker, current_level, window_size)
+        start = time.perf_counter()
+        pred = int(model.predict(feat)[0])
+        METRICS.observe('ml.predict', time.perf_counter() - start)
+        return pred, {"importance": self._importance(model)}
+
+    def predict_actions_batch(self, trackers, levels, window_size=3):
+        """
+        Predict actions for many learners with a single model.predict call
+        (window_size as in predict_action).
+        Returns: (preds, info) where preds is a list of {-1,0,1}, one per tracker
+        """
+        model = self.model
+        if model is None:
+            return [0] * len(trackers), {"info": "no model loaded"}
+        if not trackers:
+            return [], {"importance": self._importance(model)}
+        window_size = self.trained_window_size(model) or window_size
+
+        table = self.decision_table(model, window_size) if self.use_table else None
+        if table is not None:
+            preds = []
+            for tracker, level in zip(trackers, levels):
+                window_acc, avg_rt, streak = tracker.window_features(window_size, pad_rt=999.0)
+                preds.append(table.lookup(round(window_acc * window_size), avg_rt, streak,
+                                          _LEVEL_MAP.get(level, 0)))
+            return preds, {"importance": self._table_importance}
 
-        return pred, {"importance": importance}
+        feats = self.features_matrix(trackers, levels, window_size)
+        start = time.perf_counter()
+        preds = [int(p) for p in model.predict(feats)]
+        METRICS.observe('ml.predict_batch', time.perf_counter() - start)
+        return preds, {"importance": self._importance(model)}
@@ -0,0 +1,132 @@
+"""
+Process-wide registry of loaded model files.
+Each path is loaded once per process and reloaded only when the file on disk
+changes: a new mtime/size triggers a content hash, and the loader only runs
+again if the hash differs. Reloads swap the cached object atomically, so
+readers always see either the old or the new model, never a partial one.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+try:
+    from metrics import METRICS
+except ImportError:
+    from src.metrics import METRICS
+
+
+def _file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class _Entry:
+    __slots__ = ('value', 'stat_key', 'digest', 'loaded_at', 'load_count',
+                 'last_load_seconds', 'total_load_seconds', 'failed_key', 'last_error')
+
+    def __init__(self):
+        self.value = None
+        self.stat_key = None
+        self.digest = None
+        self.loaded_at = None
+        self.load_count = 0
+        self.last_load_seconds = 0.0
+        self.total_load_seconds = 0.0
+        self.failed_key = None
+        self.last_error = None
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, loader):
+        """
+        Return the object loaded from path with loader(path), reloading it
+        only if the file changed since the last load.
+        Returns None if the file does not exist. Raises the loader's error
+        if the file cannot be loaded and no earlier version is cached.
+        """
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+
+        entry = self._entries.get(path)
+        if entry is not None and key in (entry.stat_key, entry.failed_key):
+            return entry.value
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                entry = self._entries[path] = _Entry()
+            elif key in (entry.stat_key, entry.failed_key):
+                return entry.value
+
+            try:
+                digest = _file_digest(path)
+                if digest == entry.digest:
+                    entry.stat_key = key
+                    return entry.value
+                start = time.perf_counter()
+                value = loader(path)
+                elapsed = time.perf_counter() - start
+            except Exception as e:
+                entry.failed_key = key
+                entry.last_error = repr(e)
+                METRICS.record_error('model.load', e)
+                if entry.stat_key is None:
+                    raise
+                return entry.value
+
+            entry.value = value
+            entry.digest = digest
+            entry.stat_key = key
+            entry.failed_key = None
+            entry.last_error = None
+            entry.loaded_at = time.time()
+            entry.load_count += 1
+            entry.last_load_seconds = elapsed
+            entry.total_load_seconds += elapsed
+            METRICS.observe('model.load', elapsed)
+            return value
+
+    def invalidate(self, path=None):
+        """Forget one cached path (or all of them) so the next get() reloads."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+    def stats(self):
+        """Per-path load counters and latencies, keyed by absolute path."""
+        with self._lock:
+            return {
+                path: {
+                    'loaded': e.stat_key is not None,
+                    'digest': e.digest,
+                    'loaded_at': e.loaded_at,
+                    'load_count': e.load_count,
+                    'last_load_seconds': e.last_load_seconds,
+                    'total_load_seconds': e.total_load_seconds,
+                    'last_error': e.last_error
+                }
+                for path, e in self._entries.items()
+            }
+
+
+_registry = ModelRegistry()
+
+
+def get_registry():
+    """The registry shared by every MLEngine in this process."""
+    return _registry
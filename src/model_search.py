@@ -0,0 +1,266 @@
+"""
+Hyperparameter search for the adaptive decision model.
+Evaluates model families (decision tree, random forest), tree depths, class
+weights and window sizes 1-6 (the app's slider range) with stratified k-fold
+cross-validation, fanned out over a process pool. Datasets come from
+train_model.generate_dataset and are cached under data/cache as
+memory-mapped .npy files named by a hash of the generator parameters and
+seed, so repeated searches and all workers share one copy.
+
+Each window size's labels come from the rule applied over that same window,
+so CV accuracy only ranks candidates within a window size (every window
+scores near 1.0 against its own labels); it does not say which window is
+better. The search picks the best model for every window, counting
+candidates within one CV standard deviation of the top as tied (the fastest
+of those wins), and installs the one for the app's window (--window, 3 by
+default).
+
+Writes models/search_report.json (CV accuracy vs single-row inference
+latency per candidate) and the best model to models/adaptive_search_best.pkl;
+--install also makes it the app's model (models/adaptive_tree.pkl and its
+flat export models/adaptive_tree.flat).
+
+Run from project root:
+    python src/model_search.py --folds 5 --n-jobs 8
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    from train_model import FEATURES, _atomic_dump, export_flat, generate_dataset
+except ImportError:
+    from src.train_model import FEATURES, _atomic_dump, export_flat, generate_dataset
+
+CACHE_DIR = os.path.join("data", "cache", "datasets")
+# bump when generate_dataset's output changes for the same parameters
+GENERATOR_VERSION = 1
+
+WINDOW_SIZES = [1, 2, 3, 4, 5, 6]
+# the app slider's default; the window the selected model is trained for
+APP_WINDOW_SIZE = 3
+GRID = {
+    'tree': {'max_depth': [3, 4, 6, 8, None], 'class_weight': [None, 'balanced']},
+    'forest': {'max_depth': [4, 6, 8], 'class_weight': [None, 'balanced'], 'n_estimators': [50]},
+}
+
+
+def dataset_key(num_sessions, window_size, seed, session_length=20):
+    params = {'generator': 'train_model.generate_dataset', 'version': GENERATOR_VERSION,
+              'num_sessions': num_sessions, 'window_size': window_size, 'seed': seed,
+              'session_length': session_length}
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+    return digest[:24], params
+
+
+def cached_dataset(num_sessions=2500, window_size=3, seed=42, session_length=20, cache_dir=CACHE_DIR):
+    """
+    (X, y) memory-mapped from the dataset cache, generating them on a miss.
+    Returns (X, y, path); X has FEATURES columns as float64, y the actions.
+    """
+    key, params = dataset_key(num_sessions, window_size, seed, session_length)
+    path = os.path.join(cache_dir, key)
+    if not os.path.exists(os.path.join(path, "params.json")):
+        X, y = generate_dataset(num_sessions=num_sessions, window_size=window_size, seed=seed,
+                                session_length=session_length)
+        tmp = f"{path}.tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        np.save(os.path.join(tmp, "X.npy"), X.to_numpy(dtype=np.float64))
+        np.save(os.path.join(tmp, "y.npy"), y.to_numpy(dtype=np.int64))
+        # params.json last: a directory without it is never treated as complete
+        with open(os.path.join(tmp, "params.json"), 'w', encoding='utf-8') as f:
+            json.dump(params, f, indent=1)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # another process filled the same entry first; its data is identical
+            shutil.rmtree(tmp, ignore_errors=True)
+    return _load_cached(path) + (path,)
+
+
+def _load_cached(path):
+    return (np.load(os.path.join(path, "X.npy"), mmap_mode='r'),
+            np.load(os.path.join(path, "y.npy"), mmap_mode='r'))
+
+
+def candidates(families=('tree', 'forest'), window_sizes=WINDOW_SIZES):
+    """Every (family, params, window_size) in the grid, in a stable order."""
+    out = []
+    for window_size in window_sizes:
+        for family in families:
+            grid = GRID[family]
+            for values in itertools.product(*grid.values()):
+                out.append({'family': family, 'params': dict(zip(grid, values)), 'window_size': window_size})
+    return out
+
+
+def build_model(family, params, seed=42):
+    if family == 'tree':
+        from sklearn.tree import DecisionTreeClassifier
+        return DecisionTreeClassifier(random_state=seed, **params)
+    if family == 'forest':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(random_state=seed, n_jobs=1, **params)
+    raise ValueError(f"unknown model family: {family}")
+
+
+def _evaluate_fold(task):
+    # runs in a worker: the dataset is memory-mapped, so only its path is sent
+    from sklearn.model_selection import StratifiedKFold
+    idx, path, family, params, folds, fold, seed = task
+    X, y = _load_cached(path)
+    train, test = list(StratifiedKFold(folds, shuffle=True, random_state=seed).split(X, y))[fold]
+    model = build_model(family, params, seed)
+    start = time.perf_counter()
+    model.fit(X[train], y[train])
+    fit_seconds = time.perf_counter() - start
+    return idx, float((model.predict(X[test]) == y[test]).mean()), fit_seconds
+
+
+def inference_latency_us(model, X, repeats=200):
+    """Median latency of a single-row predict, as MLEngine.predict_action calls it."""
+    rows = np.asarray(X[:repeats])
+    samples = []
+    for i in range(len(rows)):
+        row = rows[i:i + 1]
+        start = time.perf_counter()
+        model.predict(row)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def _pick_best(entries):
+    # entries of one window, best first: the fastest of those tied with the top
+    top = entries[0]
+    tied = [e for e in entries if e['cv_accuracy'] >= top['cv_accuracy'] - top['cv_std']]
+    for e in entries:
+        e['tied'] = e in tied
+    return min(tied, key=lambda e: e['latency_us'])
+
+
+def search(families=('tree', 'forest'), window_sizes=WINDOW_SIZES, num_sessions=2500, seed=42,
+           folds=5, n_jobs=1, cache_dir=CACHE_DIR, window_size=APP_WINDOW_SIZE):
+    """
+    Cross-validate every candidate. Returns the report dict with one entry per
+    candidate (grouped by window, best first), the best entry of every window
+    in 'windows' and the chosen 'best' entry for window_size.
+    """
+    if window_size not in window_sizes:
+        raise ValueError(f"window_size {window_size} is not among the searched window sizes")
+    datasets = {w: cached_dataset(num_sessions, w, seed, cache_dir=cache_dir) for w in window_sizes}
+    cands = candidates(families, window_sizes)
+    tasks = [(i, datasets[c['window_size']][2], c['family'], c['params'], folds, fold, seed)
+             for i, c in enumerate(cands) for fold in range(folds)]
+    if n_jobs and n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(_evaluate_fold, tasks, chunksize=4))
+    else:
+        results = [_evaluate_fold(t) for t in tasks]
+
+    scores = {i: [] for i in range(len(cands))}
+    fit_times = {i: [] for i in range(len(cands))}
+    for i, acc, fit_seconds in results:
+        scores[i].append(acc)
+        fit_times[i].append(fit_seconds)
+
+    entries = []
+    for i, c in enumerate(cands):
+        entries.append(dict(c, cv_accuracy=statistics.mean(scores[i]),
+                            cv_std=statistics.pstdev(scores[i]),
+                            fit_seconds=statistics.mean(fit_times[i])))
+
+    # latency is measured serially on a model fit on the full dataset, so workers do not skew it
+    for entry in entries:
+        X, y, _ = datasets[entry['window_size']]
+        model = build_model(entry['family'], entry['params'], seed)
+        model.fit(X, y)
+        entry['latency_us'] = inference_latency_us(model, X)
+
+    # accuracies are only comparable between candidates trained on the same labels
+    entries.sort(key=lambda e: (e['window_size'], -e['cv_accuracy'], e['latency_us']))
+    windows = {}
+    for w in window_sizes:
+        group = [e for e in entries if e['window_size'] == w]
+        if group:
+            windows[w] = _pick_best(group)
+    return {
+        'num_sessions': num_sessions,
+        'seed': seed,
+        'folds': folds,
+        'features': FEATURES,
+        'note': "cv_accuracy is measured against labels from the same window's rule; "
+                "it ranks models within a window size, not window sizes",
+        'candidates': entries,
+        'windows': windows,
+        'best': windows.get(window_size),
+    }
+
+
+def save_best(report, out_dir='models', install=False, cache_dir=CACHE_DIR):
+    """Refit the best candidate on its full dataset and write it (and the report) to out_dir."""
+    best = report['best']
+    X, y, _ = cached_dataset(report['num_sessions'], best['window_size'], report['seed'], cache_dir=cache_dir)
+    model = build_model(best['family'], best['params'], report['seed'])
+    model.fit(X, y)
+    meta = {
+        'model': type(model).__name__,
+        'window_size': best['window_size'],
+        'features': FEATURES,
+        'params': best['params'],
+        'cv_accuracy': best['cv_accuracy'],
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    _atomic_dump(model, os.path.join(out_dir, "adaptive_search_best.pkl"))
+    _atomic_dump(meta, os.path.join(out_dir, "adaptive_search_best_meta.pkl"))
+    if install:
+        _atomic_dump(model, os.path.join(out_dir, "adaptive_tree.pkl"))
+        _atomic_dump(meta, os.path.join(out_dir, "adaptive_meta.pkl"))
+        export_flat(model, os.path.join(out_dir, "adaptive_tree.flat"), meta)
+    path = os.path.join(out_dir, "search_report.json")
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--families', nargs='+', default=['tree', 'forest'], choices=sorted(GRID))
+    parser.add_argument('--window-sizes', nargs='+', type=int, default=WINDOW_SIZES)
+    parser.add_argument('--window', type=int, default=APP_WINDOW_SIZE,
+                        help="window size of the model to save (the app slider's value)")
+    parser.add_argument('--sessions', type=int, default=2500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--n-jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--out-dir', default='models')
+    parser.add_argument('--install', action='store_true',
+                        help="also save the best model as models/adaptive_tree.pkl for the app")
+    args = parser.parse_args(argv)
+
+    report = search(args.families, args.window_sizes, args.sessions, args.seed, args.folds,
+                    args.n_jobs, args.cache_dir, args.window)
+    print(f"{'family':8} {'window':>6} {'params':45} {'cv_acc':>8} {'latency_us':>10}")
+    for e in report['candidates']:
+        print(f"{e['family']:8} {e['window_size']:>6} {json.dumps(e['params']):45} "
+              f"{e['cv_accuracy']:8.4f} {e['latency_us']:10.1f}{'  (tied)' if e['tied'] else ''}")
+    print(report['note'])
+    path = save_best(report, args.out_dir, args.install, args.cache_dir)
+    best = report['best']
+    ties = sum(e['tied'] for e in report['candidates'] if e['window_size'] == best['window_size'])
+    print(f"Best: {best['family']} window={best['window_size']} {best['params']} "
+          f"(cv accuracy {best['cv_accuracy']:.4f}, fastest of {ties} tied); report written to {path}")
+
+
+if __name__ == "__main__":
+    main()
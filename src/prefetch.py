@@ -0,0 +1,50 @@
+"""
+Speculative next-puzzle prefetch.
+While the learner is answering, PuzzlePrefetcher keeps one puzzle ready for
+every level the next decision can land on (demote / stay / promote). In rule
+mode it also prepares the decision inputs for a correct and an incorrect
+answer (adaptive_engine.prepare_rule_decision); in ML mode it warms the ML
+engine. After "Submit Answer" the service only records the attempt, finishes
+the decision from the answer and picks the prepared puzzle.
+"""
+
+try:
+    from adaptive_engine import candidate_levels, prepare_rule_decision, warm_ml_engine
+except ImportError:
+    from src.adaptive_engine import candidate_levels, prepare_rule_decision, warm_ml_engine
+
+
+class PuzzlePrefetcher:
+    def __init__(self, bank):
+        self.bank = bank
+        self._ready = {}
+        self.decision_inputs = None
+        self.hits = 0
+        self.misses = 0
+
+    def prepare(self, current_level, use_ml=False, tracker=None, window_size=3):
+        """
+        Fill the ready slot of every candidate next level; cheap when already
+        full. With a tracker in rule mode, also prepare the decision inputs.
+        """
+        for level in candidate_levels(current_level):
+            if level not in self._ready:
+                self._ready[level] = self.bank.pop(level)
+        if use_ml:
+            warm_ml_engine((window_size,))
+        elif tracker is not None:
+            self.decision_inputs = prepare_rule_decision(tracker, current_level, window_size)
+
+    def take_decision_inputs(self):
+        """The prepared decision inputs, once (None if none were prepared)."""
+        inputs, self.decision_inputs = self.decision_inputs, None
+        return inputs
+
+    def take(self, level):
+        """Return the prepared puzzle for level, or pop a fresh one if none is ready."""
+        puzzle = self._ready.pop(level, None)
+        if puzzle is None:
+            self.misses += 1
+            return self.bank.pop(level)
+        self.hits += 1
+        return puzzle
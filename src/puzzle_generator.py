@@ -1,5 +1,15 @@
+import bisect
 import random
 import operator
+from array import array
+
+try:
+    from metrics import timed
+except ImportError:
+    from src.metrics import timed
+
+# NumPy is imported inside generate_puzzles only, so that single puzzles, the
+# per-session PuzzleBank (and importing this module) need only the standard library.
 
 OPS = {
     '+': operator.add,
@@ -23,26 +33,212 @@ LEVEL_CONFIG = {
     }
 }
 
-def generate_puzzle(level='easy', seed=None):
-    """Return dict: {id, question, answer, level, metadata}"""
-    if seed is not None:
-        random.seed(seed)
+def _make_puzzle(level, op, a, b, uid):
+    return {
+        'id': f"{level}_{uid}",
+        'question': f"{a} {op} {b} = ?",
+        'answer': OPS[op](a, b),
+        'level': level,
+        'op': op,
+        'operands': (a, b)
+    }
+
+def parse_question(question):
+    """(op, (a, b)) from a question like "3 + 4 = ?", or None if it does not parse."""
+    parts = str(question).split()
+    if len(parts) < 3 or parts[1] not in OPS:
+        return None
+    try:
+        return parts[1], (int(parts[0]), int(parts[2]))
+    except ValueError:
+        return None
+
+@timed('puzzle.generate')
+def generate_puzzle(level='easy', seed=None, rng=None):
+    """
+    Return dict: {id, question, answer, level, metadata}
+    rng: optional random.Random for per-session streams; seed builds a private
+    one. The global random module is only used when neither is given.
+    """
+    if rng is None:
+        rng = random.Random(seed) if seed is not None else random
     conf = LEVEL_CONFIG.get(level, LEVEL_CONFIG['easy'])
-    a = random.randint(*conf['range'])
-    b = random.randint(*conf['range'])
-    op = random.choice(conf['ops'])
+    a = rng.randint(*conf['range'])
+    b = rng.randint(*conf['range'])
+    op = rng.choice(conf['ops'])
     # prevent divide-by-zero
     if op == '/' and b == 0: b = 1
     # For easy, avoid negative results (optional)
     if level == 'easy' and op == '-' and a < b:
         a, b = b, a
-    answer = OPS[op](a, b)
-    qtext = f"{a} {op} {b} = ?"
-    return {
-        'id': f"{level}_{random.getrandbits(32)}",
-        'question': qtext,
-        'answer': answer,
-        'level': level,
-        'op': op,
-        'operands': (a, b)
-    }
+    return _make_puzzle(level, op, a, b, rng.getrandbits(32))
+
+@timed('puzzle.generate_batch')
+def generate_puzzles(level='easy', n=1, rng=None):
+    """
+    Generate n puzzles at once, drawing operands, ops and ids in NumPy batches.
+    rng: numpy Generator (or seed) owned by the caller's session.
+    Returns a list of puzzle dicts like generate_puzzle.
+    """
+    import numpy as np
+    rng = np.random.default_rng(rng)
+    conf = LEVEL_CONFIG.get(level, LEVEL_CONFIG['easy'])
+    lo, hi = conf['range']
+    a = rng.integers(lo, hi + 1, size=n)
+    b = rng.integers(lo, hi + 1, size=n)
+    op_idx = rng.integers(0, len(conf['ops']), size=n)
+    ops = np.array(conf['ops'])
+    b = np.where((ops[op_idx] == '/') & (b == 0), 1, b)
+    if level == 'easy':
+        swap = (ops[op_idx] == '-') & (a < b)
+        a, b = np.where(swap, b, a), np.where(swap, a, b)
+    uids = rng.integers(0, 2**32, size=n)
+    return [_make_puzzle(level, conf['ops'][o], x, y, u)
+            for o, x, y, u in zip(op_idx.tolist(), a.tolist(), b.tolist(), uids.tolist())]
+
+# level -> (op_idx, a, b) arrays of every distinct puzzle of that level
+_LEVEL_ITEMS = {}
+
+def _config_items(level, conf):
+    """
+    (op_idx, a, b) arrays of every distinct puzzle a level config can produce,
+    grouped by operation (op_idx ascending), then by a and b.
+    """
+    op_idx, col_a, col_b = array('b'), array('l'), array('l')
+    lo, hi = conf['range']
+    for i, op in enumerate(conf['ops']):
+        for a in range(lo, hi + 1):
+            if level == 'easy' and op == '-':
+                # generate_puzzle swaps these, so a < b never appears
+                bs = range(lo, min(a, hi) + 1)
+            else:
+                bs = range(lo, hi + 1)
+            if op == '/':
+                bs = [b for b in bs if b != 0]
+            op_idx.extend([i] * len(bs))
+            col_a.extend([a] * len(bs))
+            col_b.extend(bs)
+    return op_idx, col_a, col_b
+
+def _op_slice(op_idx, i):
+    """(start, stop) of operation i in _config_items' op_idx."""
+    return bisect.bisect_left(op_idx, i), bisect.bisect_right(op_idx, i)
+
+def _level_items(level):
+    items = _LEVEL_ITEMS.get(level)
+    if items is None:
+        items = _LEVEL_ITEMS[level] = _config_items(level, LEVEL_CONFIG.get(level, LEVEL_CONFIG['easy']))
+    return items
+
+def _in_bank(level, op, a, b):
+    conf = LEVEL_CONFIG.get(level, LEVEL_CONFIG['easy'])
+    lo, hi = conf['range']
+    if op not in conf['ops'] or not (lo <= a <= hi and lo <= b <= hi):
+        return False
+    if op == '/' and b == 0:
+        return False
+    return not (level == 'easy' and op == '-' and a < b)
+
+# levels with more distinct puzzles than this are sampled instead of permuted,
+# so a session's bank stays a few KB however large the level is
+PERMUTATION_LIMIT = 4096
+# memory_bytes() estimate per served puzzle key, measured with tracemalloc
+SEEN_KEY_BYTES = 180
+
+class PuzzleBank:
+    """
+    Per-session bank of distinct puzzles for every level, keyed by
+    (level, op, operands). Small levels are served from a shuffled
+    permutation of all their distinct puzzles; large ones by rejection
+    sampling against the served set until half are used, then from a
+    permutation of the rest. Either way pop() is O(1) (amortized) and a
+    puzzle only repeats after the whole level has been served.
+    """
+
+    def __init__(self, rng=None):
+        # rng: a random.Random or a seed for a private one
+        self.rng = rng if isinstance(rng, random.Random) else random.Random(rng)
+        self._order = {}
+        self._pos = {}
+        self._seen = set()
+        self._seen_count = {}
+
+    def _next_uid(self):
+        return self.rng.getrandbits(32)
+
+    def _key(self, level, k):
+        op_idx, a, b = _level_items(level)
+        return (level, LEVEL_CONFIG.get(level, LEVEL_CONFIG['easy'])['ops'][op_idx[k]], (a[k], b[k]))
+
+    def _new_cycle(self, level):
+        # level exhausted: every puzzle is fresh again
+        self._seen = {k for k in self._seen if k[0] != level}
+        self._seen_count[level] = 0
+        self._order.pop(level, None)
+
+    def _build_order(self, level):
+        n = len(_level_items(level)[0])
+        order = array('i', range(n))
+        self.rng.shuffle(order)
+        if self._seen_count.get(level, 0):
+            order = array('i', [k for k in order if self._key(level, k) not in self._seen])
+        self._order[level] = order
+        self._pos[level] = 0
+
+    def _next_index(self, level):
+        n = len(_level_items(level)[0])
+        if self._seen_count.get(level, 0) >= n:
+            self._new_cycle(level)
+        if level not in self._order:
+            if n > PERMUTATION_LIMIT and self._seen_count.get(level, 0) < n // 2:
+                return self.rng.randrange(n)
+            self._build_order(level)
+        if self._pos[level] >= len(self._order[level]):
+            self._new_cycle(level)
+            return self._next_index(level)
+        k = self._order[level][self._pos[level]]
+        self._pos[level] += 1
+        return k
+
+    def __len__(self):
+        return len(self._seen)
+
+    def memory_bytes(self):
+        """Estimated bytes held by the served set and the level permutations."""
+        return (SEEN_KEY_BYTES * len(self._seen)
+                + sum(order.itemsize * len(order) for order in self._order.values()))
+
+    def __contains__(self, key):
+        """key: (level, op, operands) of a puzzle served in this session."""
+        return key in self._seen
+
+    def remaining(self, level):
+        """Distinct puzzles of level not yet served in the current cycle."""
+        return len(_level_items(level)[0]) - self._seen_count.get(level, 0)
+
+    def _add_seen(self, key):
+        if key not in self._seen:
+            self._seen.add(key)
+            self._seen_count[key[0]] = self._seen_count.get(key[0], 0) + 1
+
+    def mark_seen(self, puzzle):
+        """Record a puzzle served from elsewhere so the bank does not repeat it."""
+        a, b = puzzle['operands']
+        if _in_bank(puzzle['level'], puzzle['op'], a, b):
+            self._add_seen((puzzle['level'], puzzle['op'], (a, b)))
+
+    @timed('puzzle.bank_pop')
+    def pop(self, level='easy'):
+        """Return the next unseen puzzle for level."""
+        while True:
+            key = self._key(level, self._next_index(level))
+            if key not in self._seen:
+                self._add_seen(key)
+                return _make_puzzle(level, key[1], key[2][0], key[2][1], self._next_uid())
+
+    def lookup(self, level, op, operands):
+        """Puzzle dict for a specific (level, op, operands), or None if not in the bank."""
+        a, b = operands
+        if not _in_bank(level, op, a, b):
+            return None
+        return _make_puzzle(level, op, a, b, self._next_uid())
@@ -0,0 +1,392 @@
+"""
+Offline replay of adaptation policies over logged and simulated sessions.
+
+Sessions are loaded as (sessions x steps) arrays: from the analytics store
+(src/analytics.py), from saved data/session_*.csv files, or simulated with
+train_model.simulate_sessions. Each policy's level trajectory is replayed
+for every session at once: the rolling-window features are computed for all
+sessions and steps with NumPy, and the level recursion steps through the
+session length vectorized across sessions. The logged answers are replayed
+as they happened, whatever level a policy would have chosen.
+
+Policies:
+- RulePolicy: adaptive_engine's rule with its own window size and
+  FAST_THRESH / SLOW_THRESH
+- ModelPolicy: any model with predict() over train_model.FEATURES, e.g. a
+  trained models/adaptive_tree.pkl or its flat export
+- the logged decisions themselves, when the sessions carry their levels
+
+evaluate() reports how often each policy promoted, held or demoted, where
+learners ended up, and agreement matrices between policies. Decisions match
+next_level_rule / MLEngine.predict_action on a Tracker exactly.
+
+Run from project root:
+    python src/replay.py --simulate 100000 --sweep
+    python src/replay.py --store data/analytics --model models/adaptive_tree.flat
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    from adaptive_engine import FAST_THRESH, LEVELS, SLOW_THRESH
+    from analytics import AnalyticsStore
+    from train_model import read_session_csv, simulate_sessions
+except ImportError:
+    from src.adaptive_engine import FAST_THRESH, LEVELS, SLOW_THRESH
+    from src.analytics import AnalyticsStore
+    from src.train_model import read_session_csv, simulate_sessions
+
+ACTIONS = ('demote', 'hold', 'promote')
+PAD_RT = 999.0
+
+
+class SessionBatch:
+    """
+    Sessions as (n_sessions, n_steps) arrays, shorter sessions padded at the
+    end and masked out by `valid`. levels holds the logged level of every
+    attempt (None for simulated sessions); start_level is where replay starts.
+    """
+
+    def __init__(self, correct, response_time, valid=None, start_level=None, levels=None):
+        self.correct = np.asarray(correct, dtype=bool)
+        self.response_time = np.asarray(response_time, dtype=np.float64)
+        self.valid = np.ones(self.correct.shape, dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+        if start_level is None:
+            start_level = levels[:, 0] if levels is not None else np.zeros(len(self.correct))
+        self.start_level = np.clip(np.asarray(start_level), 0, len(LEVELS) - 1).astype(np.int8)
+        self.levels = None if levels is None else np.asarray(levels, dtype=np.int8)
+        self._windows = {}
+
+    @property
+    def n_sessions(self):
+        return self.correct.shape[0]
+
+    @property
+    def n_steps(self):
+        return self.correct.shape[1]
+
+    @classmethod
+    def simulate(cls, num_sessions, session_length=20, seed=None):
+        _, level_code, correct, rt = simulate_sessions(num_sessions, session_length, np.random.default_rng(seed))
+        return cls(correct, rt, start_level=level_code)
+
+    @classmethod
+    def from_columns(cls, session, correct, response_time, level, max_steps=None):
+        """
+        Batch from flat per-attempt columns grouped by session in attempt order
+        (AnalyticsStore layout); unknown levels (-1) are read as easy.
+        """
+        session = np.asarray(session)
+        n = len(session)
+        if not n:
+            return cls(np.zeros((0, 0), bool), np.zeros((0, 0)), levels=np.zeros((0, 0), np.int8))
+        starts = np.flatnonzero(np.r_[True, session[1:] != session[:-1]])
+        lengths = np.diff(np.r_[starts, n])
+        width = int(lengths.max()) if max_steps is None else min(int(lengths.max()), max_steps)
+        row = np.repeat(np.arange(len(starts)), lengths)
+        col = np.arange(n) - np.repeat(starts, lengths)
+        keep = col < width
+        row, col = row[keep], col[keep]
+
+        shape = (len(starts), width)
+        valid = np.zeros(shape, dtype=bool)
+        out_correct = np.zeros(shape, dtype=bool)
+        out_rt = np.zeros(shape)
+        out_level = np.zeros(shape, dtype=np.int8)
+        valid[row, col] = True
+        out_correct[row, col] = np.asarray(correct)[keep]
+        out_rt[row, col] = np.asarray(response_time)[keep]
+        out_level[row, col] = np.maximum(np.asarray(level)[keep], 0)
+        return cls(out_correct, out_rt, valid, levels=out_level)
+
+    @classmethod
+    def from_store(cls, store_dir=os.path.join('data', 'analytics'), max_steps=None):
+        c = AnalyticsStore(store_dir).columns()
+        return cls.from_columns(c['session'], c['correct'], c['response_time'], c['level'], max_steps)
+
+    @classmethod
+    def from_csv(cls, source_dir='data', pattern="session_*.csv", max_steps=None):
+        parts = [read_session_csv(p) for p in sorted(glob.glob(os.path.join(source_dir, pattern)))]
+        parts = [p for p in parts if len(p[0])]
+        if not parts:
+            return cls.from_columns([], [], [], [])
+        session = np.concatenate([np.full(len(p[0]), i) for i, p in enumerate(parts)])
+        return cls.from_columns(session, *(np.concatenate(col) for col in zip(*parts)), max_steps=max_steps)
+
+    def windows(self, window_size):
+        """Rolling-window statistics for every session and step (cached per window size)."""
+        win = self._windows.get(window_size)
+        if win is None:
+            win = self._windows[window_size] = window_stats(self.correct, self.response_time, window_size)
+        return win
+
+
+def window_stats(correct, response_time, window_size, pad_rt=PAD_RT):
+    """
+    What a Tracker holds right after each attempt, for all sessions and steps:
+    'acc' and 'avg_rt' over the unpadded window (Tracker.window_stats, used by
+    the rule) and 'features', the model inputs of Tracker.window_features
+    without the level column. Arrays are (n_sessions, n_steps).
+    """
+    n_sessions, n_steps = correct.shape
+    pad = window_size - 1
+    c = np.concatenate([np.zeros((n_sessions, pad), dtype=bool), correct], axis=1)
+    rt = np.concatenate([np.full((n_sessions, pad), pad_rt), response_time], axis=1)
+    real = np.r_[np.zeros(pad, dtype=bool), np.ones(n_steps, dtype=bool)]
+
+    # accumulate oldest first, like the Tracker's sums, so results match bit for bit
+    n_correct = np.zeros((n_sessions, n_steps), dtype=np.int64)
+    rt_sum = np.zeros((n_sessions, n_steps))
+    real_rt_sum = np.zeros((n_sessions, n_steps))
+    for k in range(window_size):
+        n_correct += c[:, k:k + n_steps]
+        rt_sum += rt[:, k:k + n_steps]
+        real_rt_sum += np.where(real[k:k + n_steps], rt[:, k:k + n_steps], 0.0)
+    count = np.minimum(np.arange(1, n_steps + 1), window_size)
+
+    idx = np.broadcast_to(np.arange(n_steps), (n_sessions, n_steps))
+    last_miss = np.maximum.accumulate(np.where(correct, -1, idx), axis=1)
+    streak = np.minimum(idx - last_miss, count)
+
+    features = np.stack([n_correct / window_size, rt_sum / window_size, streak], axis=2)
+    return {'acc': n_correct / count, 'avg_rt': real_rt_sum / count, 'features': features}
+
+
+class RulePolicy:
+    """next_level_rule with its own window size and thresholds (defaults: adaptive_engine's)."""
+
+    def __init__(self, window_size=3, fast=None, slow=None, name=None):
+        self.window_size = window_size
+        self.fast = dict(fast or FAST_THRESH)
+        self.slow = dict(slow or SLOW_THRESH)
+        self.name = name or f"rule[w={window_size}]"
+        self._fast = np.array([self.fast[l] for l in LEVELS])
+        self._slow = np.array([self.slow[l] for l in LEVELS])
+
+    def params(self):
+        return {'window_size': self.window_size, 'fast': self.fast, 'slow': self.slow}
+
+    def actions(self, win, step, level):
+        acc = win['acc'][:, step]
+        avg_rt = win['avg_rt'][:, step]
+        return np.where((acc >= 0.8) & (avg_rt <= self._fast[level]), 1,
+                        np.where((acc <= 0.5) | (avg_rt >= self._slow[level]), -1, 0))
+
+    def level_actions(self, win):
+        """The action at every step for each possible level: (n_steps, n_levels, n_sessions) int8."""
+        acc, avg_rt = win['acc'].T, win['avg_rt'].T
+        high, low = acc >= 0.8, acc <= 0.5
+        out = np.empty((acc.shape[0], len(LEVELS), acc.shape[1]), dtype=np.int8)
+        for i, (fast, slow) in enumerate(zip(self._fast, self._slow)):
+            promote = high & (avg_rt <= fast)
+            demote = ~promote & (low | (avg_rt >= slow))
+            out[:, i] = promote.view(np.int8) - demote.view(np.int8)
+        return out
+
+
+class ModelPolicy:
+    """A trained model's decision, from the features MLEngine.features_from_tracker builds."""
+
+    def __init__(self, model, window_size=3, name=None):
+        self.model = model
+        self.window_size = window_size
+        self.name = name or f"{type(model).__name__}[w={window_size}]"
+
+    @classmethod
+    def from_path(cls, path, window_size=None, name=None):
+        """Load a .pkl or .flat model; window_size defaults to the one in its metadata."""
+        try:
+            from ml_engine import _load_model_file
+        except ImportError:
+            from src.ml_engine import _load_model_file
+        model = _load_model_file(path)
+        if window_size is None:
+            meta = model.meta if hasattr(model, 'meta') else {}
+            window_size = int(meta.get('window_size', 3))
+        return cls(model, window_size, name or f"{os.path.basename(path)}[w={window_size}]")
+
+    def params(self):
+        return {'window_size': self.window_size, 'model': type(self.model).__name__}
+
+    def actions(self, win, step, level):
+        X = np.column_stack([win['features'][:, step], level])
+        return np.asarray(self.model.predict(X), dtype=np.int8)
+
+
+def replay(batch, policy):
+    """
+    Replay one policy over every session.
+    Returns (actions, levels, decided): actions (n_sessions, n_steps) are the
+    level changes -1/0/+1 (a demote at the lowest level holds, as in
+    next_level), levels (n_sessions, n_steps + 1) with the level before each
+    attempt and after the last, and the mask of steps where a decision was made.
+    """
+    win = batch.windows(policy.window_size)
+    # step-major buffers so every step reads and writes contiguous rows
+    actions = np.zeros((batch.n_steps, batch.n_sessions), dtype=np.int8)
+    levels = np.empty((batch.n_steps + 1, batch.n_sessions), dtype=np.int8)
+    valid = np.ascontiguousarray(batch.valid.T)
+    level = levels[0] = batch.start_level
+    level = level.astype(np.intp)
+    top = len(LEVELS) - 1
+    # policies whose decision only depends on the level are tabulated for all levels up front
+    table = policy.level_actions(win) if hasattr(policy, 'level_actions') else None
+    offset = np.arange(batch.n_sessions)
+    for step in range(batch.n_steps):
+        if table is not None:
+            act = table[step].ravel()[level * batch.n_sessions + offset]
+        else:
+            act = policy.actions(win, step, level)
+        # sessions that already ended keep their level
+        new_level = levels[step + 1] = np.clip(level + np.where(valid[step], act, 0), 0, top)
+        actions[step] = new_level - level
+        level = new_level
+    return actions.T, levels.T, batch.valid
+
+
+def logged_decisions(batch):
+    """(actions, levels, decided) of the levels actually served, for sessions that carry them."""
+    if batch.levels is None:
+        raise ValueError("batch has no logged levels")
+    actions = np.zeros(batch.correct.shape, dtype=np.int8)
+    actions[:, :-1] = np.sign(batch.levels[:, 1:].astype(np.int16) - batch.levels[:, :-1])
+    decided = batch.valid.copy()
+    decided[:, :-1] &= batch.valid[:, 1:]
+    decided[:, -1] = False
+    # after the last attempt a session stays at the level it was last served
+    levels = np.concatenate([batch.levels, np.zeros((batch.n_sessions, 1), dtype=np.int8)], axis=1)
+    rows = np.arange(batch.n_sessions)
+    lengths = batch.valid.sum(axis=1)
+    levels[rows, lengths] = levels[rows, np.maximum(lengths - 1, 0)]
+    return actions, levels, decided
+
+
+def agreement_matrix(a, b, mask):
+    """3x3 counts of (a's action, b's action) over mask, rows/columns demote, hold, promote."""
+    codes = (a[mask].astype(np.int64) + 1) * 3 + (b[mask].astype(np.int64) + 1)
+    return np.bincount(codes, minlength=9).reshape(3, 3)
+
+
+def _summarize(batch, name, params, actions, levels, decided):
+    counts = np.bincount(actions[decided].astype(np.int64) + 1, minlength=3)
+    total = int(counts.sum())
+    # level after each session's last attempt, and the level each attempt was served at
+    final = levels[np.arange(batch.n_sessions), batch.valid.sum(axis=1)].astype(np.int64)
+    served = levels[:, :-1][batch.valid]
+    return {
+        'name': name,
+        'params': params,
+        'decisions': total,
+        'counts': dict(zip(ACTIONS, counts.tolist())),
+        'rates': {a: (float(n) / total if total else 0.0) for a, n in zip(ACTIONS, counts)},
+        'final_levels': dict(zip(LEVELS, np.bincount(final, minlength=len(LEVELS)).tolist())),
+        'mean_level': float(served.mean()) if len(served) else 0.0,
+    }
+
+
+def evaluate(batch, policies, include_logged=None, pairwise=False):
+    """
+    Replay policies over batch. Agreement matrices compare every policy with
+    the first one and with the logged decisions (all pairs with
+    pairwise=True), over steps both decided. include_logged adds the logged
+    decisions as a policy named 'logged' (default: when the batch has levels).
+    Returns a JSON-serializable report.
+    """
+    start = time.perf_counter()
+    runs = []
+    if include_logged is None:
+        include_logged = batch.levels is not None
+    if include_logged:
+        runs.append(('logged', {'logged': True}) + logged_decisions(batch))
+    for policy in policies:
+        runs.append((policy.name, policy.params()) + replay(batch, policy))
+
+    refs = [0, 1] if include_logged else [0]
+    pairs = (itertools.combinations(range(len(runs)), 2) if pairwise
+             else ((i, j) for i in refs for j in range(i + 1, len(runs))))
+    agreement = []
+    for i, j in pairs:
+        mask = runs[i][4] & runs[j][4]
+        matrix = agreement_matrix(runs[i][2], runs[j][2], mask)
+        total = int(matrix.sum())
+        agreement.append({'a': runs[i][0], 'b': runs[j][0], 'matrix': matrix.tolist(),
+                          'agreement': float(np.trace(matrix) / total) if total else 0.0})
+    return {
+        'sessions': batch.n_sessions,
+        'steps': int(batch.valid.sum()),
+        'policies': [_summarize(batch, *run) for run in runs],
+        'agreement': agreement,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def sweep_policies(window_sizes=(3,), fast_scales=(1.0,), slow_scales=(1.0,)):
+    """RulePolicy for every window size and scaling of FAST_THRESH / SLOW_THRESH."""
+    return [RulePolicy(w, {l: v * f for l, v in FAST_THRESH.items()},
+                       {l: v * s for l, v in SLOW_THRESH.items()},
+                       name=f"rule[w={w},fast=x{f:g},slow=x{s:g}]")
+            for w in window_sizes for f in fast_scales for s in slow_scales]
+
+
+def _print_report(report):
+    print(f"{report['sessions']} sessions, {report['steps']} attempts replayed in {report['seconds']:.2f}s")
+    print(f"{'policy':40} {'demote':>8} {'hold':>8} {'promote':>8} {'mean_lvl':>9}")
+    for p in report['policies']:
+        r = p['rates']
+        print(f"{p['name']:40} {r['demote']:8.3f} {r['hold']:8.3f} {r['promote']:8.3f} {p['mean_level']:9.3f}")
+    for a in report['agreement']:
+        print(f"agreement {a['a']} vs {a['b']}: {a['agreement']:.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--simulate', type=int, metavar='N', help="replay N simulated sessions (default 10000)")
+    source.add_argument('--store', help="analytics store directory (see analytics.py ingest)")
+    source.add_argument('--source', help="directory of saved session_*.csv files")
+    parser.add_argument('--session-length', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-steps', type=int, default=None, help="truncate longer logged sessions")
+    parser.add_argument('--window-sizes', nargs='+', type=int, default=[3])
+    parser.add_argument('--sweep', action='store_true', help="also scale FAST/SLOW thresholds")
+    parser.add_argument('--fast-scales', nargs='+', type=float, default=[0.75, 1.0, 1.25])
+    parser.add_argument('--slow-scales', nargs='+', type=float, default=[0.75, 1.0, 1.25])
+    parser.add_argument('--model', action='append', default=[], help="model .pkl/.flat to replay (repeatable)")
+    parser.add_argument('--pairwise', action='store_true', help="agreement between every pair of policies")
+    parser.add_argument('--json', default=None, help="write the full report to this path")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.store:
+        batch = SessionBatch.from_store(args.store, args.max_steps)
+    elif args.source:
+        batch = SessionBatch.from_csv(args.source, max_steps=args.max_steps)
+    else:
+        batch = SessionBatch.simulate(args.simulate or 10000, args.session_length, args.seed)
+    print(f"loaded {batch.n_sessions} sessions in {time.perf_counter() - start:.2f}s")
+
+    # the current rule comes first: everything else is compared with it
+    if args.sweep:
+        current = sweep_policies(args.window_sizes[:1])[0]
+        policies = [current] + [p for p in sweep_policies(args.window_sizes, args.fast_scales, args.slow_scales)
+                                if p.name != current.name]
+    else:
+        policies = [RulePolicy(w) for w in args.window_sizes]
+    policies += [ModelPolicy.from_path(path) for path in args.model]
+
+    report = evaluate(batch, policies, pairwise=args.pairwise)
+    _print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
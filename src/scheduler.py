@@ -0,0 +1,243 @@
+"""
+Weakness-aware puzzle scheduling.
+PuzzleScheduler is a drop-in replacement for PuzzleBank (pop(level) returns a
+puzzle dict) that also learns from answers through record():
+- MasteryStats keeps an exponentially weighted accuracy and response time per
+  (level, op), updated one attempt at a time. Operations the learner gets
+  wrong or answers slowly (relative to the level's FAST_THRESH) get a larger
+  weight and are drawn more often.
+- Every answered puzzle goes into a per-(level, op) min-heap keyed on the step
+  at which it is due again: a few steps after a mistake, a doubling interval
+  after each correct answer. Due reviews are served before fresh puzzles.
+- Fresh puzzles are drawn from ItemBank, the operand arrays of every distinct
+  puzzle of a level, by rejection sampling against the served set.
+
+pop() costs O(#ops) to pick the operation plus O(log n) heap work, and the
+heaps only hold puzzles the learner has answered, so a selection stays in the
+microseconds however large the bank is (benchmarks/bench.py scheduler.*).
+The item arrays are built once per process and shared by every learner.
+"""
+
+import heapq
+import itertools
+import random
+
+try:
+    from adaptive_engine import FAST_THRESH
+    from metrics import timed
+    from puzzle_generator import LEVEL_CONFIG, _config_items, _level_items, _make_puzzle, _op_slice, parse_question
+except ImportError:
+    from src.adaptive_engine import FAST_THRESH
+    from src.metrics import timed
+    from src.puzzle_generator import LEVEL_CONFIG, _config_items, _level_items, _make_puzzle, _op_slice, parse_question
+
+MASTERY_ALPHA = 0.3
+# weight of an operation = 1 + ERROR_WEIGHT * error rate + SLOW_WEIGHT * slowness
+ERROR_WEIGHT = 4.0
+SLOW_WEIGHT = 2.0
+# operations without answers yet are treated as weak so each one gets tried early
+UNSEEN_WEIGHT = 3.0
+
+# spacing, in answered puzzles
+RETRY_INTERVAL = 3
+FIRST_INTERVAL = 10
+MAX_INTERVAL = 1000
+
+# fresh draws tried before falling back to reviews when an operation is nearly exhausted
+FRESH_TRIES = 16
+
+# memory_bytes() estimates, measured with tracemalloc: per served operand pair, per
+# answered puzzle, per heap entry (stale ones included) and per (level, op) mastery
+SEEN_BYTES = 64
+ENTRY_BYTES = 170
+HEAP_ENTRY_BYTES = 135
+MASTERY_BYTES = 220
+
+
+class MasteryStats:
+    """EWMA accuracy and response time per (level, op)."""
+
+    def __init__(self, alpha=MASTERY_ALPHA):
+        self.alpha = alpha
+        self._stats = {}  # (level, op) -> [attempts, accuracy, response_time]
+
+    def update(self, level, op, correct, response_time):
+        s = self._stats.get((level, op))
+        if s is None:
+            self._stats[(level, op)] = [1, float(correct), float(response_time)]
+            return
+        s[0] += 1
+        s[1] += self.alpha * (float(correct) - s[1])
+        s[2] += self.alpha * (float(response_time) - s[2])
+
+    def weakness(self, level, op):
+        """Selection weight of an operation; 1.0 for one answered fast and correctly."""
+        s = self._stats.get((level, op))
+        if s is None:
+            return UNSEEN_WEIGHT
+        fast = FAST_THRESH.get(level)
+        slowness = min(max(s[2] / fast - 1.0, 0.0), 1.0) if fast else 0.0
+        return 1.0 + ERROR_WEIGHT * (1.0 - s[1]) + SLOW_WEIGHT * slowness
+
+    def get(self, level, op):
+        s = self._stats.get((level, op))
+        if s is None:
+            return None
+        return {'attempts': s[0], 'accuracy': s[1], 'response_time': s[2],
+                'weight': self.weakness(level, op)}
+
+    def as_dict(self):
+        """{level: {op: {'attempts', 'accuracy', 'response_time', 'weight'}}}"""
+        out = {}
+        for level, op in sorted(self._stats):
+            out.setdefault(level, {})[op] = self.get(level, op)
+        return out
+
+
+class ItemBank:
+    """
+    Operand arrays (a, b) of every distinct puzzle per (level, op), built on
+    first use. Pass a level_config shaped like LEVEL_CONFIG for custom banks.
+    """
+
+    def __init__(self, level_config=None):
+        self.level_config = level_config if level_config is not None else LEVEL_CONFIG
+        self._items = {}
+
+    def _conf(self, level):
+        return self.level_config.get(level, self.level_config.get('easy'))
+
+    def ops(self, level):
+        return self._conf(level)['ops']
+
+    def items(self, level, op):
+        items = self._items.get((level, op))
+        if items is None:
+            conf = self._conf(level)
+            if self.level_config is LEVEL_CONFIG:
+                op_idx, a, b = _level_items(level)
+            else:
+                op_idx, a, b = _config_items(level, conf)
+            start, stop = _op_slice(op_idx, conf['ops'].index(op))
+            items = self._items[(level, op)] = (a[start:stop], b[start:stop])
+        return items
+
+    def size(self, level):
+        return sum(len(self.items(level, op)[0]) for op in self.ops(level))
+
+
+_default_bank = None
+
+
+def default_item_bank():
+    """ItemBank of LEVEL_CONFIG, shared by every scheduler in the process."""
+    global _default_bank
+    if _default_bank is None:
+        _default_bank = ItemBank()
+    return _default_bank
+
+
+class PuzzleScheduler:
+    """
+    Per-learner scheduler over an ItemBank. rng seeds a random.Random; call
+    record() with every answer so weights and spacing follow the learner.
+    """
+
+    def __init__(self, rng=None, bank=None):
+        self.rng = random.Random(rng)
+        self.bank = bank if bank is not None else default_item_bank()
+        self.mastery = MasteryStats()
+        self.step = 0
+        self._due = {}  # (level, op) -> heap of (due_step, seq, operands)
+        self._entries = {}  # (level, op, operands) -> [interval, seq of its live heap entry or None]
+        self._seen = {}  # (level, op) -> operands served in the current cycle
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_attempts(cls, attempts, rng=None, bank=None):
+        """Rebuild a scheduler by replaying Tracker.attempts rows."""
+        scheduler = cls(rng=rng, bank=bank)
+        for row in attempts:
+            parsed = parse_question(row['question'])
+            if parsed:
+                scheduler.record({'level': row['level'], 'op': parsed[0], 'operands': parsed[1]},
+                                 row['correct'], row['response_time'])
+        return scheduler
+
+    def __len__(self):
+        return len(self._entries)
+
+    def memory_bytes(self):
+        """
+        Estimated bytes of this learner's state: served sets, answered puzzles,
+        review heaps (which keep lazily invalidated entries) and mastery stats.
+        """
+        return (SEEN_BYTES * sum(len(seen) for seen in self._seen.values())
+                + ENTRY_BYTES * len(self._entries)
+                + HEAP_ENTRY_BYTES * sum(len(heap) for heap in self._due.values())
+                + MASTERY_BYTES * len(self.mastery._stats))
+
+    def _pick_op(self, level):
+        ops = self.bank.ops(level)
+        if len(ops) == 1:
+            return ops[0]
+        weakness = self.mastery.weakness
+        return self.rng.choices(ops, [weakness(level, op) for op in ops])[0]
+
+    def _pop_review(self, group, due_only=True):
+        # entries are invalidated lazily: one whose seq is not the item's current seq is stale
+        heap = self._due.get(group)
+        while heap and (not due_only or heap[0][0] <= self.step):
+            _, seq, operands = heapq.heappop(heap)
+            entry = self._entries.get(group + (operands,))
+            if entry is not None and entry[1] == seq:
+                entry[1] = None
+                return operands
+        return None
+
+    def _draw_fresh(self, group):
+        a, b = self.bank.items(*group)
+        seen = self._seen.setdefault(group, set())
+        n = len(a)
+        if len(seen) >= n:
+            return None
+        for _ in range(FRESH_TRIES):
+            k = self.rng.randrange(n)
+            operands = (int(a[k]), int(b[k]))
+            if operands not in seen:
+                seen.add(operands)
+                return operands
+        return None
+
+    @timed('scheduler.pop')
+    def pop(self, level='easy'):
+        """Next puzzle for level: a due review of the chosen operation, else a fresh one."""
+        op = self._pick_op(level)
+        group = (level, op)
+        operands = self._pop_review(group)
+        if operands is None:
+            operands = self._draw_fresh(group)
+        if operands is None:
+            # no unseen puzzle left for the op: serve the review due soonest
+            operands = self._pop_review(group, due_only=False)
+        if operands is None:
+            # everything is out being answered; start a new cycle
+            self._seen.pop(group, None)
+            operands = self._draw_fresh(group)
+        return _make_puzzle(level, op, operands[0], operands[1], self.rng.getrandbits(32))
+
+    @timed('scheduler.record')
+    def record(self, puzzle, correct, response_time):
+        """Update mastery and reschedule the puzzle after an answer."""
+        level, op = puzzle['level'], puzzle['op']
+        group = (level, op)
+        operands = tuple(puzzle['operands'])
+        self.step += 1
+        self.mastery.update(level, op, correct, response_time)
+        self._seen.setdefault(group, set()).add(operands)
+        entry = self._entries.get(group + (operands,))
+        if entry is None:
+            entry = self._entries[group + (operands,)] = [FIRST_INTERVAL // 2, None]
+        entry[0] = min(entry[0] * 2, MAX_INTERVAL) if correct else RETRY_INTERVAL
+        entry[1] = seq = next(self._seq)
+        heapq.heappush(self._due.setdefault(group, []), (self.step + entry[0], seq, operands))
@@ -0,0 +1,464 @@
+"""
+Headless learner service.
+LearnerService wraps generate_puzzle (through a per-session PuzzleBank, or a
+weakness-aware PuzzleScheduler with focus_weak, and a prefetcher), Tracker and adaptive_engine.next_level behind four calls:
+start_session, next_puzzle, submit_answer and summary. Sessions live in a
+pluggable session store, so one process can serve many learners with bounded
+memory (InMemorySessionStore keeps sessions under a count and byte budget,
+spilling idle ones to disk if the learner consented to saving data and
+dropping the rest) or several processes can share FileSessionStore.
+memory_stats() reports what the resident sessions cost, for sizing nodes.
+
+`serve` exposes the service as a local asyncio API speaking JSON lines over
+TCP: each request is {"id": ..., "op": "<method>", "args": {...}} and each
+reply is {"id": ..., "ok": true, "result": ...} or {"id": ..., "ok": false,
+"error": "..."}. The Streamlit app uses LearnerService in-process through
+get_service().
+
+Run from project root:
+    python src/service.py --port 8765 --max-sessions 5000 --memory-mb 512 --idle-seconds 1800
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    from adaptive_engine import decide_prepared, next_level
+    from metrics import METRICS
+    from prefetch import PuzzlePrefetcher
+    from puzzle_generator import PuzzleBank, parse_question
+    from scheduler import PuzzleScheduler
+    from session_log import SessionLogWriter
+    from session_store import PURGE_INTERVAL, FileSessionStore, InMemorySessionStore
+    from tracker import Tracker
+except ImportError:
+    from src.adaptive_engine import decide_prepared, next_level
+    from src.metrics import METRICS
+    from src.prefetch import PuzzlePrefetcher
+    from src.puzzle_generator import PuzzleBank, parse_question
+    from src.scheduler import PuzzleScheduler
+    from src.session_log import SessionLogWriter
+    from src.session_store import PURGE_INTERVAL, FileSessionStore, InMemorySessionStore
+    from src.tracker import Tracker
+
+# memory_bytes() estimate, measured with tracemalloc, of a session's fixed objects
+# (puzzle bank/scheduler, prefetch slots, pending puzzle); the bank or scheduler
+# estimates what it remembers about the learner
+SESSION_BASE_BYTES = 8192
+
+
+def check_answer(given, answer):
+    given = str(given).strip()
+    try:
+        return abs(float(given) - float(answer)) < 1e-6
+    except Exception:
+        return given == str(answer)
+
+
+def _public_puzzle(puzzle):
+    # never send the answer to the client before it is submitted
+    return {'id': puzzle['id'], 'question': puzzle['question'], 'level': puzzle['level']}
+
+
+class LearnerSession:
+    """All adaptive state of one learner; snapshots to plain JSON."""
+
+    def __init__(self, session_id, tracker, level='easy', window_size=3, use_ml=False, log_dir=None,
+                 focus_weak=False):
+        self.session_id = session_id
+        self.tracker = tracker
+        self.level = level
+        self.window_size = window_size
+        self.use_ml = use_ml
+        self.log_dir = log_dir
+        self.focus_weak = focus_weak
+        self.pending = None
+        self.issued_at = None
+        self.last_active = time.time()
+        self._prefetcher = None
+
+    @property
+    def prefetcher(self):
+        # the bank is rebuilt lazily after a restore, skipping questions already asked
+        # (the scheduler replays the answers to recover mastery and spacing too)
+        if self._prefetcher is None:
+            if self.focus_weak:
+                self._prefetcher = PuzzlePrefetcher(PuzzleScheduler.from_attempts(self.tracker.attempts))
+                return self._prefetcher
+            bank = PuzzleBank()
+            for row in self.tracker.attempts:
+                parsed = parse_question(row['question'])
+                if parsed:
+                    bank.mark_seen({'level': row['level'], 'op': parsed[0], 'operands': parsed[1]})
+            self._prefetcher = PuzzlePrefetcher(bank)
+        return self._prefetcher
+
+    @property
+    def spillable(self):
+        # only a learner who consented to saving data (save_log) may have their session written to disk
+        return self.log_dir is not None
+
+    def memory_bytes(self):
+        """Estimated bytes this session keeps resident (the store's memory budget counts these)."""
+        size = SESSION_BASE_BYTES + self.tracker.memory_bytes()
+        if self._prefetcher is not None:
+            size += self._prefetcher.bank.memory_bytes()
+        return size
+
+    def open_log(self):
+        if self.log_dir and self.tracker.log is None:
+            self.tracker.log = SessionLogWriter(self.log_dir)
+
+    def close(self, wait=False):
+        """
+        Close the session log (queued records are still written); the session
+        stays usable and reopens it on demand. wait blocks until they are fsynced.
+        """
+        if self.tracker.log is not None:
+            self.tracker.log.close(wait=wait)
+            self.tracker.log = None
+
+    def to_snapshot(self):
+        return {
+            'session_id': self.session_id,
+            'level': self.level,
+            'window_size': self.window_size,
+            'use_ml': self.use_ml,
+            'log_dir': self.log_dir,
+            'focus_weak': self.focus_weak,
+            'pending': self.pending,
+            'issued_at': self.issued_at,
+            'last_active': self.last_active,
+            'tracker': self.tracker.to_snapshot()
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        session = cls(snapshot['session_id'], Tracker.from_snapshot(snapshot['tracker']),
+                      level=snapshot['level'], window_size=snapshot['window_size'],
+                      use_ml=snapshot['use_ml'], log_dir=snapshot.get('log_dir'),
+                      focus_weak=snapshot.get('focus_weak', False))
+        pending = snapshot.get('pending')
+        if pending is not None:
+            pending['operands'] = tuple(pending['operands'])
+        session.pending = pending
+        session.issued_at = snapshot.get('issued_at')
+        session.last_active = snapshot.get('last_active', time.time())
+        return session
+
+
+class LearnerService:
+    def __init__(self, store=None, log_root=os.path.join("data", "logs"), lock_stripes=64):
+        self.store = store if store is not None else InMemorySessionStore(LearnerSession)
+        self.log_root = log_root
+        # striped locks serialize calls on one session without a global lock; reentrant so
+        # a call can still evict another session that happens to share its stripe
+        self._locks = [threading.RLock() for _ in range(lock_stripes)]
+        if hasattr(self.store, 'session_lock'):
+            # so the store does not evict a session while a call below is updating it
+            self.store.session_lock = self._lock
+
+    def _lock(self, session_id):
+        return self._locks[hash(session_id) % len(self._locks)]
+
+    def _get(self, session_id):
+        session = self.store.get(session_id)
+        if session is None:
+            raise KeyError(f"unknown session: {session_id}")
+        return session
+
+    def _put(self, session):
+        session.last_active = time.time()
+        self.store.put(session.session_id, session)
+
+    def start_session(self, user, level='easy', window_size=3, use_ml=False, save_log=False,
+                      focus_weak=False):
+        """
+        Create a session. focus_weak picks puzzles with PuzzleScheduler, favouring
+        operations the learner gets wrong or answers slowly.
+        Returns {'session_id', 'level'}.
+        """
+        session_id = uuid.uuid4().hex
+        log_dir = os.path.join(self.log_root, session_id) if save_log else None
+        tracker = Tracker(log=SessionLogWriter(log_dir) if log_dir else None)
+        tracker.start_session(user)
+        session = LearnerSession(session_id, tracker, level=level, window_size=window_size,
+                                 use_ml=use_ml, log_dir=log_dir, focus_weak=focus_weak)
+        with self._lock(session_id):
+            self._put(session)
+        return {'session_id': session_id, 'level': level}
+
+    def next_puzzle(self, session_id):
+        """
+        The question to show now: {'id', 'question', 'level'}. Repeated calls
+        return the same puzzle until it is answered.
+        """
+        with self._lock(session_id):
+            session = self._get(session_id)
+            if session.pending is None:
+                session.pending = session.prefetcher.take(session.level)
+                session.issued_at = time.time()
+                self._put(session)
+            return _public_puzzle(session.pending)
+
+    def prefetch(self, session_id):
+        """Prepare the puzzles the next decision can lead to (call off the critical path)."""
+        with self._lock(session_id):
+            session = self._get(session_id)
+            session.prefetcher.prepare(session.level, use_ml=session.use_ml,
+                                       tracker=session.tracker, window_size=session.window_size)
+            if not self.store.caches_sessions:
+                self._put(session)
+
+    def submit_answer(self, session_id, answer, response_time=None, window_size=None, use_ml=None):
+        """
+        Record the answer to the pending puzzle and adapt the level.
+        response_time defaults to the time since next_puzzle issued it.
+        Returns {'correct', 'correct_answer', 'response_time', 'previous_level', 'level', 'reason'}.
+        """
+        with self._lock(session_id):
+            session = self._get(session_id)
+            puzzle = session.pending
+            if puzzle is None:
+                raise ValueError("no puzzle pending; call next_puzzle first")
+            if window_size is not None:
+                session.window_size = int(window_size)
+            if use_ml is not None:
+                session.use_ml = bool(use_ml)
+            rt = float(response_time) if response_time is not None else time.time() - session.issued_at
+            correct = check_answer(answer, puzzle['answer'])
+            # taken before recording: a scheduler rebuilt now replays the tracker without this answer
+            scheduler = session.prefetcher.bank if session.focus_weak else None
+
+            session.open_log()
+            session.tracker.record_attempt(puzzle, str(answer).strip(), correct, rt)
+            if scheduler is not None:
+                scheduler.record(puzzle, correct, rt)
+            previous = session.level
+            prepared = session.prefetcher.take_decision_inputs()
+            decision = None
+            if prepared is not None and not session.use_ml:
+                decision = decide_prepared(prepared, session.tracker, previous, session.window_size, correct, rt)
+            if decision is None:
+                decision = next_level(session.tracker, previous,
+                                      window_size=session.window_size, use_ml=session.use_ml)
+            session.level, reason = decision
+            session.pending = None
+            session.issued_at = None
+            self._put(session)
+        return {'correct': correct, 'correct_answer': puzzle['answer'], 'response_time': rt,
+                'previous_level': previous, 'level': session.level, 'reason': reason}
+
+    def summary(self, session_id):
+        """
+        Tracker.summary_view() plus the session's user and current level, and
+        per-(level, op) 'mastery' for focus_weak sessions.
+        """
+        with self._lock(session_id):
+            session = self._get(session_id)
+            view = session.tracker.summary_view()
+            if session.focus_weak:
+                view['mastery'] = session.prefetcher.bank.mastery.as_dict()
+        view.update(session_id=session_id, user=session.tracker.user, level=session.level)
+        return view
+
+    def tracker(self, session_id):
+        """The session's Tracker, for exports (in-process callers only)."""
+        with self._lock(session_id):
+            return self._get(session_id).tracker
+
+    def end_session(self, session_id):
+        """Remove the session from the store and return its Tracker."""
+        with self._lock(session_id):
+            session = self._get(session_id)
+            session.close(wait=True)
+            self.store.delete(session_id)
+        return session.tracker
+
+    def memory_stats(self):
+        """
+        The store's stats() (resident sessions, their estimated bytes, evictions,
+        spilled snapshots) plus the process's current resident set size.
+        """
+        stats = dict(self.store.stats())
+        stats['rss_bytes'] = _rss_bytes()
+        return stats
+
+
+def _rss_bytes():
+    # current (not peak) RSS; only Linux exposes it without psutil
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    """
+    Process-wide service used by the Streamlit app.
+    Configured by ADAPTIVE_MAX_SESSIONS (default 5000), ADAPTIVE_MEMORY_MB
+    (session memory budget, default 512), ADAPTIVE_IDLE_SECONDS (evict
+    sessions idle this long, default 1800; 0 disables), ADAPTIVE_SPILL_DIR
+    (default data/sessions) and ADAPTIVE_SPILL_TTL (delete snapshots older
+    than this, default 86400 seconds; 0 keeps them). Only sessions started
+    with save_log (the app's consent checkbox) are spilled; evicting any
+    other session drops it.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            store = InMemorySessionStore(LearnerSession,
+                                         max_sessions=int(os.environ.get('ADAPTIVE_MAX_SESSIONS', 5000)),
+                                         spill_dir=os.environ.get('ADAPTIVE_SPILL_DIR',
+                                                                  os.path.join("data", "sessions")),
+                                         max_bytes=_megabytes(os.environ.get('ADAPTIVE_MEMORY_MB', 512)),
+                                         idle_seconds=float(os.environ.get('ADAPTIVE_IDLE_SECONDS', 1800)) or None,
+                                         spill_ttl=float(os.environ.get('ADAPTIVE_SPILL_TTL', 86400)) or None)
+            _service = LearnerService(store)
+        return _service
+
+
+def _megabytes(value):
+    value = float(value)
+    return int(value * 1024 * 1024) if value > 0 else None
+
+
+# ---- asyncio JSON-lines API ----
+
+API_METHODS = ('start_session', 'next_puzzle', 'submit_answer', 'summary', 'end_session', 'memory_stats')
+
+
+async def _call(service, op, args):
+    if op not in API_METHODS:
+        raise ValueError(f"unknown op: {op}")
+    fn = getattr(service, op)
+    # any call can restore a snapshot, evict sessions or run the ML model: keep it off the event loop
+    result = await asyncio.get_running_loop().run_in_executor(None, lambda: fn(**args))
+    if op == 'end_session':
+        result = result.get_summary()
+    return result
+
+
+def _prefetch_done(future):
+    # nobody awaits the background prefetch; count its failures instead of leaving them unretrieved
+    if not future.cancelled() and future.exception() is not None:
+        METRICS.record_error('service.prefetch', future.exception())
+
+
+async def _handle(service, reader, writer):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            req_id = None
+            try:
+                req = json.loads(line)
+                req_id = req.get('id')
+                result = await _call(service, req['op'], req.get('args') or {})
+                reply = {'id': req_id, 'ok': True, 'result': result}
+                if req['op'] == 'next_puzzle' and service.store.caches_sessions:
+                    # prepare the following puzzles after the reply is on its way (a store that
+                    # rebuilds sessions from snapshots would throw the prepared puzzles away)
+                    prefetch = loop.run_in_executor(None, service.prefetch, req['args']['session_id'])
+                    prefetch.add_done_callback(_prefetch_done)
+            except Exception as e:
+                reply = {'id': req_id, 'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            writer.write((json.dumps(reply, default=str) + '\n').encode('utf-8'))
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(service=None, host='127.0.0.1', port=8765):
+    """Start the JSON-lines API; returns the asyncio Server."""
+    service = service or get_service()
+    return await asyncio.start_server(lambda r, w: _handle(service, r, w), host, port)
+
+
+async def _sweep(store, interval):
+    # without traffic nothing calls put(), so idle sessions and old snapshots are also swept on a timer
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        await loop.run_in_executor(None, store.sweep)
+
+
+class ServiceClient:
+    """Minimal asyncio client for the JSON-lines API."""
+
+    def __init__(self, host='127.0.0.1', port=8765):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+        self._next_id = 0
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        return self
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+
+    async def call(self, op, **args):
+        self._next_id += 1
+        self._writer.write((json.dumps({'id': self._next_id, 'op': op, 'args': args}) + '\n').encode('utf-8'))
+        await self._writer.drain()
+        reply = json.loads(await self._reader.readline())
+        if not reply['ok']:
+            raise RuntimeError(reply['error'])
+        return reply['result']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-sessions', type=int, default=5000, help="sessions kept in memory")
+    parser.add_argument('--memory-mb', type=float, default=512,
+                        help="memory budget for in-memory sessions (0: no budget)")
+    parser.add_argument('--idle-seconds', type=float, default=1800,
+                        help="evict sessions idle this long (0: never)")
+    parser.add_argument('--spill-ttl', type=float, default=86400,
+                        help="delete spilled snapshots older than this many seconds (0: keep)")
+    parser.add_argument('--spill-dir', default=os.path.join("data", "sessions"),
+                        help="where evicted sessions of consenting learners are spilled (in-memory store)")
+    parser.add_argument('--shared-dir', default=None,
+                        help="use a file-backed shared store in this directory instead")
+    args = parser.parse_args(argv)
+
+    if args.shared_dir:
+        store = FileSessionStore(LearnerSession, args.shared_dir)
+    else:
+        store = InMemorySessionStore(LearnerSession, max_sessions=args.max_sessions, spill_dir=args.spill_dir,
+                                     max_bytes=_megabytes(args.memory_mb), idle_seconds=args.idle_seconds or None,
+                                     spill_ttl=args.spill_ttl or None)
+
+    async def run():
+        server = await serve(LearnerService(store), args.host, args.port)
+        if hasattr(store, 'sweep'):
+            interval = min(store.idle_seconds or PURGE_INTERVAL, PURGE_INTERVAL * 4) / 4
+            asyncio.get_running_loop().create_task(_sweep(store, max(1.0, interval)))
+        print(f"Learner service listening on {args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
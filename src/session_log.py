@@ -0,0 +1,224 @@
+"""
+Append-only, line-delimited session log.
+Tracker.record_attempt hands each attempt to a SessionLogWriter, which only
+queues it. One log thread per process drains the queue for every open log:
+it batches records into JSON lines, flushes them, fsyncs each log at most
+every `fsync_interval` seconds and rotates to a new segment file once the
+current one passes `max_segment_bytes`. A log holds its file only until the
+next fsync, so an idle session costs no thread, no file handle and no wakeups.
+read_session_log rebuilds a Tracker from whatever made it to disk, so a
+crashed or abandoned session keeps everything up to its last flush.
+"""
+
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    from tracker import Tracker
+except ImportError:
+    from src.tracker import Tracker
+
+SEGMENT_PATTERN = "segment-*.jsonl"
+# most records the log thread takes off the queue per write pass
+BATCH_SIZE = 512
+
+_CLOSE = object()
+_FLUSH = object()
+
+
+def _segment_path(directory, index):
+    return os.path.join(directory, f"segment-{index:06d}.jsonl")
+
+
+def list_segments(directory):
+    return sorted(glob.glob(os.path.join(directory, SEGMENT_PATTERN)))
+
+
+class SessionLogWriter:
+    def __init__(self, directory, fsync_interval=1.0, max_segment_bytes=4 * 1024 * 1024):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.max_segment_bytes = max_segment_bytes
+        # held while checking _closed and queueing, so no record can land behind _CLOSE
+        self._lock = threading.Lock()
+        self._closed = False
+        self._done = threading.Event()
+        self.records_written = 0
+        self.error = None
+
+    def append(self, record):
+        """Queue one JSON-serializable record; returns immediately. Raises ValueError once closed."""
+        with self._lock:
+            if self._closed:
+                raise ValueError("session log is closed")
+            _log_thread().put((self, record))
+
+    def close(self, wait=True):
+        """Stop taking records; with wait, block until everything queued is written and fsynced."""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                _log_thread().put((self, _CLOSE))
+        if wait:
+            self._done.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Segment:
+    __slots__ = ('file', 'index', 'fsync_due')
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        existing = list_segments(directory)
+        self.index = int(os.path.basename(existing[-1])[8:14]) if existing else 0
+        self.file = open(_segment_path(directory, self.index), 'a', encoding='utf-8')
+        self.fsync_due = None
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.fsync_due = None
+
+
+class _LogThread:
+    """Writes the records of every SessionLogWriter in the process, in queue order."""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        # directory -> _Segment with records not yet fsynced; closed once they are
+        self._open = {}
+        self._thread = threading.Thread(target=self._run, name="session-log-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, item):
+        self._queue.put(item)
+
+    def _run(self):
+        while True:
+            # block without a timeout unless some log is waiting for its fsync
+            timeout = None
+            if self._open:
+                timeout = max(0.0, min(seg.fsync_due for seg in self._open.values()) - time.monotonic())
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records, closing, flushed = {}, [], []
+            for log, record in batch:
+                if record is _FLUSH:
+                    flushed.append(log)
+                elif record is _CLOSE:
+                    closing.append(log)
+                else:
+                    records.setdefault(log, []).append(record)
+            for log, items in records.items():
+                self._guard(log, self._write, log, items)
+            for log in closing:
+                self._guard(log, self._release, log.directory)
+                log._done.set()
+            for event in flushed:
+                for directory in list(self._open):
+                    self._guard(None, self._release, directory)
+                event.set()
+            now = time.monotonic()
+            for directory in [d for d, seg in self._open.items() if seg.fsync_due <= now]:
+                self._guard(None, self._release, directory)
+
+    def _guard(self, log, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            # keep the app running; the error is surfaced on the writer
+            if log is not None:
+                log.error = e
+            seg = self._open.pop(log.directory if log is not None else args[0], None)
+            if seg is not None:
+                seg.file.close()
+
+    def _write(self, log, records):
+        seg = self._open.get(log.directory)
+        if seg is None:
+            seg = self._open[log.directory] = _Segment(log.directory)
+        seg.file.write(''.join(json.dumps(r, default=str) + '\n' for r in records))
+        seg.file.flush()
+        log.records_written += len(records)
+        if seg.fsync_due is None:
+            seg.fsync_due = time.monotonic() + log.fsync_interval
+        if seg.file.tell() >= log.max_segment_bytes:
+            seg.sync()
+            seg.file.close()
+            seg.index += 1
+            seg.file = open(_segment_path(log.directory, seg.index), 'a', encoding='utf-8')
+            seg.fsync_due = time.monotonic() + log.fsync_interval
+
+    def _release(self, directory):
+        seg = self._open.pop(directory, None)
+        if seg is not None:
+            try:
+                seg.sync()
+            finally:
+                seg.file.close()
+
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def _log_thread():
+    global _thread
+    if _thread is None:
+        with _thread_lock:
+            if _thread is None:
+                _thread = _LogThread()
+                # logs closed without waiting (evicted sessions) still reach the disk on exit
+                atexit.register(flush_logs)
+    return _thread
+
+
+def flush_logs():
+    """Block until every record queued so far, by any log, is written and fsynced."""
+    if _thread is not None:
+        done = threading.Event()
+        _thread.put((done, _FLUSH))
+        done.wait()
+
+
+def iter_log_records(directory):
+    """Yield records from every segment in order, skipping a torn last line."""
+    for path in list_segments(directory):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # partial write from a crash
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def read_session_log(directory):
+    """Rebuild a Tracker from a (possibly partial) session log directory."""
+    tracker = Tracker()
+    for record in iter_log_records(directory):
+        kind = record.get('type')
+        if kind == 'session':
+            tracker.user = record.get('user')
+            tracker.session_start = record.get('started_at')
+        elif kind == 'attempt':
+            tracker.restore_attempt(record)
+    return tracker
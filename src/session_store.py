@@ -0,0 +1,343 @@
+"""
+Pluggable stores for learner sessions.
+A session object only needs to_snapshot() (JSON-serializable), a
+from_snapshot() classmethod and, optionally, close() to release resources
+when it leaves memory.
+
+- InMemorySessionStore keeps at most `max_sessions` sessions, and at most
+  `max_bytes` of them by the sessions' memory_bytes() estimates, in an LRU
+  order. It spills the least recently used ones, and any left untouched for
+  `idle_seconds`, to gzip'd JSON snapshots on disk, restoring them
+  transparently on the next get(). Sessions whose `spillable` attribute is
+  false (learners who did not consent to saving data) are dropped instead
+  of written, and snapshots older than `spill_ttl` seconds are deleted.
+  Snapshots are written, and expired ones purged, by a background thread,
+  so an eviction never puts a gzip write on the caller's path; until the
+  write lands the evicted session is still served from memory; if it
+  fails, the session is dropped and counted in `drops`. Disk work
+  that must stay on the caller's path (restoring a snapshot) runs outside
+  the store's lock, so it never stalls calls for other sessions.
+- FileSessionStore keeps every session only on disk; it stands in for a
+  shared store (e.g. Redis) that several processes can use.
+"""
+
+import gzip
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# how often put() looks for expired snapshots (seconds)
+PURGE_INTERVAL = 300
+
+
+def _snapshot_path(directory, session_id):
+    return os.path.join(directory, f"{session_id}.json.gz")
+
+
+def write_snapshot(path, snapshot):
+    tmp = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    try:
+        with gzip.open(tmp, 'wt', encoding='utf-8', compresslevel=1) as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def read_snapshot(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class InMemorySessionStore:
+    # returned objects are live; callers serialize calls per session (LearnerService's locks do)
+    caches_sessions = True
+
+    def __init__(self, session_cls, max_sessions=10000, spill_dir=None, max_bytes=None,
+                 idle_seconds=None, spill_ttl=None, clock=time.monotonic):
+        self.session_cls = session_cls
+        self.max_sessions = max_sessions
+        self.spill_dir = spill_dir
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.spill_ttl = spill_ttl
+        self.clock = clock
+        self._next_purge = 0.0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._sessions = OrderedDict()
+        # session_id -> [memory_bytes() at the last put, clock() at the last get/put]
+        self._meta = {}
+        self._lock = threading.RLock()
+        # optional session_id -> lock held while a request works on that session (set by
+        # LearnerService); evictions skip sessions whose lock is taken
+        self.session_lock = None
+        # session_id -> (token, session) evicted to disk whose snapshot is still being written
+        self._spilling = {}
+        self._tokens = itertools.count()
+        self._writer = None
+        self.bytes = 0
+        self.evictions = 0
+        self.idle_evictions = 0
+        self.drops = 0
+        self.purged = 0
+        self.restores = 0
+        self.spill_errors = 0
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                self._meta[session_id][1] = self.clock()
+                return session
+            if not self.spill_dir:
+                return None
+            spilling = self._spilling.pop(session_id, None)
+            if spilling is not None:
+                # back before its snapshot landed; the writer removes the file
+                self.restores += 1
+                self._insert(session_id, spilling[1])
+                return spilling[1]
+        path = _snapshot_path(self.spill_dir, session_id)
+        try:
+            session = self.session_cls.from_snapshot(read_snapshot(path))
+            os.remove(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            resident = self._sessions.get(session_id)
+            if resident is not None:
+                # restored by a concurrent get() meanwhile
+                return resident
+            self.restores += 1
+            self._insert(session_id, session)
+        return session
+
+    def put(self, session_id, session):
+        with self._lock:
+            self._insert(session_id, session)
+
+    def _insert(self, session_id, session):
+        now = self.clock()
+        size = session.memory_bytes() if hasattr(session, 'memory_bytes') else 0
+        meta = self._meta.get(session_id)
+        self.bytes += size - (meta[0] if meta else 0)
+        self._meta[session_id] = [size, now]
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        self.evict_idle(now)
+        if self.spill_ttl is not None and now >= self._next_purge:
+            self._next_purge = now + PURGE_INTERVAL
+            self._background(self.purge_spilled)
+        # the session just stored (last) is never evicted, even if it alone is over budget
+        attempts = len(self._sessions) - 1
+        while attempts > 0 and (len(self._sessions) > self.max_sessions or
+                                (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            attempts -= 1
+            victim = next(iter(self._sessions))
+            if not self._try_evict(victim):
+                # a request is working on it, so it is not the least recently used
+                self._sessions.move_to_end(victim)
+
+    def evict_idle(self, now=None):
+        """Evict every session not used for idle_seconds; returns how many. Cheap when none are idle."""
+        if self.idle_seconds is None:
+            return 0
+        evicted = 0
+        with self._lock:
+            now = self.clock() if now is None else now
+            # LRU order is last-use order, so the idle sessions are a prefix
+            while self._sessions:
+                session_id = next(iter(self._sessions))
+                if now - self._meta[session_id][1] < self.idle_seconds:
+                    break
+                if self._try_evict(session_id):
+                    evicted += 1
+                else:
+                    # in use right now: not idle
+                    self._sessions.move_to_end(session_id)
+                    self._meta[session_id][1] = now
+            self.idle_evictions += evicted
+        return evicted
+
+    def purge_spilled(self, now=None):
+        """Delete snapshots not written for spill_ttl seconds (abandoned sessions); returns how many."""
+        if not self.spill_dir or self.spill_ttl is None:
+            return 0
+        cutoff = (time.time() if now is None else now) - self.spill_ttl
+        removed = 0
+        for entry in os.scandir(self.spill_dir):
+            try:
+                if entry.name.endswith('.json.gz') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.purged += removed
+        return removed
+
+    def sweep(self):
+        """evict_idle() and purge_spilled(), for a periodic timer when there is no traffic."""
+        return self.evict_idle(), self.purge_spilled()
+
+    def _try_evict(self, session_id):
+        # never snapshot a session in the middle of a request: its update would be lost
+        lock = self.session_lock(session_id) if self.session_lock is not None else None
+        if lock is not None and not lock.acquire(blocking=False):
+            return False
+        try:
+            return self.evict(session_id)
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def evict(self, session_id):
+        """
+        Move one session out of memory: to disk if spill_dir is set and the
+        session is spillable, else drop it. The store's own evictions skip
+        sessions whose session_lock is held; callers of evict() must make sure
+        no request is using the session.
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self.bytes -= self._meta.pop(session_id)[0]
+            if self.spill_dir and getattr(session, 'spillable', True):
+                token = next(self._tokens)
+                self._spilling[session_id] = (token, session)
+                self._background(self._write_spill, session_id, token, session.to_snapshot())
+            else:
+                self.drops += 1
+            # must not block: it runs under the store's lock
+            close = getattr(session, 'close', None)
+            if close is not None:
+                close()
+            self.evictions += 1
+            return True
+
+    def _background(self, fn, *args):
+        if self._writer is None:
+            # one thread: writes of the same session land in eviction order
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='session-spill')
+        self._writer.submit(fn, *args)
+
+    def _write_spill(self, session_id, token, snapshot):
+        path = _snapshot_path(self.spill_dir, session_id)
+        try:
+            write_snapshot(path, snapshot)
+        except Exception:
+            with self._lock:
+                self.spill_errors += 1
+                entry = self._spilling.get(session_id)
+                if entry is not None and entry[0] == token:
+                    # keeping it would hold memory outside the budget: drop it like a
+                    # session without consent (its session log still has the attempts)
+                    del self._spilling[session_id]
+                    self.drops += 1
+            return
+        with self._lock:
+            entry = self._spilling.get(session_id)
+            if entry is None:
+                # restored or deleted while it was being written
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            elif entry[0] == token:
+                del self._spilling[session_id]
+
+    def flush(self):
+        """Wait until every snapshot queued so far is on disk."""
+        if self._writer is not None:
+            self._writer.submit(lambda: None).result()
+
+    def delete(self, session_id):
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                self.bytes -= self._meta.pop(session_id)[0]
+            self._spilling.pop(session_id, None)
+        if self.spill_dir:
+            try:
+                os.remove(_snapshot_path(self.spill_dir, session_id))
+            except FileNotFoundError:
+                pass
+
+    def __contains__(self, session_id):
+        with self._lock:
+            if session_id in self._sessions or session_id in self._spilling:
+                return True
+        return bool(self.spill_dir) and os.path.exists(_snapshot_path(self.spill_dir, session_id))
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def spilled(self):
+        """Number of sessions currently snapshotted in spill_dir."""
+        if not self.spill_dir:
+            return 0
+        return sum(1 for name in os.listdir(self.spill_dir) if name.endswith('.json.gz'))
+
+    def stats(self):
+        """
+        Resident sessions and their estimated bytes against the limits, plus
+        eviction/drop/restore/purge counters and the number of spilled snapshots.
+        """
+        with self._lock:
+            n = len(self._sessions)
+            stats = {'in_memory': n, 'max_sessions': self.max_sessions,
+                     'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                     'avg_session_bytes': self.bytes / n if n else 0.0,
+                     'idle_seconds': self.idle_seconds,
+                     'evictions': self.evictions, 'idle_evictions': self.idle_evictions,
+                     'drops': self.drops, 'restores': self.restores,
+                     'spilling': len(self._spilling), 'spill_errors': self.spill_errors,
+                     'spill_ttl': self.spill_ttl, 'purged': self.purged}
+        stats['spilled'] = self.spilled()
+        return stats
+
+
+class FileSessionStore:
+    # every get() builds a fresh object from disk, so callers must put() changes back
+    caches_sessions = False
+
+    def __init__(self, session_cls, directory):
+        self.session_cls = session_cls
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, session_id):
+        try:
+            snapshot = read_snapshot(_snapshot_path(self.directory, session_id))
+        except FileNotFoundError:
+            return None
+        return self.session_cls.from_snapshot(snapshot)
+
+    def put(self, session_id, session):
+        write_snapshot(_snapshot_path(self.directory, session_id), session.to_snapshot())
+
+    def delete(self, session_id):
+        try:
+            os.remove(_snapshot_path(self.directory, session_id))
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, session_id):
+        return os.path.exists(_snapshot_path(self.directory, session_id))
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory) if name.endswith('.json.gz'))
+
+    def stats(self):
+        return {'on_disk': len(self)}
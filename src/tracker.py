@@ -1,53 +1,291 @@
+import sys
 import time
-import pandas as pd
+from array import array
+from collections import deque
+from collections.abc import Sequence
+
+try:
+    from metrics import timed
+except ImportError:
+    from src.metrics import timed
+
+# largest adaptive window served from the ring buffer (matches the app slider)
+WINDOW_CAPACITY = 6
+# recent rows kept ready for the summary panel
+TAIL_SIZE = 8
+# rough fixed cost of a Tracker (object, empty columns, ring, tail dicts) for memory_bytes()
+TRACKER_BASE_BYTES = 4096
+
+COLUMNS = ['timestamp', 'question_id', 'question', 'level', 'correct',
+           'given_answer', 'correct_answer', 'response_time']
+
+
+class AttemptsView(Sequence):
+    """Read-only list-of-dicts view over the tracker columns; rows are built on access."""
+
+    def __init__(self, tracker):
+        self._tracker = tracker
+
+    def __len__(self):
+        return len(self._tracker._correct)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._tracker._row(j) for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("attempt index out of range")
+        return self._tracker._row(i)
+
+    def __repr__(self):
+        return f"AttemptsView({len(self)} attempts)"
+
 
 class Tracker:
-    def __init__(self):
-        self.attempts = []  
+    def __init__(self, window_capacity=WINDOW_CAPACITY, log=None, tail_size=TAIL_SIZE):
+        self.window_capacity = window_capacity
+        self.tail_size = tail_size
         self.session_start = None
         self.user = None
+        # optional append-only sink (e.g. session_log.SessionLogWriter)
+        self.log = log
+        self._reset()
+
+    def _reset(self):
+        # columnar attempt store
+        self._timestamp = array('d')
+        self._question_id = []
+        self._question = []
+        self._level = array('b')
+        self._level_names = []
+        self._correct = array('b')
+        self._given_answer = []
+        self._correct_answer = []
+        self._response_time = array('d')
+        # sizes of the per-row Python objects, kept as rows are appended (see memory_bytes)
+        self._object_bytes = 0
+        # running totals
+        self._num_correct = 0
+        self._total_rt = 0.0
+        self._streak = 0
+        # ring buffer of the last window_capacity (correct, response_time)
+        self._ring_correct = array('b', [0] * self.window_capacity)
+        self._ring_rt = array('d', [0.0] * self.window_capacity)
+        self._ring_pos = 0
+        # incremental summary view
+        self._level_counts = {}
+        self._tail = deque(maxlen=self.tail_size)
 
     def start_session(self, user_name):
         self.user = user_name
         self.session_start = time.time()
-        self.attempts = []
+        self._reset()
+        if self.log is not None:
+            self.log.append({'type': 'session', 'user': self.user, 'started_at': self.session_start})
+
+    @property
+    def attempts(self):
+        return AttemptsView(self)
 
+    @timed('tracker.record_attempt')
     def record_attempt(self, puzzle, given_answer, correct, response_time):
-        entry = {
-            'timestamp': time.time(),
-            'question_id': puzzle['id'],
-            'question': puzzle['question'],
-            'level': puzzle['level'],
-            'correct': bool(correct),
-            'given_answer': given_answer,
-            'correct_answer': puzzle['answer'],
-            'response_time': float(response_time)
+        row = self._append(time.time(), puzzle['id'], puzzle['question'], puzzle['level'],
+                           correct, given_answer, puzzle['answer'], response_time)
+        if self.log is not None:
+            self.log.append(dict(row, type='attempt'))
+
+    def restore_attempt(self, row):
+        """Append an attempt row (as produced by attempts/export) without logging it."""
+        self._append(row['timestamp'], row['question_id'], row['question'], row['level'],
+                     row['correct'], row['given_answer'], row['correct_answer'], row['response_time'])
+
+    def _append(self, timestamp, question_id, question, level, correct,
+                given_answer, correct_answer, response_time):
+        correct = bool(correct)
+        response_time = float(response_time)
+        try:
+            level_code = self._level_names.index(level)
+        except ValueError:
+            self._level_names.append(level)
+            level_code = len(self._level_names) - 1
+
+        self._timestamp.append(timestamp)
+        self._question_id.append(question_id)
+        self._question.append(question)
+        self._level.append(level_code)
+        self._correct.append(correct)
+        self._given_answer.append(given_answer)
+        self._correct_answer.append(correct_answer)
+        self._response_time.append(response_time)
+        self._object_bytes += (sys.getsizeof(question_id) + sys.getsizeof(question)
+                               + sys.getsizeof(given_answer) + sys.getsizeof(correct_answer))
+
+        self._num_correct += correct
+        self._total_rt += response_time
+        self._streak = self._streak + 1 if correct else 0
+        if self.window_capacity:
+            self._ring_correct[self._ring_pos] = correct
+            self._ring_rt[self._ring_pos] = response_time
+            self._ring_pos = (self._ring_pos + 1) % self.window_capacity
+        self._level_counts[level] = self._level_counts.get(level, 0) + 1
+        row = self._row(-1)
+        self._tail.append(row)
+        return row
+
+    def _row(self, i):
+        return {
+            'timestamp': self._timestamp[i],
+            'question_id': self._question_id[i],
+            'question': self._question[i],
+            'level': self._level_names[self._level[i]],
+            'correct': bool(self._correct[i]),
+            'given_answer': self._given_answer[i],
+            'correct_answer': self._correct_answer[i],
+            'response_time': self._response_time[i]
         }
-        self.attempts.append(entry)
+
+    def _window(self, n):
+        """Return (correct, response_time) sequences for the last n attempts, oldest first."""
+        count = min(n, len(self._correct))
+        if count <= 0:
+            return (), ()
+        if count > self.window_capacity:
+            return self._correct[-count:], self._response_time[-count:]
+        idx = [(self._ring_pos - count + k) % self.window_capacity for k in range(count)]
+        return [self._ring_correct[j] for j in idx], [self._ring_rt[j] for j in idx]
+
+    def window_stats(self, n=3):
+        """
+        Sums over the last n attempts without padding:
+        returns (count, num_correct, sum_response_time, streak).
+        """
+        correct, rts = self._window(n)
+        count = len(correct)
+        return count, sum(correct), sum(rts), min(self._streak, count)
+
+    def window_features(self, window_size=3, pad_rt=999.0):
+        """
+        [window_accuracy, avg_response_time, streak_correct] over the last
+        window_size attempts, front-padded with incorrect answers taking
+        pad_rt seconds when there is not enough history.
+        """
+        if window_size <= 0:
+            return [0.0, pad_rt, 0]
+        correct, rts = self._window(window_size)
+        pad = window_size - len(correct)
+        rt_sum = 0.0
+        for _ in range(pad):
+            rt_sum += pad_rt
+        for rt in rts:
+            rt_sum += rt
+        return [sum(correct) / window_size, rt_sum / window_size, min(self._streak, len(correct))]
 
     def last_n(self, n=3):
-        return self.attempts[-n:] if len(self.attempts) >= 1 else []
+        if not self._correct:
+            return []
+        return self.attempts[-n:]
 
     def accuracy(self):
-        if not self.attempts: return 0.0
-        return sum(1 for a in self.attempts if a['correct']) / len(self.attempts)
+        if not self._correct: return 0.0
+        return self._num_correct / len(self._correct)
 
     def avg_response_time(self):
-        if not self.attempts: return 0.0
-        return sum(a['response_time'] for a in self.attempts) / len(self.attempts)
+        if not self._correct: return 0.0
+        return self._total_rt / len(self._correct)
+
+    def summary_view(self):
+        """
+        Session summary kept up to date on every attempt, so rendering it does
+        not depend on session length: attempts, accuracy, avg_response_time,
+        level_counts ({level: attempts}) and recent (last tail_size rows, oldest first).
+        """
+        return {
+            'attempts': len(self._correct),
+            'accuracy': self.accuracy(),
+            'avg_response_time': self.avg_response_time(),
+            'level_counts': dict(self._level_counts),
+            'recent': [dict(row) for row in self._tail]
+        }
+
+    def memory_bytes(self):
+        """
+        Estimated bytes held by the attempt store: the typed columns, the list
+        slots and the per-row strings/answers, without walking the rows.
+        """
+        n = len(self._correct)
+        columns = sum(col.itemsize * len(col) for col in
+                      (self._timestamp, self._level, self._correct, self._response_time))
+        return TRACKER_BASE_BYTES + columns + 4 * 8 * n + self._object_bytes
 
     def difficulty_history(self):
-        return [a['level'] for a in self.attempts]
+        return [self._level_names[c] for c in self._level]
 
     def to_dataframe(self):
-        return pd.DataFrame(self.attempts)
+        import pandas as pd  # only needed for export
+        if not self._correct:
+            return pd.DataFrame()
+        return pd.DataFrame({
+            'timestamp': self._timestamp.tolist(),
+            'question_id': self._question_id,
+            'question': self._question,
+            'level': self.difficulty_history(),
+            'correct': [bool(c) for c in self._correct],
+            'given_answer': self._given_answer,
+            'correct_answer': self._correct_answer,
+            'response_time': self._response_time.tolist()
+        }, columns=COLUMNS)
+
+    def iter_rows(self):
+        """Attempt rows as tuples in COLUMNS order, one at a time (for streaming exports)."""
+        names = self._level_names
+        for ts, qid, question, level, correct, given, answer, rt in zip(
+                self._timestamp, self._question_id, self._question, self._level, self._correct,
+                self._given_answer, self._correct_answer, self._response_time):
+            yield ts, qid, question, names[level], bool(correct), given, answer, rt
 
-    def get_summary(self):
+    def to_snapshot(self):
+        """Compact, JSON-serializable state: session info plus the attempt columns."""
         return {
+            'user': self.user,
+            'session_start': self.session_start,
+            'window_capacity': self.window_capacity,
+            'tail_size': self.tail_size,
+            'columns': {
+                'timestamp': self._timestamp.tolist(),
+                'question_id': list(self._question_id),
+                'question': list(self._question),
+                'level': self.difficulty_history(),
+                'correct': [bool(c) for c in self._correct],
+                'given_answer': list(self._given_answer),
+                'correct_answer': list(self._correct_answer),
+                'response_time': self._response_time.tolist()
+            }
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot, log=None):
+        """Rebuild a Tracker (running totals, window ring, summary view) from to_snapshot()."""
+        tracker = cls(window_capacity=snapshot.get('window_capacity', WINDOW_CAPACITY),
+                      tail_size=snapshot.get('tail_size', TAIL_SIZE))
+        tracker.user = snapshot.get('user')
+        tracker.session_start = snapshot.get('session_start')
+        cols = snapshot['columns']
+        for row in zip(*(cols[name] for name in COLUMNS)):
+            tracker._append(*row)
+        tracker.log = log
+        return tracker
+
+    def get_summary(self, include_attempts=True):
+        """Session totals; include_attempts=False leaves the rows to a separate export."""
+        summary = {
             'user': self.user,
             'started_at': self.session_start,
-            'num_attempts': len(self.attempts),
+            'num_attempts': len(self._correct),
             'accuracy': self.accuracy(),
             'avg_response_time': self.avg_response_time(),
-            'attempts': self.attempts
         }
+        if include_attempts:
+            summary['attempts'] = list(self.attempts)
+        return summary
@@ -1,15 +1,22 @@
 """
 Train a small adaptive decision model using simulated user sessions.
 Saves model to models/adaptive_tree.pkl and a small metadata file.
+
+With --incremental, trains out of core on real sessions instead: saved
+data/session_*.csv files are streamed in batches into an incrementally
+trained model (models/adaptive_incremental.pkl). A checkpoint records how
+much of each file was already learned from, so re-running only processes
+new data.
 """
+import argparse
+import csv
+import glob
 import os
 import random
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import pandas as pd
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
-import joblib
+# pandas, sklearn and joblib are imported where they are used, so that importing
+# this module for SKILL_PROFILES or the simulators stays cheap.
 
 # Simple feature extractor from a sliding window of attempts
 def make_features_from_window(window, current_level):
@@ -27,14 +34,25 @@ def make_features_from_window(window, current_level):
     level_code = level_map.get(current_level, 0)
     return [window_accuracy, avg_rt, streak, level_code]
 
+SKILL_PROFILES = {
+    'low':  (0.4, 15.0),
+    'medium':(0.7, 10.0),
+    'high': (0.9, 6.0)
+}
+
+LEVELS = ['easy','medium','hard']
+SKILLS = ['low','medium','high']
+FEATURES = ['window_acc','avg_rt','streak','level_code']
+
+FAST = {'easy':8.0,'medium':12.0,'hard':20.0}
+SLOW = {'easy':15.0,'medium':20.0,'hard':30.0}
+
+# sessions simulated per RNG stream; fixed so output does not depend on n_jobs
+SHARD_SIZE = 4096
+
 def simulate_session(skill_level='medium', session_length=20):
 
-    profile = {
-        'low':  (0.4, 15.0),   
-        'medium':(0.7, 10.0),
-        'high': (0.9, 6.0)
-    }[skill_level]
-    p_correct, avg_rt = profile
+    p_correct, avg_rt = SKILL_PROFILES[skill_level]
     attempts = []
     for i in range(session_length):
         correct = random.random() < p_correct
@@ -45,22 +63,23 @@ def simulate_session(skill_level='medium', session_length=20):
 def label_action_from_window(window, current_level):
     acc = sum(1 for w in window if w['correct']) / len(window)
     avg_rt = sum(w['response_time'] for w in window) / len(window)
-    FAST = {'easy':8.0,'medium':12.0,'hard':20.0}
-    SLOW = {'easy':15.0,'medium':20.0,'hard':30.0}
     if acc >= 0.8 and avg_rt <= FAST[current_level]:
         return 1
     if acc <= 0.5 or avg_rt >= SLOW[current_level]:
         return -1
     return 0
 
-def generate_dataset(num_sessions=2000, window_size=3):
+def generate_dataset_reference(num_sessions=2000, window_size=3):
+    """
+    Pure-Python generator built on the per-window functions above.
+    Kept as the reference the vectorized generate_dataset is checked against.
+    """
+    import pandas as pd
     X = []
     y = []
-    levels = ['easy','medium','hard']
-    skills = ['low','medium','high']
     for _ in range(num_sessions):
-        skill = random.choice(skills)
-        current_level = random.choice(levels)
+        skill = random.choice(SKILLS)
+        current_level = random.choice(LEVELS)
         attempts = simulate_session(skill, session_length=20)
         for i in range(window_size, len(attempts)+1):
             window = attempts[i-window_size:i]
@@ -68,12 +87,305 @@ def generate_dataset(num_sessions=2000, window_size=3):
             act = label_action_from_window(window, current_level)
             X.append(feat)
             y.append(act)
-    return pd.DataFrame(X, columns=['window_acc','avg_rt','streak','level_code']), pd.Series(y, name='action')
+    return pd.DataFrame(X, columns=FEATURES), pd.Series(y, name='action')
+
+def simulate_sessions(num_sessions, session_length=20, rng=None):
+    """
+    Simulate a batch of sessions at once.
+    Returns (skill_code, level_code, correct, response_time); the last two are
+    (num_sessions, session_length) matrices, codes index SKILLS / LEVELS.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    skill_code = rng.integers(0, len(SKILLS), size=num_sessions)
+    level_code = rng.integers(0, len(LEVELS), size=num_sessions)
+    p_correct = np.array([SKILL_PROFILES[s][0] for s in SKILLS])[skill_code]
+    mean_rt = np.array([SKILL_PROFILES[s][1] for s in SKILLS])[skill_code]
+    correct = rng.random((num_sessions, session_length)) < p_correct[:, None]
+    rt = rng.normal(mean_rt[:, None], mean_rt[:, None] * 0.3, size=(num_sessions, session_length))
+    return skill_code, level_code, correct, np.maximum(0.5, rt)
+
+def window_features(correct, response_time, level_code, window_size=3):
+    """
+    Vectorized make_features_from_window + label_action_from_window over every
+    sliding window of every session.
+    Returns X with FEATURES columns and y, ordered session by session.
+    """
+    n_sessions, length = correct.shape
+    n_windows = length - window_size + 1
+    if n_sessions == 0 or n_windows <= 0:
+        return np.empty((0, len(FEATURES))), np.empty(0, dtype=np.int64)
+    win_c = np.lib.stride_tricks.sliding_window_view(correct, window_size, axis=1)
+    win_rt = np.lib.stride_tricks.sliding_window_view(response_time, window_size, axis=1)
+
+    # accumulate left to right so sums match the reference bit for bit
+    n_correct = np.zeros(win_c.shape[:2], dtype=np.int64)
+    rt_sum = np.zeros(win_rt.shape[:2])
+    for k in range(window_size):
+        n_correct += win_c[..., k]
+        rt_sum += win_rt[..., k]
+    acc = n_correct / window_size
+    avg_rt = rt_sum / window_size
+
+    # trailing run of correct answers: index of the last miss, counted from the end
+    tail = win_c[..., ::-1]
+    streak = np.where(tail.all(axis=-1), window_size, np.argmin(tail, axis=-1))
+
+    levels = np.broadcast_to(level_code[:, None], acc.shape)
+    fast = np.array([FAST[l] for l in LEVELS])[levels]
+    slow = np.array([SLOW[l] for l in LEVELS])[levels]
+    action = np.where((acc >= 0.8) & (avg_rt <= fast), 1,
+                      np.where((acc <= 0.5) | (avg_rt >= slow), -1, 0))
+
+    X = np.column_stack([acc.ravel(), avg_rt.ravel(), streak.ravel(), levels.ravel()])
+    return X, action.ravel()
+
+def _generate_shard(args):
+    seed_seq, num_sessions, window_size, session_length = args
+    rng = np.random.default_rng(seed_seq)
+    _, level_code, correct, rt = simulate_sessions(num_sessions, session_length, rng)
+    return window_features(correct, rt, level_code, window_size)
+
+def generate_dataset(num_sessions=2000, window_size=3, seed=None, n_jobs=1, session_length=20):
+    """
+    Vectorized dataset generator.
+    Sessions are split into SHARD_SIZE shards, each with its own RNG stream
+    spawned from `seed`, so the result for a given seed is identical whatever
+    n_jobs is. n_jobs > 1 simulates shards in a process pool.
+    """
+    import pandas as pd
+    seed_seq = np.random.SeedSequence(seed)
+    sizes = [min(SHARD_SIZE, num_sessions - start) for start in range(0, num_sessions, SHARD_SIZE)]
+    tasks = [(child, size, window_size, session_length)
+             for child, size in zip(seed_seq.spawn(len(sizes)), sizes)]
+    if n_jobs and n_jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as pool:
+            parts = list(pool.map(_generate_shard, tasks))
+    else:
+        parts = [_generate_shard(t) for t in tasks]
+
+    if parts:
+        X = np.concatenate([p[0] for p in parts])
+        y = np.concatenate([p[1] for p in parts])
+    else:
+        X, y = np.empty((0, len(FEATURES))), np.empty(0, dtype=np.int64)
+    df = pd.DataFrame({
+        'window_acc': X[:, 0],
+        'avg_rt': X[:, 1],
+        'streak': X[:, 2].astype(np.int64),
+        'level_code': X[:, 3].astype(np.int64),
+    })
+    return df, pd.Series(y, name='action')
+
+def export_flat(model, path, meta):
+    """Write the sklearn-free flat copy of a tree model that MLEngine prefers at runtime."""
+    try:
+        from ml_engine import export_flat_model
+    except ImportError:
+        from src.ml_engine import export_flat_model
+    import sklearn
+    return export_flat_model(model, path, dict(meta, sklearn_version=sklearn.__version__))
+
+def _atomic_dump(obj, path):
+    # write next to the target then rename, so a running app never loads a partial file
+    import joblib
+    tmp = f"{path}.tmp{os.getpid()}"
+    joblib.dump(obj, tmp)
+    os.replace(tmp, path)
+
+# ---- out-of-core training on saved sessions ----
+
+INCREMENTAL_MODEL_PATH = os.path.join("models", "adaptive_incremental.pkl")
+INCREMENTAL_META_PATH = os.path.join("models", "adaptive_incremental_meta.pkl")
+CHECKPOINT_PATH = os.path.join("models", "adaptive_incremental.ckpt")
+CLASSES = np.array([-1, 0, 1])
+
+def session_windows(correct, response_time, level_code, window_size=3, pad_rt=999.0):
+    """
+    Features and labels for every decision of one logged session.
+    Row i is what MLEngine.features_from_tracker sees right after attempt i
+    (front-padded with misses taking pad_rt seconds); its label is
+    label_action_from_window over the real attempts in that window.
+    """
+    correct = np.asarray(correct, dtype=bool)
+    response_time = np.asarray(response_time, dtype=float)
+    level_code = np.asarray(level_code, dtype=np.int64)
+    n = len(correct)
+    if n == 0 or window_size <= 0:
+        return np.empty((0, len(FEATURES))), np.empty(0, dtype=np.int64)
+    pad = window_size - 1
+    c = np.concatenate([np.zeros(pad, dtype=bool), correct])
+    rt = np.concatenate([np.full(pad, pad_rt), response_time])
+    real = np.concatenate([np.zeros(pad, dtype=bool), np.ones(n, dtype=bool)])
+    win_c = np.lib.stride_tricks.sliding_window_view(c, window_size)
+    win_rt = np.lib.stride_tricks.sliding_window_view(rt, window_size)
+    win_real = np.lib.stride_tricks.sliding_window_view(real, window_size)
+
+    # accumulate oldest first, padding included, exactly like Tracker.window_features
+    n_correct = np.zeros(n, dtype=np.int64)
+    rt_sum = np.zeros(n)
+    real_rt_sum = np.zeros(n)
+    for k in range(window_size):
+        n_correct += win_c[:, k]
+        rt_sum += win_rt[:, k]
+        real_rt_sum += np.where(win_real[:, k], win_rt[:, k], 0.0)
+    count = np.minimum(np.arange(1, n + 1), window_size)
+
+    # running streak of correct answers, capped at the unpadded window length
+    idx = np.arange(n)
+    last_miss = np.maximum.accumulate(np.where(correct, -1, idx))
+    streak = np.minimum(idx - last_miss, count)
+
+    acc = n_correct / count
+    avg_rt = real_rt_sum / count
+    fast = np.array([FAST[l] for l in LEVELS])[level_code]
+    slow = np.array([SLOW[l] for l in LEVELS])[level_code]
+    action = np.where((acc >= 0.8) & (avg_rt <= fast), 1,
+                      np.where((acc <= 0.5) | (avg_rt >= slow), -1, 0))
+
+    X = np.column_stack([n_correct / window_size, rt_sum / window_size, streak, level_code])
+    return X, action
+
+def _parse_bool(value):
+    return str(value).strip().lower() in ('true', '1', 'yes')
+
+def read_session_csv(path):
+    """(correct, response_time, level_code) arrays from a saved session CSV."""
+    level_map = {l: i for i, l in enumerate(LEVELS)}
+    correct, rts, levels = [], [], []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                rt = float(row['response_time'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            correct.append(_parse_bool(row.get('correct')))
+            rts.append(rt)
+            levels.append(level_map.get(row.get('level'), 0))
+    return np.array(correct, dtype=bool), np.array(rts, dtype=float), np.array(levels, dtype=np.int64)
+
+def _load_checkpoint(path, window_size):
+    import joblib
+    if path and os.path.exists(path):
+        ckpt = joblib.load(path)
+        if ckpt['window_size'] != window_size:
+            raise ValueError(f"checkpoint was trained with window_size={ckpt['window_size']}, not {window_size}")
+        return ckpt
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.preprocessing import StandardScaler
+    return {
+        'window_size': window_size,
+        'scaler': StandardScaler(),
+        'clf': SGDClassifier(loss='log_loss', alpha=1e-4, random_state=0),
+        'sources': {},
+        'rows_seen': 0,
+        'batches': 0
+    }
+
+def train_incremental(source_dir='data', model_path=INCREMENTAL_MODEL_PATH, meta_path=INCREMENTAL_META_PATH,
+                      checkpoint_path=CHECKPOINT_PATH, window_size=3, batch_size=4096,
+                      checkpoint_every=100, pattern="session_*.csv"):
+    """
+    Stream saved sessions into the incremental model.
+    Only files that are new or changed (size/mtime) since the checkpoint are
+    read, and of a changed file only the windows past those already learned
+    (sessions are only appended to), so no row is fitted twice. Files that
+    fail to parse are recorded with their error and retried once they change.
+    Windows are buffered up to batch_size rows per partial_fit, so memory
+    does not grow with the corpus. Every checkpoint_every files the buffer is
+    flushed and the checkpoint rewritten, so an interrupted run resumes there.
+    Returns {'files', 'rows', 'errors', 'batches', 'rows_seen'} for this run.
+    """
+    from sklearn.pipeline import Pipeline
+    ckpt = _load_checkpoint(checkpoint_path, window_size)
+    scaler, clf, sources = ckpt['scaler'], ckpt['clf'], ckpt['sources']
+
+    buf_X, buf_y, buffered = [], [], 0
+    pending = {}
+    stats = {'files': 0, 'rows': 0, 'errors': 0, 'batches': 0}
+
+    def fit_buffer():
+        nonlocal buf_X, buf_y, buffered
+        if not buffered:
+            return
+        X, y = np.concatenate(buf_X), np.concatenate(buf_y)
+        scaler.partial_fit(X)
+        clf.partial_fit(scaler.transform(X), y, classes=CLASSES)
+        stats['batches'] += 1
+        ckpt['batches'] += 1
+        ckpt['rows_seen'] += len(y)
+        buf_X, buf_y, buffered = [], [], 0
+
+    def save_checkpoint():
+        fit_buffer()
+        sources.update(pending)
+        pending.clear()
+        if checkpoint_path:
+            os.makedirs(os.path.dirname(checkpoint_path) or '.', exist_ok=True)
+            _atomic_dump(ckpt, checkpoint_path)
+
+    for path in sorted(glob.glob(os.path.join(source_dir, pattern))):
+        st = os.stat(path)
+        key = os.path.relpath(path, source_dir)
+        prev = sources.get(key, {})
+        if prev.get('size') == st.st_size and prev.get('mtime_ns') == st.st_mtime_ns:
+            continue
+        # 'windows': how many of the file's windows the model has learned from
+        entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'windows': prev.get('windows', 0)}
+        pending[key] = entry
+        try:
+            correct, rt, levels = read_session_csv(path)
+            X, y = session_windows(correct, rt, levels, window_size)
+        except Exception as e:
+            # a malformed file is recorded and skipped until it changes
+            entry['error'] = repr(e)
+            stats['errors'] += 1
+            continue
+        done = entry['windows']
+        if len(y) > done:
+            buf_X.append(X[done:])
+            buf_y.append(y[done:])
+            buffered += len(y) - done
+            entry['windows'] = len(y)
+            stats['files'] += 1
+            stats['rows'] += len(y) - done
+        if buffered >= batch_size:
+            fit_buffer()
+        if len(pending) >= checkpoint_every:
+            save_checkpoint()
+    save_checkpoint()
+
+    if ckpt['rows_seen'] and model_path:
+        os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+        _atomic_dump(Pipeline([('scale', scaler), ('clf', clf)]), model_path)
+        meta = {
+            'model': 'SGDClassifier',
+            'window_size': window_size,
+            'features': FEATURES,
+            'rows_seen': ckpt['rows_seen'],
+            'files': sum(1 for entry in sources.values() if 'error' not in entry)
+        }
+        _atomic_dump(meta, meta_path)
+    stats['rows_seen'] = ckpt['rows_seen']
+    return stats
+
+def main_incremental(args):
+    stats = train_incremental(args.source, model_path=args.model, meta_path=args.meta,
+                              checkpoint_path=args.checkpoint, window_size=args.window_size,
+                              batch_size=args.batch_size)
+    print(f"Processed {stats['files']} new session files ({stats['rows']} windows, "
+          f"{stats['batches']} batches); {stats['rows_seen']} windows learned in total")
+    if stats['errors']:
+        print(f"Skipped {stats['errors']} unreadable files (recorded in the checkpoint)")
+    if stats['rows_seen']:
+        print("Saved model to", args.model)
 
 def main():
+    from sklearn.tree import DecisionTreeClassifier
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import classification_report, accuracy_score
     os.makedirs('models', exist_ok=True)
     print("Generating dataset...")
-    X, y = generate_dataset(num_sessions=2500, window_size=3)
+    X, y = generate_dataset(num_sessions=2500, window_size=3, seed=42, n_jobs=os.cpu_count())
     print("Dataset shape:", X.shape)
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
     print("Training DecisionTreeClassifier...")
@@ -82,15 +394,30 @@ def main():
     y_pred = clf.predict(X_test)
     print("Accuracy:", accuracy_score(y_test, y_pred))
     print("Classification report:\n", classification_report(y_test, y_pred))
-    joblib.dump(clf, "models/adaptive_tree.pkl")
+    _atomic_dump(clf, "models/adaptive_tree.pkl")
     meta = {
         'model': 'DecisionTreeClassifier',
         'window_size': 3,
-        'features': ['window_acc','avg_rt','streak','level_code']
+        'features': FEATURES
     }
-    joblib.dump(meta, "models/adaptive_meta.pkl")
+    _atomic_dump(meta, "models/adaptive_meta.pkl")
     print("Saved model to models/adaptive_tree.pkl and models/adaptive_meta.pkl")
+    export_flat(clf, "models/adaptive_tree.flat", meta)
+    print("Exported flat model to models/adaptive_tree.flat")
     X_test.assign(action=y_test).to_csv("models/test_examples.csv", index=False)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--incremental', action='store_true',
+                        help="train out of core on saved session CSVs instead of simulated data")
+    parser.add_argument('--source', default='data', help="directory with session_*.csv files")
+    parser.add_argument('--model', default=INCREMENTAL_MODEL_PATH)
+    parser.add_argument('--meta', default=INCREMENTAL_META_PATH)
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH)
+    parser.add_argument('--window-size', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=4096)
+    args = parser.parse_args()
+    if args.incremental:
+        main_incremental(args)
+    else:
+        main()
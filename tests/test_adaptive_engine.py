@@ -0,0 +1,119 @@
+import random
+
+import joblib
+from sklearn.tree import DecisionTreeClassifier
+
+from src import adaptive_engine
+from src.adaptive_engine import LEVELS, next_level, next_level_batch, next_level_rule
+from src.ml_engine import MLEngine
+from src.puzzle_generator import generate_puzzle
+from src.tracker import Tracker
+from src.train_model import generate_dataset
+
+def _learners(n=50, seed=0):
+    rnd = random.Random(seed)
+    trackers, levels = [], []
+    for i in range(n):
+        t = Tracker(); t.start_session(f"s{i}")
+        level = rnd.choice(LEVELS)
+        for _ in range(rnd.randint(0, 8)):
+            t.record_attempt(generate_puzzle(level), "0", rnd.random() < 0.7, rnd.uniform(1, 30))
+        trackers.append(t); levels.append(level)
+    return trackers, levels
+
+def test_next_level_batch_matches_single(tmp_path, monkeypatch):
+    X, y = generate_dataset(num_sessions=300, seed=0)
+    model_path = tmp_path / "tree.pkl"
+    joblib.dump(DecisionTreeClassifier(max_depth=4, random_state=0).fit(X.to_numpy(), y), model_path)
+    monkeypatch.setattr(adaptive_engine, "_ml_engine", MLEngine(str(model_path), str(tmp_path / "meta.pkl")))
+
+    trackers, levels = _learners()
+    batch = next_level_batch(trackers, levels, window_size=3, use_ml=True)
+    assert batch == [next_level(t, l, window_size=3, use_ml=True) for t, l in zip(trackers, levels)]
+    assert all("(ML)" in reason for _, reason in batch)
+
+def test_next_level_batch_falls_back_to_rule(tmp_path, monkeypatch):
+    monkeypatch.setattr(adaptive_engine, "_ml_engine", MLEngine(str(tmp_path / "missing.pkl")))
+    trackers, levels = _learners(seed=1)
+    assert next_level_batch(trackers, levels, window_size=3, use_ml=True) == \
+        [next_level_rule(t, l, 3) for t, l in zip(trackers, levels)]
+
+def test_rule_table_matches_reference(monkeypatch):
+    from src.adaptive_engine import next_level_rule_reference
+    trackers, levels = _learners(n=200, seed=2)
+    # response times exactly on the thresholds
+    edge = Tracker()
+    for _ in range(3):
+        edge.record_attempt(generate_puzzle('easy'), "0", True, adaptive_engine.FAST_THRESH['easy'])
+    trackers.append(edge); levels.append('easy')
+    for window_size in (1, 3, 6):
+        for t, l in zip(trackers, levels):
+            assert next_level_rule(t, l, window_size) == next_level_rule_reference(t, l, window_size)
+    # the compiled table follows threshold changes
+    monkeypatch.setitem(adaptive_engine.FAST_THRESH, 'easy', 1.0)
+    assert next_level_rule(edge, 'easy', 3) == next_level_rule_reference(edge, 'easy', 3)
+    assert next_level_rule(edge, 'easy', 3)[0] == 'easy'
+
+def test_decision_table_matches_model_predict(tmp_path):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    X, y = generate_dataset(num_sessions=300, seed=3)
+    trackers, levels = _learners(n=80, seed=3)
+    models = {'tree': DecisionTreeClassifier(random_state=0),
+              'forest': RandomForestClassifier(n_estimators=5, max_depth=5, random_state=0),
+              'linear': LogisticRegression(max_iter=500)}
+    for name, model in models.items():
+        path = tmp_path / f"{name}.pkl"
+        joblib.dump(model.fit(X.to_numpy(), y), path)
+        table_engine = MLEngine(str(path), str(tmp_path / "meta.pkl"))
+        predict_engine = MLEngine(str(path), str(tmp_path / "meta.pkl"), use_table=False)
+        for window_size in range(1, 7):
+            for t, l in zip(trackers, levels):
+                assert table_engine.predict_action(t, l, window_size)[0] == \
+                    predict_engine.predict_action(t, l, window_size)[0]
+            table = table_engine.decision_table(table_engine.model, window_size)
+            assert (table is None) == (name == 'linear')
+
+def test_flat_model_matches_sklearn(tmp_path):
+    import numpy as np
+    from sklearn.ensemble import RandomForestClassifier
+    from src.ml_engine import load_flat_model
+    from src.train_model import export_flat
+    X, y = generate_dataset(num_sessions=300, seed=4)
+    X = X.to_numpy()
+    rng = np.random.default_rng(4)
+    probe = np.column_stack([rng.integers(0, 4, 3000) / 3, rng.uniform(0, 60, 3000),
+                             rng.integers(0, 4, 3000), rng.integers(0, 3, 3000)])
+    for model in (DecisionTreeClassifier(random_state=0), RandomForestClassifier(n_estimators=7, random_state=0)):
+        model.fit(X, y)
+        path = str(tmp_path / "m.flat")
+        export_flat(model, path, {'window_size': 3})
+        flat = load_flat_model(path)
+        assert isinstance(flat.nodes, np.memmap) and flat.meta['window_size'] == 3
+        assert np.array_equal(flat.predict(probe), model.predict(probe))
+        assert np.array_equal(flat.predict(X), model.predict(X))
+        # the decision table compiles from the flat model alone
+        engine = MLEngine(path, str(tmp_path / "meta.pkl"))
+        assert engine.decision_table(engine.model, 3) is not None
+
+def test_ml_engine_uses_the_trained_window(tmp_path):
+    X, y = generate_dataset(num_sessions=300, window_size=5, seed=6)
+    path = str(tmp_path / "w5.pkl")
+    joblib.dump(DecisionTreeClassifier(random_state=0).fit(X.to_numpy(), y), path)
+    joblib.dump({'window_size': 5}, tmp_path / "w5_meta.pkl")
+    engine = MLEngine(path, str(tmp_path / "w5_meta.pkl"))
+    no_meta = MLEngine(path, str(tmp_path / "missing_meta.pkl"))
+    assert engine.trained_window_size(engine.model) == 5 and no_meta.trained_window_size(no_meta.model) is None
+    trackers, levels = _learners(n=60, seed=6)
+    for t, l in zip(trackers, levels):
+        assert engine.predict_action(t, l, 3)[0] == no_meta.predict_action(t, l, 5)[0]
+    assert engine.predict_actions_batch(trackers, levels, 2)[0] == no_meta.predict_actions_batch(trackers, levels, 5)[0]
+
+def test_warm_compiles_decision_tables_before_the_first_decision(tmp_path, monkeypatch):
+    X, y = generate_dataset(num_sessions=200, seed=8)
+    path = str(tmp_path / "tree.pkl")
+    joblib.dump(DecisionTreeClassifier(random_state=0).fit(X.to_numpy(), y), path)
+    engine = MLEngine(path, str(tmp_path / "meta.pkl"))
+    monkeypatch.setattr(adaptive_engine, "_ml_engine", engine)
+    assert adaptive_engine.warm_ml_engine((2, 4))
+    assert set(engine._tables) == {2, 4} and all(engine._tables.values())
@@ -0,0 +1,60 @@
+import json
+import random
+
+import pytest
+
+from src.analytics import AnalyticsStore, ingest
+from src.puzzle_generator import generate_puzzle
+from src.tracker import Tracker
+
+def _session(seed, n=12):
+    rnd = random.Random(seed)
+    t = Tracker(); t.start_session(f"u{seed}")
+    levels = ['easy', 'medium', 'hard']
+    lvl = 0
+    for _ in range(n):
+        t.record_attempt(generate_puzzle(levels[lvl], seed=rnd.random()), "0", rnd.random() < 0.6, rnd.uniform(1, 20))
+        lvl = max(0, min(2, lvl + rnd.choice([-1, 0, 1])))
+    return t
+
+def test_ingest_is_incremental_and_queries_match(tmp_path):
+    src, store = tmp_path / "data", tmp_path / "store"
+    src.mkdir()
+    trackers = [_session(i) for i in range(6)]
+    for i, t in enumerate(trackers[:4]):
+        t.to_dataframe().to_csv(src / f"session_u{i}_{i}.csv", index=False)
+    assert ingest(str(src), str(store))['sessions'] == 4
+    assert ingest(str(src), str(store))['files'] == 0
+
+    (src / "session_summary_u4.json").write_text(json.dumps(trackers[4].get_summary()))
+    (src / "session_summary_u0.json").write_text(json.dumps(trackers[0].get_summary()))  # duplicate
+    assert ingest(str(src), str(store))['sessions'] == 1
+
+    q = AnalyticsStore(str(store))
+    rows = [a for t in trackers[:5] for a in t.attempts]
+    assert q.num_sessions == 5 and q.num_rows == len(rows)
+    for level, stats in q.accuracy_by_level().items():
+        sel = [a for a in rows if a['level'] == level]
+        assert stats['attempts'] == len(sel)
+        assert stats['accuracy'] == pytest.approx(sum(a['correct'] for a in sel) / max(1, len(sel)))
+    assert sum(v['n'] for v in q.rt_percentiles('op').values()) == len(rows)
+    rates = q.transition_rates()
+    assert sum(r['n'] for r in rates.values()) == len(rows) - 5
+    assert all(r['n'] == 0 or r['promote'] + r['stay'] + r['demote'] == pytest.approx(1) for r in rates.values())
+
+def test_malformed_files_are_recorded_and_skipped(tmp_path):
+    src, store = tmp_path / "data", tmp_path / "store"
+    src.mkdir()
+    _session(1).to_dataframe().to_csv(src / "session_a.csv", index=False)
+    bad = _session(2).to_dataframe()
+    bad['response_time'] = bad['response_time'].astype(object)
+    bad.loc[3, 'response_time'] = 'abc'
+    bad.to_csv(src / "session_b.csv", index=False)
+    (src / "session_c.csv").write_text("timestamp,question\n1.0," + "x" * 200000)  # csv.Error: field too large
+    (src / "session_summary_d.json").write_text(json.dumps({'attempts': [1, 2]}))
+    result = ingest(str(src), str(store))
+    assert result['files'] == 4 and result['sessions'] == 1
+    manifest = json.loads((store / "manifest.json").read_text())
+    errors = {k for k, v in manifest['sources'].items() if 'error' in v}
+    assert errors == {"session_b.csv", "session_c.csv", "session_summary_d.json"}
+    assert AnalyticsStore(str(store)).num_sessions == 1
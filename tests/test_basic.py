@@ -12,3 +12,40 @@ def test_tracker_and_engine():
     t.record_attempt(p, given_answer=str(p['answer']), correct=True, response_time=5.0)
     next_level, reason = next_level_rule(t, 'easy', window_size=1)
     assert next_level in ['easy','medium']
+
+def test_tracker_window_stats_match_attempts():
+    import random
+    rnd = random.Random(3)
+    t = Tracker(); t.start_session("t")
+    for i in range(20):
+        p = generate_puzzle(rnd.choice(['easy', 'medium', 'hard']), seed=i)
+        t.record_attempt(p, given_answer="0", correct=rnd.random() < 0.6, response_time=rnd.uniform(1, 30))
+        attempts = list(t.attempts)
+        for n in (1, 3, 6, 10):
+            window = attempts[-n:]
+            count, num_correct, rt_sum, streak = t.window_stats(n)
+            assert count == len(window)
+            assert num_correct == sum(1 for a in window if a['correct'])
+            assert rt_sum == sum(a['response_time'] for a in window)
+        assert t.accuracy() == sum(a['correct'] for a in attempts) / len(attempts)
+    assert list(t.to_dataframe().columns)[0] == 'timestamp'
+    assert t.get_summary()['attempts'] == attempts
+
+def test_generate_puzzle_seed_is_private():
+    import random
+    random.seed(123)
+    state = random.getstate()
+    assert generate_puzzle('hard', seed=5) == generate_puzzle('hard', seed=5)
+    assert random.getstate() == state
+
+def test_summary_view_is_incremental():
+    t = Tracker(tail_size=4); t.start_session("t")
+    for i in range(10):
+        level = ['easy', 'medium', 'hard'][i % 3]
+        t.record_attempt(generate_puzzle(level, seed=i), "0", i % 2 == 0, float(i))
+    view = t.summary_view()
+    assert view['attempts'] == 10 and view['accuracy'] == 0.5
+    assert view['level_counts'] == {'easy': 4, 'medium': 3, 'hard': 3}
+    assert view['recent'] == list(t.attempts)[-4:]
+    view['recent'][-1]['correct'] = None
+    assert t.summary_view()['recent'][-1]['correct'] is not None
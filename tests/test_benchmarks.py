@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+
+# bench.py puts src/ on sys.path and imports its modules top-level; run it in its own
+# process so this one keeps a single copy of each src.* module (and of METRICS)
+BENCH = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "bench.py")
+
+def _bench(*args):
+    return subprocess.run([sys.executable, BENCH, *args], capture_output=True, text=True)
+
+def _results(**medians):
+    return {'results': {k: {'median': v, 'min': v, 'number': 1} for k, v in medians.items()}}
+
+def test_compare_flags_regressions_past_threshold(tmp_path):
+    base, cur = tmp_path / "base.json", tmp_path / "cur.json"
+    base.write_text(json.dumps(_results(a=1.0, b=1.0, c=1.0)))
+    cur.write_text(json.dumps(_results(a=1.2, b=1.5, d=9.0)))
+    out = _bench("compare", str(base), "--current", str(cur), "--threshold", "0.25", "--threshold-for", "b=0.6")
+    assert out.returncode == 0 and "0 of 2 benchmarks regressed" in out.stdout
+    out = _bench("compare", str(base), "--current", str(cur), "--threshold", "0.1")
+    assert out.returncode == 1 and "2 of 2 benchmarks regressed" in out.stdout
+
+def test_benchmark_setups_run(tmp_path):
+    path = tmp_path / "results.json"
+    out = _bench("run", "--filter", "adaptive.next_level_rule", "--repeat", "1", "--out", str(path))
+    assert out.returncode == 0, out.stderr
+    results = json.loads(path.read_text())['results']
+    assert list(results) == ['adaptive.next_level_rule'] and results['adaptive.next_level_rule']['median'] > 0
@@ -0,0 +1,59 @@
+import gzip
+import json
+import random
+import zipfile
+
+import pytest
+
+from src import export
+from src.puzzle_generator import generate_puzzle
+from src.tracker import Tracker
+
+def _tracker(seed, n=30):
+    rnd = random.Random(seed)
+    t = Tracker(); t.start_session(f"u{seed}")
+    for _ in range(n):
+        p = generate_puzzle(rnd.choice(['easy', 'medium', 'hard']), seed=rnd.random())
+        t.record_attempt(p, str(rnd.randint(0, 99)), rnd.random() < 0.6, rnd.uniform(1, 30))
+    return t
+
+def test_csv_matches_dataframe_and_jsonl_roundtrips(tmp_path):
+    t = _tracker(0)
+    assert export.csv_bytes(t) == t.to_dataframe().to_csv(index=False).encode('utf-8')
+    path = export.write_session(t, str(tmp_path / "s.jsonl.gz"))
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == list(t.attempts)
+    summary = t.get_summary(include_attempts=False)
+    assert 'attempts' not in summary and summary['num_attempts'] == 30
+
+def test_bundle_streams_sessions_from_saved_csvs(tmp_path):
+    trackers = [_tracker(i, n=5 + i) for i in range(4)]
+    for i, t in enumerate(trackers):
+        export.write_session(t, str(tmp_path / f"session_u{i}.csv"))
+    out = tmp_path / "out" / "bundle.zip"
+    result = export.write_bundle(export.sessions_from_csv(str(tmp_path)), str(out), formats=('csv', 'jsonl.gz'))
+    assert result['sessions'] == 4 and result['rows'] == sum(5 + i for i in range(4))
+    with zipfile.ZipFile(out) as zf:
+        index = [json.loads(line) for line in zf.read("index.jsonl").decode('utf-8').splitlines()]
+        assert [s['name'] for s in index] == [f"session_u{i}" for i in range(4)]
+        # re-exporting a session read back from CSV reproduces the same file
+        assert zf.read("session_u2.csv") == export.csv_bytes(trackers[2])
+        rows = gzip.decompress(zf.read("session_u3.jsonl.gz")).decode('utf-8').splitlines()
+        assert [json.loads(r)['question'] for r in rows] == [a['question'] for a in trackers[3].attempts]
+
+def test_parquet_export(tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    t = _tracker(1)
+    table = pq.read_table(export.write_session(t, str(tmp_path / "s.parquet")))
+    assert table.num_rows == 30 and table.column_names == list(t.to_dataframe().columns)
+
+def test_bundle_removes_partial_zip_on_error(tmp_path):
+    def sessions():
+        yield "ok", _tracker(0, n=3)
+        raise ValueError("bad session")
+
+    out = tmp_path / "bundle.zip"
+    with pytest.raises(ValueError):
+        export.write_bundle(sessions(), str(out))
+    assert list(tmp_path.iterdir()) == []
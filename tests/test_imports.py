@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+def test_rule_path_imports_only_stdlib():
+    code = ("import sys, puzzle_generator, tracker, adaptive_engine\n"
+            "t = tracker.Tracker(); t.start_session('x')\n"
+            "t.record_attempt(puzzle_generator.generate_puzzle('easy'), '1', True, 3.0)\n"
+            "adaptive_engine.next_level(t, 'easy', use_ml=False)\n"
+            "print(','.join(m for m in ('numpy', 'pandas', 'sklearn', 'joblib', 'cProfile', 'pstats') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+def test_rule_service_session_imports_only_stdlib(tmp_path):
+    code = ("import sys, service\n"
+            f"svc = service.LearnerService(log_root={str(tmp_path)!r})\n"
+            "for focus_weak in (False, True):\n"
+            "    sid = svc.start_session('x', save_log=True, focus_weak=focus_weak)['session_id']\n"
+            "    for _ in range(5):\n"
+            "        svc.next_puzzle(sid)\n"
+            "        svc.prefetch(sid)\n"
+            "        svc.submit_answer(sid, '1', response_time=3.0)\n"
+            "    svc.summary(sid)\n"
+            "    svc.end_session(sid)\n"
+            "print(','.join(m for m in ('numpy', 'pandas', 'sklearn', 'joblib') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
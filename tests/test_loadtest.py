@@ -0,0 +1,24 @@
+import pytest
+
+from src import loadtest
+
+REPORT_KEYS = {'mode', 'executor', 'workers', 'learners', 'steps', 'window_size', 'ml_available',
+               'decisions', 'wall_seconds', 'decisions_per_sec', 'latency_ms', 'peak_rss_mb'}
+
+@pytest.mark.parametrize('executor', ['single', 'thread', 'process'])
+def test_run_load_reports_every_decision(executor, monkeypatch):
+    # run_load installs a process-wide engine; put the original back afterwards
+    monkeypatch.setattr(loadtest.adaptive_engine, '_ml_engine', None)
+    report = loadtest.run_load(learners=7, steps=4, executor=executor, workers=2, chunk_size=3)
+    assert set(report) == REPORT_KEYS
+    assert report['decisions'] == 7 * 4 and report['ml_available'] is None
+    lat = report['latency_ms']
+    assert 0 < lat['p50'] <= lat['p95'] <= lat['p99'] <= lat['max']
+    assert report['workers'] == (1 if executor == 'single' else 2)
+
+@pytest.mark.parametrize('executor', ['single', 'process'])
+def test_ml_mode_without_a_model_falls_back_to_the_rule(executor, tmp_path, monkeypatch):
+    monkeypatch.setattr(loadtest.adaptive_engine, '_ml_engine', None)
+    report = loadtest.run_load(learners=5, steps=3, mode='ml', executor=executor, workers=2,
+                               chunk_size=2, model_path=str(tmp_path / "missing.pkl"))
+    assert report['ml_available'] is False and report['decisions'] == 5 * 3
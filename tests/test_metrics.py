@@ -0,0 +1,55 @@
+import threading
+
+import src.adaptive_engine as ae
+from src.puzzle_generator import generate_puzzle
+from src.tracker import Tracker
+
+def _run_session(n=6, use_ml=False):
+    t = Tracker()
+    t.start_session("hal")
+    level = 'easy'
+    for i in range(n):
+        t.record_attempt(generate_puzzle(level, seed=i), "1", i % 2 == 0, 4.0)
+        level, _ = ae.next_level(t, level, use_ml=use_ml)
+    return t
+
+def _decisions(snap):
+    return {(c['labels']['path'], c['labels']['reason']): c['value']
+            for c in snap['counters'].get('decisions_total', [])}
+
+def test_stage_histograms_and_decision_counters(monkeypatch):
+    metrics = ae.METRICS
+    metrics.reset()
+    _run_session(6)
+    worker = threading.Thread(target=_run_session, args=(4,))
+    worker.start()
+    worker.join()
+    monkeypatch.setattr(ae, '_get_ml_engine', lambda: None)
+    _run_session(3, use_ml=True)
+
+    class Broken:
+        def predict_action(self, *args, **kwargs):
+            raise RuntimeError("bad model")
+    monkeypatch.setattr(ae, '_get_ml_engine', lambda: Broken())
+    _run_session(2, use_ml=True)
+
+    snap = metrics.snapshot(include_models=False)
+    assert snap['stages']['tracker.record_attempt']['count'] == 15
+    assert snap['stages']['engine.next_level']['count'] == 15
+    assert _decisions(snap) == {('rule', 'rule_mode'): 10, ('fallback', 'ml_unavailable'): 3,
+                                ('fallback', 'RuntimeError'): 2}
+    assert snap['last_errors']['ml.predict:RuntimeError']['message'] == "bad model"
+    text = metrics.prometheus()
+    assert 'adaptive_stage_seconds_count{stage="engine.next_level"} 15' in text
+    assert 'adaptive_decisions_total{path="rule",reason="rule_mode"} 10' in text
+
+def test_profiling_samples_next_level():
+    metrics = ae.METRICS
+    metrics.reset()
+    metrics.start_profiling(every=2)
+    try:
+        _run_session(6)
+    finally:
+        metrics.stop_profiling()
+    assert metrics.profile_samples == 3
+    assert 'next_level_rule' in metrics.profile_report()
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from src.model_registry import ModelRegistry
+
+def _write(path, text, mtime):
+    path.write_text(text)
+    os.utime(path, ns=(mtime, mtime))
+
+def test_registry_reloads_only_on_content_change(tmp_path):
+    reg = ModelRegistry()
+    path = tmp_path / "m.txt"
+    calls = []
+    def loader(p):
+        calls.append(p)
+        return open(p).read()
+
+    _write(path, "v1", 1_000_000_000)
+    assert reg.get(str(path), loader) == "v1"
+    assert reg.get(str(path), loader) == "v1"
+    assert len(calls) == 1
+
+    _write(path, "v1", 2_000_000_000)  # touched, same content
+    assert reg.get(str(path), loader) == "v1"
+    assert len(calls) == 1
+
+    _write(path, "v2", 3_000_000_000)
+    assert reg.get(str(path), loader) == "v2"
+    stats = reg.stats()[str(path)]
+    assert stats['load_count'] == 2 and stats['last_load_seconds'] >= 0
+
+def test_registry_keeps_last_good_value(tmp_path):
+    reg = ModelRegistry()
+    path = tmp_path / "m.txt"
+    def loader(p):
+        text = open(p).read()
+        if text == "bad":
+            raise ValueError("corrupt")
+        return text
+
+    assert reg.get(str(path), loader) is None
+    _write(path, "bad", 1_000_000_000)
+    with pytest.raises(ValueError):
+        reg.get(str(path), loader)
+    _write(path, "good", 2_000_000_000)
+    assert reg.get(str(path), loader) == "good"
+    _write(path, "bad", 3_000_000_000)
+    assert reg.get(str(path), loader) == "good"
+    assert "corrupt" in reg.stats()[str(path)]['last_error']
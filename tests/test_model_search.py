@@ -0,0 +1,35 @@
+import json
+import os
+
+import numpy as np
+
+from src.model_search import cached_dataset, save_best, search
+
+def test_dataset_cache_is_content_addressed(tmp_path):
+    cache = str(tmp_path / "cache")
+    X, y, path = cached_dataset(num_sessions=50, window_size=3, seed=1, cache_dir=cache)
+    assert isinstance(X, np.memmap) and X.shape == (50 * 18, 4) and len(y) == len(X)
+    mtime = os.stat(os.path.join(path, "X.npy")).st_mtime_ns
+    X2, _, path2 = cached_dataset(num_sessions=50, window_size=3, seed=1, cache_dir=cache)
+    assert path2 == path and os.stat(os.path.join(path, "X.npy")).st_mtime_ns == mtime
+    assert np.array_equal(X, X2)
+    assert cached_dataset(num_sessions=50, window_size=3, seed=2, cache_dir=cache)[2] != path
+
+def test_search_writes_best_model_and_report(tmp_path):
+    cache = str(tmp_path / "cache")
+    report = search(families=('tree',), window_sizes=(1, 3), num_sessions=80, folds=2, cache_dir=cache)
+    assert len(report['candidates']) == 2 * 10
+    for w in (1, 3):
+        group = [e for e in report['candidates'] if e['window_size'] == w]
+        accs = [e['cv_accuracy'] for e in group]
+        assert accs == sorted(accs, reverse=True) and group[0]['tied']
+        assert report['windows'][w]['tied']
+    # the window is not chosen by accuracy: the app's window is selected
+    assert report['best'] is report['windows'][3]
+    assert all(e['latency_us'] > 0 for e in report['candidates'])
+    out = str(tmp_path / "models")
+    path = save_best(report, out, cache_dir=cache)
+    with open(path) as f:
+        assert json.load(f)['best']['window_size'] == report['best']['window_size']
+    assert os.path.exists(os.path.join(out, "adaptive_search_best.pkl"))
+    assert not os.path.exists(os.path.join(out, "adaptive_tree.pkl"))
@@ -0,0 +1,44 @@
+from src.prefetch import PuzzlePrefetcher
+from src.puzzle_generator import PuzzleBank
+
+def test_prefetcher_serves_prepared_puzzles():
+    pf = PuzzlePrefetcher(PuzzleBank(rng=0))
+    pf.prepare('medium')
+    ready = {lvl: pf._ready[lvl]['id'] for lvl in ('easy', 'medium', 'hard')}
+    assert pf.take('hard')['id'] == ready['hard']
+    pf.prepare('easy')  # only the slot that was used is refilled
+    assert pf.take('easy')['id'] == ready['easy']
+    assert pf.take('medium')['id'] == ready['medium']
+    assert pf.take('hard')['level'] == 'hard'
+    assert (pf.hits, pf.misses) == (3, 1)
+
+def test_prepared_rule_decision_matches_next_level_rule():
+    import random
+    from src.adaptive_engine import LEVELS, decide_prepared, next_level_rule, prepare_rule_decision
+    from src.puzzle_generator import generate_puzzle
+    from src.tracker import Tracker
+    rnd = random.Random(0)
+    for window_size in range(1, 8):
+        t = Tracker(); t.start_session("p")
+        for _ in range(12):
+            level = rnd.choice(LEVELS)
+            prepared = prepare_rule_decision(t, level, window_size)
+            correct, rt = rnd.random() < 0.6, rnd.uniform(1, 35)
+            t.record_attempt(generate_puzzle(level, seed=rnd.random()), "0", correct, rt)
+            assert decide_prepared(prepared, t, level, window_size, correct, rt) == \
+                next_level_rule(t, level, window_size)
+            # inputs prepared for another state are not used
+            assert decide_prepared(prepared, t, level, window_size + 1, correct, rt) is None
+
+def test_service_decides_from_prepared_inputs():
+    from src.service import LearnerService
+    service = LearnerService()
+    sid = service.start_session("q", window_size=2)['session_id']
+    for _ in range(4):
+        service.next_puzzle(sid)
+        service.prefetch(sid)
+        prefetcher = service.store.get(sid).prefetcher
+        assert prefetcher.decision_inputs is not None
+        service.submit_answer(sid, service.store.get(sid).pending['answer'], response_time=3.0)
+        assert prefetcher.decision_inputs is None
+    assert service.summary(sid)['level'] == 'hard'
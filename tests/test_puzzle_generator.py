@@ -0,0 +1,34 @@
+import numpy as np
+
+from src.puzzle_generator import LEVEL_CONFIG, OPS, PuzzleBank, generate_puzzles
+
+def test_generate_puzzles_batch_is_reproducible():
+    p1 = generate_puzzles('hard', 200, np.random.default_rng(3))
+    p2 = generate_puzzles('hard', 200, np.random.default_rng(3))
+    assert p1 == p2 and len(p1) == 200
+    for p in p1:
+        a, b = p['operands']
+        lo, hi = LEVEL_CONFIG['hard']['range']
+        assert lo <= a <= hi and lo <= b <= hi
+        assert p['answer'] == OPS[p['op']](a, b)
+    assert all(p['operands'][0] >= p['operands'][1]
+               for p in generate_puzzles('easy', 200, 1) if p['op'] == '-')
+
+def test_puzzle_bank_serves_each_puzzle_once_per_cycle():
+    bank = PuzzleBank(rng=0)
+    total = bank.remaining('easy')
+    assert total == 10 * 10 + 55  # '+' pairs plus '-' pairs with a >= b
+    keys = {(p['op'], p['operands']) for p in (bank.pop('easy') for _ in range(total))}
+    assert len(keys) == total
+    assert bank.remaining('easy') == 0
+    bank.pop('easy')
+    assert bank.remaining('easy') == total - 1
+
+def test_puzzle_bank_skips_marked_puzzles():
+    bank = PuzzleBank(rng=1)
+    other = bank.lookup('medium', '*', (7, 9))
+    bank.mark_seen(other)
+    assert ('medium', '*', (7, 9)) in bank
+    served = [bank.pop('medium') for _ in range(bank.remaining('medium') - 1)]
+    assert all(p['operands'] != (7, 9) or p['op'] != '*' for p in served)
+    assert bank.lookup('easy', '-', (2, 5)) is None
@@ -0,0 +1,64 @@
+import random
+
+import joblib
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+
+from src.adaptive_engine import LEVELS, next_level_rule
+from src.ml_engine import MLEngine
+from src.puzzle_generator import generate_puzzle
+from src.replay import ModelPolicy, RulePolicy, SessionBatch, evaluate, replay, sweep_policies
+from src.tracker import Tracker
+from src.train_model import generate_dataset
+
+def _live_sessions(decide, n=40, seed=0):
+    """Run ragged sessions through a Tracker, choosing levels with decide(tracker, level)."""
+    rnd = random.Random(seed)
+    cols = {'session': [], 'correct': [], 'response_time': [], 'level': []}
+    actions = []
+    for s in range(n):
+        t = Tracker(); t.start_session(f"u{s}")
+        level = rnd.choice(LEVELS)
+        skill = rnd.random()
+        for _ in range(rnd.randint(1, 25)):
+            correct, rt = rnd.random() < skill, rnd.uniform(1, 35)
+            t.record_attempt(generate_puzzle(level, seed=rnd.random()), "0", correct, rt)
+            for key, value in zip(cols, (s, correct, rt, LEVELS.index(level))):
+                cols[key].append(value)
+            nxt = decide(t, level)
+            actions.append(LEVELS.index(nxt) - LEVELS.index(level))
+            level = nxt
+    return SessionBatch.from_columns(*(np.array(v) for v in cols.values())), np.array(actions)
+
+def test_rule_replay_matches_tracker_decisions():
+    for window_size in (1, 3, 5):
+        batch, expected = _live_sessions(lambda t, l: next_level_rule(t, l, window_size)[0], seed=window_size)
+        actions, _, decided = replay(batch, RulePolicy(window_size))
+        assert np.array_equal(actions[decided], expected)
+        report = evaluate(batch, [RulePolicy(window_size), RulePolicy(window_size, fast={l: 0 for l in LEVELS})])
+        logged, rule, strict = report['policies']
+        # logged levels were chosen by the same rule, and never-promote never promotes
+        assert report['agreement'][0]['agreement'] == 1.0
+        assert strict['counts']['promote'] == 0 and rule['decisions'] == len(expected)
+
+def test_model_replay_matches_ml_engine(tmp_path):
+    X, y = generate_dataset(num_sessions=300, seed=5)
+    path = tmp_path / "tree.pkl"
+    joblib.dump(DecisionTreeClassifier(max_depth=6, random_state=0).fit(X.to_numpy(), y), path)
+    engine = MLEngine(str(path), str(tmp_path / "meta.pkl"), use_table=False)
+    levels = lambda l, a: LEVELS[min(max(LEVELS.index(l) + a, 0), 2)]
+    batch, expected = _live_sessions(lambda t, l: levels(l, engine.predict_action(t, l, 4)[0]), seed=7)
+    actions, _, decided = replay(batch, ModelPolicy.from_path(str(path), window_size=4))
+    assert np.array_equal(actions[decided], expected)
+
+def test_threshold_sweep_on_simulated_sessions():
+    batch = SessionBatch.simulate(2000, session_length=15, seed=1)
+    policies = sweep_policies((2, 3), (0.5, 1.0), (1.0, 2.0))
+    report = evaluate(batch, policies, pairwise=True)
+    assert len(report['agreement']) == len(policies) * (len(policies) - 1) // 2
+    for p in report['policies']:
+        assert p['decisions'] == 2000 * 15 == sum(p['counts'].values())
+        assert sum(p['final_levels'].values()) == 2000
+    # unscaled thresholds are the live rule
+    by_name = {p['name']: p for p in report['policies']}
+    assert by_name['rule[w=3,fast=x1,slow=x1]']['counts'] == evaluate(batch, [RulePolicy(3)])['policies'][0]['counts']
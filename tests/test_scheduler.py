@@ -0,0 +1,55 @@
+from src.scheduler import HEAP_ENTRY_BYTES, RETRY_INTERVAL, ItemBank, PuzzleScheduler
+from src.service import LearnerService
+
+def test_weak_operation_is_drawn_more_often():
+    sched = PuzzleScheduler(rng=0)
+    ops = {'+': 0, '-': 0, '*': 0, '/': 0}
+    for _ in range(600):
+        p = sched.pop('hard')
+        ops[p['op']] += 1
+        # only division is answered wrongly and slowly
+        weak = p['op'] == '/'
+        sched.record(p, not weak, 40.0 if weak else 5.0)
+    assert ops['/'] > 2 * max(ops['+'], ops['-'], ops['*'])
+    mastery = sched.mastery.as_dict()['hard']
+    assert mastery['/']['weight'] > mastery['+']['weight']
+
+def test_missed_puzzle_comes_back_after_spacing():
+    bank = ItemBank({'tiny': {'ops': ['+'], 'range': (1, 40)}})
+    sched = PuzzleScheduler(rng=1, bank=bank)
+    missed = sched.pop('tiny')
+    sched.record(missed, False, 5.0)
+    served = []
+    for _ in range(RETRY_INTERVAL + 1):
+        p = sched.pop('tiny')
+        served.append(p['operands'])
+        sched.record(p, True, 5.0)
+    assert served[:RETRY_INTERVAL - 1].count(missed['operands']) == 0
+    assert missed['operands'] in served
+    # fresh puzzles never repeat before they are due
+    assert len(set(served)) == len(served)
+
+def test_service_focus_weak_restores_from_tracker():
+    service = LearnerService()
+    sid = service.start_session("fay", level='medium', focus_weak=True)['session_id']
+    for _ in range(5):
+        service.next_puzzle(sid)
+        service.submit_answer(sid, 'x', response_time=30.0)
+    view = service.summary(sid)
+    before = view['mastery']
+    assert sum(m['attempts'] for ops in before.values() for m in ops.values()) == 5
+    # a restored session replays its answers into a fresh scheduler
+    session = service.store.get(sid)
+    session._prefetcher = None
+    assert service.summary(sid)['mastery'] == before
+
+def test_memory_estimate_counts_review_heaps():
+    sched = PuzzleScheduler(rng=2)
+    p = sched.pop('hard')
+    sched.record(p, True, 3.0)
+    before = sched.memory_bytes()
+    # one puzzle answered again and again: each answer leaves a stale heap entry behind
+    for _ in range(100):
+        sched.record(p, False, 3.0)
+    assert len(sched) == 1 and len(sched._due[('hard', p['op'])]) == 101
+    assert sched.memory_bytes() - before == 100 * HEAP_ENTRY_BYTES
@@ -0,0 +1,260 @@
+import asyncio
+import time
+import threading
+
+import pytest
+
+from src.puzzle_generator import generate_puzzle
+from src import session_store
+from src.service import LearnerService, LearnerSession, ServiceClient, _call, _prefetch_done, serve
+from src.session_log import read_session_log
+from src.session_store import FileSessionStore, InMemorySessionStore
+from src.tracker import Tracker
+
+def _answer(service, sid, correct=True):
+    puzzle = service.next_puzzle(sid)
+    pending = service.store.get(sid).pending
+    assert puzzle['id'] == pending['id'] and 'answer' not in puzzle
+    return service.submit_answer(sid, pending['answer'] if correct else 'x', response_time=2.0)
+
+def test_tracker_snapshot_roundtrip():
+    t = Tracker()
+    t.start_session("cy")
+    for i in range(12):
+        t.record_attempt(generate_puzzle(['easy', 'hard'][i % 2], seed=i), str(i), i % 4 != 0, 1.0 + i)
+    restored = Tracker.from_snapshot(t.to_snapshot())
+    assert list(restored.attempts) == list(t.attempts)
+    assert restored.window_stats(3) == t.window_stats(3)
+    assert restored.summary_view() == t.summary_view()
+
+def test_service_session_flow():
+    service = LearnerService()
+    sid = service.start_session("dee", level='easy')['session_id']
+    assert service.next_puzzle(sid) == service.next_puzzle(sid)
+    results = [_answer(service, sid) for _ in range(3)]
+    assert all(r['correct'] for r in results)
+    assert [r['previous_level'] for r in results[1:]] == [r['level'] for r in results[:-1]]
+    view = service.summary(sid)
+    assert view['attempts'] == 3 and view['level'] == results[-1]['level']
+    tracker = service.end_session(sid)
+    assert len(tracker.attempts) == 3 and sid not in service.store
+
+def test_lru_spill_and_restore(tmp_path):
+    store = InMemorySessionStore(LearnerSession, max_sessions=2, spill_dir=str(tmp_path / "spill"))
+    service = LearnerService(store, log_root=str(tmp_path / "logs"))
+    sids = [service.start_session(f"u{i}", save_log=True)['session_id'] for i in range(4)]
+    for sid in sids:
+        _answer(service, sid)
+    pending = service.next_puzzle(sids[0])
+    assert len(store) == 2 and store.evictions > 0
+    # sids[0] was spilled and comes back with its history and pending puzzle
+    assert service.next_puzzle(sids[0]) == pending
+    assert service.summary(sids[1])['attempts'] == 1
+    assert store.restores >= 2
+
+def test_file_store_shares_sessions(tmp_path):
+    a = LearnerService(FileSessionStore(LearnerSession, str(tmp_path)))
+    b = LearnerService(FileSessionStore(LearnerSession, str(tmp_path)))
+    sid = a.start_session("eve")['session_id']
+    puzzle = a.next_puzzle(sid)
+    assert b.next_puzzle(sid) == puzzle
+    _answer(b, sid)
+    assert a.summary(sid)['attempts'] == 1
+
+def test_file_store_answers_start_no_threads(tmp_path):
+    service = LearnerService(FileSessionStore(LearnerSession, str(tmp_path / "store")),
+                             log_root=str(tmp_path / "logs"))
+    sid = service.start_session("eve", save_log=True)['session_id']
+    _answer(service, sid)
+    before = threading.active_count()
+    for _ in range(5):
+        _answer(service, sid)
+    assert threading.active_count() <= before
+    service.end_session(sid)
+    assert len(read_session_log(str(tmp_path / "logs" / sid)).attempts) == 6
+
+def test_async_api_roundtrip():
+    async def run():
+        service = LearnerService()
+        server = await serve(service, port=0)
+        port = server.sockets[0].getsockname()[1]
+        client = await ServiceClient(port=port).connect()
+        try:
+            sid = (await client.call('start_session', user='fay'))['session_id']
+            puzzle = await client.call('next_puzzle', session_id=sid)
+            answer = service.store.get(sid).pending['answer']
+            result = await client.call('submit_answer', session_id=sid, answer=str(answer))
+            assert result['correct'] and puzzle['level'] == 'easy'
+            summary = await client.call('end_session', session_id=sid)
+            assert summary['num_attempts'] == 1
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+    asyncio.run(run())
+
+def test_background_prefetch_errors_are_recorded():
+    from concurrent.futures import Future
+    from src.service import METRICS  # the instance the service module imported
+    failed = Future()
+    failed.set_exception(KeyError("unknown session: gone"))
+    _prefetch_done(failed)
+    assert 'service.prefetch:KeyError' in METRICS.snapshot()['last_errors']
+
+def test_memory_budget_and_idle_eviction(tmp_path):
+    now = [0.0]
+    store = InMemorySessionStore(LearnerSession, spill_dir=str(tmp_path / "spill"), max_bytes=10**9,
+                                 idle_seconds=60, clock=lambda: now[0])
+    service = LearnerService(store, log_root=str(tmp_path / "logs"))
+    sids = [service.start_session(f"u{i}", save_log=True)['session_id'] for i in range(3)]
+    for sid in sids:
+        for _ in range(5):
+            _answer(service, sid)
+    assert store.bytes == sum(store.get(sid).memory_bytes() for sid in sids)
+    # a budget of two sessions spills the least recently used one
+    store.max_bytes = store.bytes - 1
+    service.next_puzzle(sids[1])
+    store.flush()
+    assert len(store) == 2 and sids[0] not in store._sessions and store.stats()['spilled'] == 1
+    # sessions left alone past idle_seconds are spilled on the next put, not the active one
+    now[0] = 61.0
+    service.next_puzzle(sids[2])
+    assert list(store._sessions) == [sids[2]] and store.idle_evictions == 1
+    # and come back with their attempts when the learner returns
+    assert service.summary(sids[0])['attempts'] == 5
+    store.flush()
+    stats = service.memory_stats()
+    assert stats['in_memory'] == 2 and stats['bytes'] == store.bytes and stats['spilled'] == 1
+
+def test_only_consented_sessions_are_spilled_and_snapshots_expire(tmp_path):
+    spill = tmp_path / "spill"
+    store = InMemorySessionStore(LearnerSession, max_sessions=1, spill_dir=str(spill), spill_ttl=3600)
+    service = LearnerService(store, log_root=str(tmp_path / "logs"))
+    private = service.start_session("anon")['session_id']
+    _answer(service, private)
+    consented = service.start_session("ok", save_log=True)['session_id']
+    # the session without consent was dropped, never written
+    assert store.drops == 1 and not list(spill.iterdir())
+    try:
+        service.next_puzzle(private)
+        assert False, "dropped session should be gone"
+    except KeyError:
+        pass
+    service.start_session("next")
+    store.flush()
+    assert [p.name for p in spill.iterdir()] == [f"{consented}.json.gz"]
+    assert store.purge_spilled(now=time.time() + 1800) == 0
+    assert store.purge_spilled(now=time.time() + 7200) == 1 and consented not in store
+
+def test_eviction_skips_sessions_in_use(tmp_path):
+    store = InMemorySessionStore(LearnerSession, max_sessions=2, spill_dir=str(tmp_path / "spill"))
+    service = LearnerService(store, log_root=str(tmp_path / "logs"), lock_stripes=1024)
+    busy, idle = (service.start_session(f"u{i}", save_log=True)['session_id'] for i in range(2))
+    assert service._lock(busy) is not service._lock(idle)
+    # a request is in the middle of updating `busy`: the next least recently used goes instead
+    held, done = threading.Event(), threading.Event()
+
+    def request():
+        with service._lock(busy):
+            held.set()
+            done.wait()
+
+    worker = threading.Thread(target=request)
+    worker.start()
+    held.wait()
+    try:
+        store.put("new", LearnerSession("new", Tracker()))
+    finally:
+        done.set()
+        worker.join()
+    assert busy in store._sessions and idle not in store._sessions and store.evictions == 1
+
+def test_new_session_can_evict_one_on_its_stripe():
+    store = InMemorySessionStore(LearnerSession, max_sessions=1)
+    service = LearnerService(store, lock_stripes=1)
+    first = service.start_session("a")['session_id']
+    second = service.start_session("b")['session_id']
+    assert list(store._sessions) == [second] and first not in store and store.evictions == 1
+
+def test_session_restored_while_its_snapshot_is_written(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    store = InMemorySessionStore(LearnerSession, max_sessions=1, spill_dir=str(tmp_path))
+    service = LearnerService(store, log_root=str(tmp_path / "logs"))
+    first = service.start_session("a", save_log=True)['session_id']
+    _answer(service, first)
+    gate = threading.Event()
+    store._writer = ThreadPoolExecutor(max_workers=1)
+    store._writer.submit(gate.wait)  # hold the writer so the spill stays in flight
+    service.start_session("b", save_log=True)
+    assert first in store and store.stats()['spilling'] == 1
+    # the evicted session comes straight back from memory, and its stale snapshot is removed
+    assert service.summary(first)['attempts'] == 1
+    gate.set()
+    store.flush()
+    assert not (tmp_path / f"{first}.json.gz").exists() and store.stats()['spilling'] == 0
+
+def test_restore_and_purge_do_not_hold_the_store_lock(tmp_path, monkeypatch):
+    store = InMemorySessionStore(LearnerSession, max_sessions=1, spill_dir=str(tmp_path), spill_ttl=3600)
+    service = LearnerService(store, log_root=str(tmp_path / "logs"))
+    first = service.start_session("a", save_log=True)['session_id']
+    service.start_session("b", save_log=True)
+    store.flush()
+    free = []
+
+    def lock_is_free():
+        if store._lock.acquire(timeout=1):
+            store._lock.release()
+            free.append(threading.get_ident())
+
+    def read(path):
+        # another thread can use the store while the snapshot is read
+        other = threading.Thread(target=lock_is_free)
+        other.start()
+        other.join()
+        return read_snapshot(path)
+
+    read_snapshot = session_store.read_snapshot
+    monkeypatch.setattr(session_store, 'read_snapshot', read)
+    assert service.summary(first)['user'] == "a" and len(free) == 1
+    # the periodic purge of expired snapshots runs on the store's writer thread
+    purging = []
+    monkeypatch.setattr(store, 'purge_spilled', lambda: purging.append(threading.current_thread().name))
+    store._next_purge = 0.0
+    service.start_session("c")
+    store.flush()
+    assert purging and purging[0].startswith('session-spill')
+
+def test_api_calls_run_off_the_event_loop():
+    service = LearnerService()
+    sid = service.start_session("gil")['session_id']
+    threads = []
+    summary = service.summary
+    service.summary = lambda **args: threads.append(threading.get_ident()) or summary(**args)
+
+    async def run():
+        result = await _call(service, 'summary', {'session_id': sid})
+        return result, threading.get_ident()
+
+    result, loop_thread = asyncio.run(run())
+    assert result['user'] == "gil" and threads and threads[0] != loop_thread
+
+def test_failed_spill_drops_the_session(tmp_path, monkeypatch):
+    def disk_full(path, snapshot):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(session_store, 'write_snapshot', disk_full)
+    store = InMemorySessionStore(LearnerSession, max_sessions=1, spill_dir=str(tmp_path / "spill"))
+    service = LearnerService(store, log_root=str(tmp_path / "logs"))
+    first = service.start_session("a", save_log=True)['session_id']
+    _answer(service, first)
+    second = service.start_session("b", save_log=True)['session_id']
+    store.flush()
+    stats = store.stats()
+    assert stats['spill_errors'] == 1 and stats['drops'] == 1 and stats['spilling'] == 0
+    assert first not in store and stats['bytes'] == store.get(second).memory_bytes()
+    assert not list((tmp_path / "spill").iterdir())
+
+def test_failed_snapshot_write_leaves_no_temp_file(tmp_path):
+    with pytest.raises(TypeError):
+        session_store.write_snapshot(str(tmp_path / "s.json.gz"), {'bad': object()})
+    assert not list(tmp_path.iterdir())
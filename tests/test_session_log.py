@@ -0,0 +1,85 @@
+import os
+
+from src.puzzle_generator import generate_puzzle
+from src import session_log
+from src.session_log import SessionLogWriter, flush_logs, list_segments, read_session_log
+from src.tracker import Tracker
+
+def test_log_roundtrip_with_rotation(tmp_path):
+    log_dir = str(tmp_path / "s1")
+    with SessionLogWriter(log_dir, max_segment_bytes=2048) as log:
+        t = Tracker(log=log)
+        t.start_session("amy")
+        for i in range(60):
+            t.record_attempt(generate_puzzle('medium', seed=i), str(i), i % 3 != 0, 1.5 + i)
+    assert len(list_segments(log_dir)) > 1
+    restored = read_session_log(log_dir)
+    assert restored.user == "amy" and restored.session_start == t.session_start
+    assert list(restored.attempts) == list(t.attempts)
+    assert restored.window_stats(3) == t.window_stats(3)
+
+def test_read_partial_log(tmp_path):
+    log_dir = str(tmp_path / "s2")
+    with SessionLogWriter(log_dir) as log:
+        t = Tracker(log=log)
+        t.start_session("bo")
+        for i in range(5):
+            t.record_attempt(generate_puzzle('easy', seed=i), "1", True, 2.0)
+    segment = list_segments(log_dir)[-1]
+    with open(segment, 'a') as f:
+        f.write('{"type": "attempt", "timest')  # torn write from a crash
+    restored = read_session_log(log_dir)
+    assert len(restored.attempts) == 5
+
+def test_append_racing_close_is_written_or_rejected(tmp_path):
+    import threading
+    for round_ in range(5):
+        log = SessionLogWriter(str(tmp_path / f"r{round_}"))
+        accepted = []
+
+        def writer(k):
+            for i in range(300):
+                try:
+                    log.append({'type': 'attempt', 'k': k, 'i': i})
+                except ValueError:
+                    return
+                accepted.append((k, i))
+
+        threads = [threading.Thread(target=writer, args=(k,)) for k in range(4)]
+        for th in threads:
+            th.start()
+        log.close()
+        for th in threads:
+            th.join()
+        written = []
+        for segment in list_segments(str(tmp_path / f"r{round_}")):
+            with open(segment) as f:
+                written += [(r['k'], r['i']) for r in map(__import__('json').loads, f)]
+        assert sorted(written) == sorted(accepted)
+
+def test_log_without_summary_tail(tmp_path):
+    log_dir = str(tmp_path / "s3")
+    with SessionLogWriter(log_dir) as log:
+        t = Tracker(log=log, tail_size=0)
+        t.start_session("eve")
+        for i in range(3):
+            t.record_attempt(generate_puzzle('easy', seed=i), "0", False, 1.0)
+    assert t.summary_view()['recent'] == []
+    assert list(read_session_log(log_dir).attempts) == list(t.attempts)
+
+def test_logs_share_one_writer_thread_and_release_files(tmp_path):
+    import threading
+    logs = [SessionLogWriter(str(tmp_path / f"s{i}")) for i in range(50)]
+    logs[0].append({'type': 'session', 'user': "u0"})
+    threads = threading.active_count()
+    for i, log in enumerate(logs[1:], 1):
+        log.append({'type': 'session', 'user': f"u{i}"})
+    assert threading.active_count() == threads
+    flush_logs()
+    # idle logs keep no file open until they are written to again
+    assert session_log._thread._open == {}
+    logs[0].append({'type': 'session', 'user': "again"})
+    for log in logs:
+        log.close()
+    assert all(log.records_written == 1 + (log is logs[0]) for log in logs)
+    assert [r['user'] for r in session_log.iter_log_records(str(tmp_path / "s0"))] == ["u0", "again"]
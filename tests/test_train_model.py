@@ -0,0 +1,96 @@
+import numpy as np
+
+from src.train_model import (LEVELS, generate_dataset, label_action_from_window,
+                             make_features_from_window, simulate_sessions, window_features)
+
+def test_window_features_match_reference():
+    rng = np.random.default_rng(0)
+    _, levels, correct, rt = simulate_sessions(200, session_length=12, rng=rng)
+    for window_size in (1, 3, 6):
+        X, y = window_features(correct, rt, levels, window_size)
+        row = 0
+        for s in range(len(levels)):
+            attempts = [{'correct': bool(c), 'response_time': float(r)} for c, r in zip(correct[s], rt[s])]
+            for i in range(window_size, len(attempts) + 1):
+                window = attempts[i - window_size:i]
+                level = LEVELS[levels[s]]
+                assert list(X[row]) == make_features_from_window(window, level)
+                assert y[row] == label_action_from_window(window, level)
+                row += 1
+        assert row == len(X)
+
+def test_generate_dataset_reproducible_across_jobs():
+    X1, y1 = generate_dataset(num_sessions=9000, seed=7, n_jobs=1)
+    X2, y2 = generate_dataset(num_sessions=9000, seed=7, n_jobs=3)
+    assert X1.equals(X2) and y1.equals(y2)
+    assert len(X1) == 9000 * 18
+
+def _replay(seed, n):
+    import random
+    from src.puzzle_generator import generate_puzzle
+    from src.tracker import Tracker
+    r = random.Random(seed)
+    t = Tracker()
+    t.start_session("gus")
+    for i in range(n):
+        level = r.choice(LEVELS)
+        t.record_attempt(generate_puzzle(level, seed=i), "0", r.random() < 0.7, r.uniform(1.0, 25.0))
+    return t
+
+def test_session_windows_match_tracker_features():
+    from src.ml_engine import MLEngine
+    from src.train_model import session_windows
+    t = _replay(3, 15)
+    correct = [row['correct'] for row in t.attempts]
+    rts = [row['response_time'] for row in t.attempts]
+    levels = [LEVELS.index(l) for l in t.difficulty_history()]
+    engine = MLEngine(model_path="missing.pkl")
+    for window_size in (1, 3, 6):
+        X, y = session_windows(correct, rts, levels, window_size)
+        for i in range(len(correct)):
+            prefix = _replay(3, i + 1)
+            expected = engine.features_from_tracker(prefix, LEVELS[levels[i]], window_size)[0]
+            assert list(X[i]) == list(expected)
+            start = max(0, i + 1 - window_size)
+            window = [{'correct': c, 'response_time': r} for c, r in zip(correct[start:i + 1], rts[start:i + 1])]
+            assert y[i] == label_action_from_window(window, LEVELS[levels[i]])
+
+def test_train_incremental_only_reads_new_files(tmp_path):
+    import joblib
+    from src.train_model import train_incremental
+    data = tmp_path / "data"
+    data.mkdir()
+    for s in range(4):
+        _replay(s, 30).to_dataframe().to_csv(data / f"session_u{s}.csv", index=False)
+    kwargs = dict(model_path=str(tmp_path / "m.pkl"), meta_path=str(tmp_path / "meta.pkl"),
+                  checkpoint_path=str(tmp_path / "m.ckpt"), batch_size=50, checkpoint_every=2)
+    first = train_incremental(str(data), **kwargs)
+    assert first['files'] == 4 and first['rows'] == 120 and first['batches'] >= 2
+    assert train_incremental(str(data), **kwargs)['files'] == 0
+    _replay(9, 10).to_dataframe().to_csv(data / "session_new.csv", index=False)
+    third = train_incremental(str(data), **kwargs)
+    assert third['files'] == 1 and third['rows_seen'] == 130
+    model = joblib.load(tmp_path / "m.pkl")
+    assert set(model.predict(np.array([[1.0, 3.0, 3, 0], [0.0, 40.0, 0, 2]]))) <= {-1, 0, 1}
+
+def test_train_incremental_learns_appended_rows_once_and_records_bad_files(tmp_path):
+    import joblib
+    from src.train_model import train_incremental
+    data = tmp_path / "data"
+    data.mkdir()
+    _replay(0, 30).to_dataframe().to_csv(data / "session_u0.csv", index=False)
+    kwargs = dict(model_path=str(tmp_path / "m.pkl"), meta_path=str(tmp_path / "meta.pkl"),
+                  checkpoint_path=str(tmp_path / "m.ckpt"), batch_size=50)
+    assert train_incremental(str(data), **kwargs)['rows_seen'] == 30
+    # the session grew by ten attempts: only their windows are learned
+    _replay(0, 40).to_dataframe().to_csv(data / "session_u0.csv", index=False)
+    (data / "session_bad.csv").write_bytes(b"correct,response_time\n\xff\xfe,1\n")
+    second = train_incremental(str(data), **kwargs)
+    assert second['files'] == 1 and second['rows'] == 10 and second['rows_seen'] == 40
+    assert second['errors'] == 1
+    sources = joblib.load(tmp_path / "m.ckpt")['sources']
+    assert sources['session_u0.csv']['windows'] == 40 and 'UnicodeDecodeError' in sources['session_bad.csv']['error']
+    # neither file is read again until it changes
+    third = train_incremental(str(data), **kwargs)
+    assert third['files'] == third['errors'] == 0 and third['rows_seen'] == 40
+    assert joblib.load(tmp_path / "meta.pkl")['files'] == 1